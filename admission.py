@@ -0,0 +1,208 @@
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, Optional
+
+from cancellation import Cancelled, checkpoint
+
+# Допуск рендеринга: одновременно работают не больше limit рендерингов, ещё queue ждут
+# своей очереди; остальным сразу отвечаем 503 с Retry-After, а не замедляем всех.
+# Одинаковые запросы (тот же документ и ревизия данных) не занимают отдельных мест:
+# они ждут результата уже идущего рендеринга. Ограничение действует на процесс -
+# при uvicorn --workers N общий предел в N раз больше.
+
+SAMPLES = 1000  # сколько последних ожиданий хранится для перцентилей
+WAIT_STEP = 0.5  # ожидающие раз в столько секунд проверяют, не отменён ли их запрос
+RETRIES = 3  # сколько раз ожидавший запускает рендеринг заново, если его отменили вместе с чужим запросом
+
+
+class Overloaded(Exception):
+    """Нет свободного места ни для рендеринга, ни в очереди."""
+
+    def __init__(self, retry_after: int, reason: str):
+        super().__init__(reason)
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+def percentile(values, fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class AdmissionController:
+    def __init__(self, limit: int, queue: int, timeout: float = 30.0):
+        self.limit = limit
+        self.queue = queue
+        self.timeout = timeout  # дольше в очереди не ждём - тоже 503
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.piggybacked = 0
+        self._cond = threading.Condition()
+        self._flights: Dict[str, Future] = {}
+        self._waits = deque(maxlen=SAMPLES)
+        self._renders = deque(maxlen=100)
+
+    def retry_after(self) -> int:
+        """Через сколько секунд очередь, скорее всего, освободится."""
+        render = sum(self._renders) / len(self._renders) if self._renders else 1.0
+        return max(1, math.ceil(render * (self.active + self.waiting) / self.limit))
+
+    def acquire(self) -> None:
+        start = time.perf_counter()
+        with self._cond:
+            if self.active >= self.limit:
+                if self.waiting >= self.queue:
+                    self.rejected += 1
+                    raise Overloaded(self.retry_after(), "render queue is full")
+                self.waiting += 1
+                try:
+                    deadline = start + self.timeout
+                    while self.active >= self.limit:
+                        remaining = deadline - time.perf_counter()
+                        if remaining <= 0:
+                            self.timed_out += 1
+                            raise Overloaded(self.retry_after(), "timed out in render queue")
+                        self._cond.wait(min(remaining, WAIT_STEP))
+                        checkpoint('queue')
+                finally:
+                    self.waiting -= 1
+            self.active += 1
+            self.admitted += 1
+            self._waits.append(time.perf_counter() - start)
+
+    def release(self, seconds: float) -> None:
+        with self._cond:
+            self.active -= 1
+            self._renders.append(seconds)
+            self._cond.notify()
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - start)
+
+    def run(self, key: str, func: Callable):
+        """func() в отдельном месте; одновременные вызовы с тем же key получают тот же результат
+        (или то же исключение) без своего рендеринга. Если рендеринг отменён вместе с запросом,
+        который его начал, ожидавшие запускают его заново - не больше RETRIES раз, потом 503."""
+        for _ in range(RETRIES + 1):
+            with self._cond:
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = Future()
+                else:
+                    self.piggybacked += 1
+            if leader:
+                return self._lead(key, flight, func)
+            try:
+                return self._follow(flight)
+            except _LeaderCancelled:
+                continue
+        raise Overloaded(self.retry_after(), "render was cancelled with other requests")
+
+    def _lead(self, key: str, flight: Future, func: Callable):
+        try:
+            with self.slot():
+                result = func()
+        except BaseException as e:
+            self._land(key)
+            flight.set_exception(e)
+            raise
+        self._land(key)
+        flight.set_result(result)
+        return result
+
+    def _land(self, key: str) -> None:
+        # ключ убирается до того, как ожидавшие проснутся: повторяя рендеринг, они не найдут
+        # завершённый рейс и не получат его исключение снова
+        with self._cond:
+            del self._flights[key]
+
+    @staticmethod
+    def _follow(flight: Future):
+        """Результат рендеринга ведущего; своя отмена - Cancelled, отмена ведущего - _LeaderCancelled."""
+        while True:
+            try:
+                return flight.result(WAIT_STEP)
+            except TimeoutError:
+                checkpoint('queue')
+            except Cancelled:
+                raise _LeaderCancelled from None
+
+    def stream(self, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """Место занимается сразу (503 - до начала ответа) и освобождается, когда поток
+        дочитан, закрыт или брошен."""
+        self.acquire()
+        return _StreamSlot(self, chunks)
+
+    def metrics(self) -> dict:
+        with self._cond:
+            waits = list(self._waits)
+            renders = list(self._renders)
+            return {
+                "limit": self.limit,
+                "queue_limit": self.queue,
+                "active": self.active,
+                "queue_depth": self.waiting,
+                "in_flight_keys": len(self._flights),
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "piggybacked": self.piggybacked,
+                "wait_seconds": {
+                    "count": len(waits),
+                    "mean": sum(waits) / len(waits) if waits else None,
+                    "p50": percentile(waits, 0.5),
+                    "p95": percentile(waits, 0.95),
+                    "max": max(waits, default=None),
+                },
+                "render_seconds_mean": sum(renders) / len(renders) if renders else None,
+            }
+
+
+class _LeaderCancelled(Exception):
+    """Рендеринг, которого ждали, отменён вместе с запросом ведущего."""
+
+
+class _StreamSlot:
+    """Итератор потока ответа, удерживающий место рендеринга до конца потока."""
+
+    def __init__(self, controller: AdmissionController, chunks: Iterable[bytes]):
+        self.controller = controller
+        self.chunks = iter(chunks)
+        self.start = time.perf_counter()
+        self.released = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> bytes:
+        try:
+            return next(self.chunks)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self) -> None:
+        if not self.released:
+            self.released = True
+            close = getattr(self.chunks, 'close', None)
+            if close is not None:
+                close()
+            self.controller.release(time.perf_counter() - self.start)
+
+    __del__ = close
@@ -0,0 +1,1142 @@
+import argparse
+import csv
+import datetime
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import random
+import re
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import threading
+import tracemalloc
+import zipfile
+import zlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+
+from docx.enum.style import WD_STYLE_TYPE
+from docx.shared import Pt
+
+import main
+import docx_stream
+import docx_zip
+import pdf_export
+import validation
+from sheet_data import column_letter, data_revision
+from sheet_store import SheetStore
+from participant_index import ParticipantIndex
+from shared_cache import SharedCache
+import mail_merge
+import session_assignment
+import doc_templates
+import proceedings
+from admission import AdmissionController, Overloaded
+import cancellation
+import tracing
+import memdiag
+import watch
+import main_old
+import file_source
+from file_source import iter_file_sheet, load_file_sheet
+import preview
+import ordering
+from output_store import OutputStore
+
+# Замеры производительности генераторов на синтетических данных.
+# Запуск: python bench.py <замер> [--rows N] [--sessions N]
+
+
+def make_student_data(rows, sessions, seed=0):
+    rnd = random.Random(seed)
+    surnames = ['Иванов', 'Петров', 'Сидоров', 'Кузнецов', 'Смирнов', 'Попов', 'Волков', 'Соколов']
+    names = ['Алексей', 'Борис', 'Виктор', 'Григорий', 'Дмитрий', 'Евгений']
+    patronymics = ['Андреевич', 'Сергеевич', 'Павлович', 'Игоревич']
+    data = []
+    for i in range(rows):
+        row = [''] * 19
+        row[7] = f'{rnd.choice(surnames)}{i}'
+        row[8] = rnd.choice(names)
+        row[9] = rnd.choice(patronymics)
+        row[11] = f'4{rnd.randint(1, 4)}{rnd.randint(10, 99)}' if rnd.random() > 0.1 else ''
+        row[12] = rnd.choice(['студент', 'магистр'])
+        row[13] = f'Разработка системы № {i} для обработки данных & анализа <моделей>'
+        row[15] = str(i % sessions + 1)
+        row[16] = rnd.choice(['0', '1', '2'])
+        data.append(row)
+    return data
+
+
+def make_tech_data(sessions):
+    head = ['43', 'Компьютерных технологий и программной инженерии', 'Охотников Владимир Викторович',
+            'доцент', 'unids@guap.ru', '+7 812 000-00-00', 'Петров Пётр Петрович', 'ст. преподаватель',
+            '', '', '']
+    return [head + [f'2025-04-{k % 28 + 1:02d}', '10:00', f'52-{k:02d}'] for k in range(sessions)]
+
+
+def timed(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+@contextmanager
+def report_dir():
+    """Временный рабочий каталог с report/, куда пишут генераторы из main.py."""
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        os.makedirs('report')
+        try:
+            yield tmp
+        finally:
+            os.chdir(cwd)
+
+
+def bench_stream(args):
+    """python-docx против потокового писателя: время (совпадение document.xml - tests/test_docx_stream.py)."""
+    student_data = make_student_data(args.rows, args.sessions)
+    tech_data = make_tech_data(args.sessions)
+    cases = [
+        ('программа', main.generate_conference_program, partial(doc_templates.iter_document, 'programme')),
+        ('отчёт', main.generate_conference_report, partial(doc_templates.iter_document, 'report')),
+        ('список', main.generate_conference_list, partial(doc_templates.iter_document, 'publications')),
+    ]
+    with report_dir():
+        for title, generate, iter_body in cases:
+            old = timed(lambda: generate(student_data, tech_data), args.repeat)
+            new = timed(lambda: docx_stream.write_docx(iter_body(student_data, tech_data), 'stream.docx'),
+                        args.repeat)
+            print(f"{title:10} python-docx {old * 1000:9.1f} мс  поток {new * 1000:9.1f} мс  x{old / new:5.1f}")
+
+
+def measure_chunks(make_chunks):
+    """Время до первого куска, полное время и пиковая память (tracemalloc)."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    first = None
+    total = 0
+    for chunk in make_chunks():
+        if first is None:
+            first = time.perf_counter() - start
+        total += len(chunk)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return first, elapsed, peak, total
+
+
+def bench_chunked(args):
+    """Отчёт целиком в памяти против потоковой отдачи кусками: TTFB и пиковая память."""
+    student_data = make_student_data(args.rows, args.sessions)
+    tech_data = make_tech_data(args.sessions)
+    docx_stream.render_docx([])  # шаблон строится один раз и в замер не входит
+
+    def whole():
+        main.generate_conference_report(student_data, tech_data)
+        with open('report/2 Отчёт о конференции.docx', 'rb') as f:
+            yield f.read()
+
+    cases = [
+        ('python-docx', whole),
+        ('поток, целиком', lambda: [docx_stream.render_docx(doc_templates.iter_document('report', student_data, tech_data))]),
+        ('поток, кусками', lambda: docx_stream.iter_docx(doc_templates.iter_document('report', student_data, tech_data))),
+    ]
+    with report_dir():
+        for title, make_chunks in cases:
+            first, elapsed, peak, total = measure_chunks(make_chunks)
+            print(f"{title:16} первый байт {first * 1000:9.1f} мс  всего {elapsed * 1000:9.1f} мс  "
+                  f"пик памяти {peak / 2 ** 20:7.1f} МБ  размер {total / 2 ** 10:8.1f} КБ")
+
+
+def bench_pdf(args):
+    """Пакет секций в PDF: soffice на каждый файл против пула долгоживущих конвертеров."""
+    if shutil.which(pdf_export.SOFFICE) is None:
+        print(f"{pdf_export.SOFFICE} не найден, замер PDF пропущен")
+        return
+    with report_dir():
+        files = []
+        for section in range(args.sections):
+            student_data = make_student_data(args.rows // args.sections or 1, 5, seed=section)
+            path = f'report/section_{section}.docx'
+            docx_stream.write_docx(doc_templates.iter_document('programme', student_data, make_tech_data(5)), path)
+            files.append(path)
+
+        start = time.perf_counter()
+        for path in files:
+            subprocess.run([pdf_export.SOFFICE, '--headless', '--convert-to', 'pdf', '--outdir', 'report', path],
+                           check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        elapsed = time.perf_counter() - start
+        print(f"soffice на файл  {len(files) / elapsed:7.2f} файл/с  ({elapsed:.1f} с)")
+
+        for size in (1, 2, 4):
+            with pdf_export.PdfConverterPool(size=size, recycle_after=args.recycle) as pool:
+                pool.convert(files[0])  # запуск офисов в замер не входит
+                start = time.perf_counter()
+                for future in [pool.submit(path) for path in files]:
+                    future.result()
+                elapsed = time.perf_counter() - start
+            print(f"пул x{size}          {len(files) / elapsed:7.2f} файл/с  ({elapsed:.1f} с, перезапусков {pool.restarts})")
+
+
+def bench_combined(args):
+    """Сводная программа на args.sections секций: последовательно и в рабочих процессах."""
+    sections = [(make_student_data(args.rows, args.sessions, seed=i), make_tech_data(args.sessions))
+                for i in range(args.sections)]
+    for workers in (1, 2, 4, os.cpu_count()):
+        first, elapsed, peak, total = measure_chunks(
+            lambda: docx_stream.iter_docx(docx_stream.iter_combined_program(sections, workers)))
+        print(f"процессов {workers:2}  {elapsed * 1000:9.1f} мс  первый байт {first * 1000:8.1f} мс  "
+              f"пик памяти {peak / 2 ** 20:6.1f} МБ  размер {total / 2 ** 10:8.1f} КБ")
+
+
+def bench_validate(args):
+    """Проверка данных: без кэша, с подсчётом ревизии и с известной ревизией."""
+    student_data = make_student_data(args.rows, args.sessions)
+    tech_data = make_tech_data(args.sessions)
+    revision = data_revision(student_data, tech_data)
+    for document in validation.DOCUMENTS:
+        cold = timed(lambda: validation.validate_data(student_data, tech_data, document), args.repeat)
+        hashed = timed(lambda: validation.validate_cached(student_data, tech_data, document), args.repeat)
+        cached = timed(lambda: validation.validate_cached(student_data, tech_data, document, revision), args.repeat)
+        print(f"{document:13} проход {cold * 1000:8.2f} мс  с ревизией {hashed * 1000:8.2f} мс  "
+              f"кэш {cached * 1000:8.4f} мс")
+
+
+def bench_sync(args):
+    """SQLite-зеркало: полная перезагрузка против синхронизации изменений (1% строк)."""
+    student_data = make_student_data(args.rows, args.sessions)
+    rnd = random.Random(1)
+    with report_dir() as tmp:
+        def full_reload():
+            path = os.path.join(tmp, 'full.sqlite')
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+            SheetStore(path).sync('bench', 'Sheet1', student_data)
+
+        store = SheetStore(os.path.join(tmp, 'delta.sqlite'))
+        store.sync('bench', 'Sheet1', student_data)
+        stats = []
+
+        def delta():
+            for row in rnd.sample(student_data, max(1, args.rows // 100)):
+                row[16] = rnd.choice(['0', '1', '2', ''])
+            stats.append(store.sync('bench', 'Sheet1', student_data))
+
+        full = timed(full_reload, args.repeat)
+        changed = timed(delta, args.repeat)
+        query = timed(lambda: store.sessions('bench', 'Sheet1'), args.repeat)
+        print(f"полная загрузка {full * 1000:9.1f} мс")
+        print(f"изменения       {changed * 1000:9.1f} мс  (изменено строк {stats[-1].updated})")
+        print(f"выборка по заседаниям {query * 1000:9.1f} мс")
+
+
+def bench_search(args):
+    """Поиск участников: построение индекса и время запросов."""
+    student_data = make_student_data(args.rows, args.sessions)
+    start = time.perf_counter()
+    index = ParticipantIndex(student_data)
+    print(f"построение индекса {(time.perf_counter() - start) * 1000:9.1f} мс")
+    queries = [
+        {'prefix': 'Иванов1'},
+        {'prefix': 'петр', 'limit': 10},
+        {'session': '3'},
+        {'session': '3', 'decision': '2'},
+        {'group': '4215', 'status': 'магистр'},
+        {'prefix': 'Сидоров', 'decision': '1', 'offset': 100},
+    ]
+    for query in queries:
+        elapsed = timed(lambda: index.search(**query), args.repeat * 10)
+        print(f"{str(query):55} {elapsed * 1000:8.3f} мс  найдено {index.search(**query)['total']}")
+
+
+DOCUMENT_BODIES = {name: partial(doc_templates.iter_document, name) for name in ('programme', 'report', 'publications')}
+
+
+def _cache_worker(job):
+    """Один «воркер»: requests запросов документов, загрузка листа имитируется задержкой."""
+    cache_path, rows, sessions, requests, fetch_delay = job
+    cache = SharedCache(cache_path) if cache_path else None
+    fetches = renders = 0
+
+    def fetch():
+        nonlocal fetches
+        fetches += 1
+        time.sleep(fetch_delay)
+        return json.dumps([make_student_data(rows, sessions), make_tech_data(sessions)]).encode('utf-8')
+
+    for i in range(requests):
+        kind = sorted(DOCUMENT_BODIES)[i % len(DOCUMENT_BODIES)]
+        raw = cache.get_or_create('sheet', fetch, 60) if cache else fetch()
+        student_data, tech_data = json.loads(raw)
+
+        def render():
+            nonlocal renders
+            renders += 1
+            return docx_stream.render_docx(DOCUMENT_BODIES[kind](student_data, tech_data))
+
+        if cache:
+            cache.get_or_create(f'docx:{kind}:{data_revision(student_data, tech_data)}', render)
+        else:
+            render()
+    return fetches, renders
+
+
+def bench_shared_cache(args):
+    """Несколько процессов-воркеров с общим кэшем и без него."""
+    with report_dir() as tmp:
+        for workers in (4, 8):
+            for cached in (False, True):
+                cache_path = os.path.join(tmp, f'cache-{workers}.sqlite') if cached else None
+                jobs = [(cache_path, args.rows, args.sessions, args.repeat * 3, 0.2)] * workers
+                start = time.perf_counter()
+                with multiprocessing.Pool(workers) as pool:
+                    results = pool.map(_cache_worker, jobs)
+                elapsed = time.perf_counter() - start
+                fetches = sum(fetched for fetched, _ in results)
+                renders = sum(rendered for _, rendered in results)
+                print(f"воркеров {workers}  {'общий кэш' if cached else 'без кэша ':9}  {elapsed * 1000:9.1f} мс  "
+                      f"загрузок листа {fetches:3}  рендерингов {renders:3}  запросов {len(jobs) * args.repeat * 3}")
+
+
+def bench_mail_merge(args):
+    """Сертификаты на каждого участника: документов в секунду при разном числе процессов."""
+    student_data = make_student_data(args.rows, args.sessions)
+    tech_data = make_tech_data(args.sessions)
+    template = mail_merge.builtin_template('certificate')
+    for workers in sorted({1, 2, 4, os.cpu_count()}):
+        first, elapsed, peak, total = measure_chunks(
+            lambda: mail_merge.iter_merge_zip(student_data, tech_data, template, 'сертификат', workers=workers))
+        print(f"процессов {workers:2}  {args.rows / elapsed:8.1f} док/с  первый байт {first * 1000:8.1f} мс  "
+              f"пик памяти {peak / 2 ** 20:6.1f} МБ  размер {total / 2 ** 20:8.1f} МБ")
+
+
+def bench_assign(args):
+    """Распределение по заседаниям: 90% участников без номера заседания."""
+    student_data = make_student_data(args.rows, args.sessions)
+    tech_data = make_tech_data(args.sessions)
+    rnd = random.Random(2)
+    for row in student_data:
+        if rnd.random() < 0.9:
+            row[15] = ''
+    elapsed = timed(lambda: session_assignment.assign_sessions(student_data, tech_data), args.repeat)
+    assignment = session_assignment.assign_sessions(student_data, tech_data)
+    print(f"распределение {elapsed * 1000:9.1f} мс  назначено {len(assignment.sessions)}")
+    print(session_assignment.format_assignment(assignment))
+    preview = session_assignment.apply_assignment(student_data, assignment)
+    print(f"проблем в данных для программы: {len(validation.validate_data(preview, tech_data, 'programme'))}")
+
+
+def bench_templates(args):
+    """Скомпилированные шаблоны templates/ против генераторов python-docx
+    (совпадение разметки - tests/test_doc_templates.py)."""
+    student_data = make_student_data(args.rows, args.sessions)
+    tech_data = make_tech_data(args.sessions)
+    cases = [
+        ('programme', main.generate_conference_program),
+        ('report', main.generate_conference_report),
+        ('publications', main.generate_conference_list),
+    ]
+    docx_stream._template()  # шаблон пакета строится один раз на процесс и в компиляцию не входит
+    with report_dir():
+        for name, generate in cases:
+            start = time.perf_counter()
+            with open(doc_templates.template_path(name), encoding='utf-8') as f:
+                doc_templates.Plan(json.load(f))
+            compiled = time.perf_counter() - start
+            old = timed(lambda: generate(student_data, tech_data), args.repeat)
+            plan = timed(lambda: ''.join(doc_templates.iter_document(name, student_data, tech_data)), args.repeat)
+            print(f"{name:13} python-docx {old * 1000:8.1f} мс  "
+                  f"шаблон {plan * 1000:7.1f} мс (компиляция {compiled * 1000:5.2f} мс)")
+
+
+def bench_parallel(args):
+    """Отчёт с заседаниями, отрендеренными параллельно: масштабирование по числу процессов."""
+    student_data = make_student_data(args.rows, args.sessions)
+    tech_data = make_tech_data(args.sessions)
+    serial = ''.join(doc_templates.iter_document('report', student_data, tech_data))
+    iter_body = lambda workers: doc_templates.iter_document('report', student_data, tech_data, workers=workers)
+    for workers in sorted({1, 2, 4, os.cpu_count()}):
+        elapsed = timed(lambda: ''.join(iter_body(workers)), args.repeat)
+        same = ''.join(iter_body(workers)) == serial
+        print(f"процессов {workers:2}  {elapsed * 1000:9.1f} мс  "
+              f"{'совпадает с последовательным' if same else 'ОТЛИЧАЕТСЯ'}")
+
+
+WARMUP_SCRIPT = """
+import sys, time, json
+start = time.perf_counter()
+sys.path.insert(0, {root!r})
+import bench, v4
+from fastapi.testclient import TestClient
+from googleapiclient.discovery import build
+imported = time.perf_counter()
+
+student_data = bench.make_student_data({rows}, {sessions})
+tech_data = bench.make_tech_data({sessions})
+
+def fetch(s_id, s_range):
+    v4.sheets_service()
+    time.sleep({fetch_delay})  # сетевой запрос к Sheets
+    return student_data if s_range == v4.STUD_RANGE else tech_data
+
+# Без service.json клиент строится по ключу API: discovery тот же, что и в работе
+v4._credentials = object()
+v4.build = lambda *args, **kwargs: build('sheets', 'v4', developerKey='bench')
+v4.load_google_sheet = fetch
+with TestClient(v4.app) as client:
+    while client.get('/health/ready').status_code != 200:
+        time.sleep(0.01)
+    ready = time.perf_counter()
+    client.get('/conferences/report?engine=stream')
+    first = time.perf_counter() - ready
+print(json.dumps({{'import': imported - start, 'ready': ready - start, 'first': first}}))
+"""
+
+
+def bench_warmup(args):
+    """От запуска процесса до готовности и первый запрос: с прогревом и без."""
+    root = os.path.dirname(os.path.abspath(__file__))
+    script = WARMUP_SCRIPT.format(root=root, rows=args.rows, sessions=args.sessions, fetch_delay=0.3)
+    with report_dir() as tmp:
+        for warm in ('1', '0'):
+            env = dict(os.environ, WARMUP=warm, SHEET_STORE=os.path.join(tmp, f'sheets-{warm}.sqlite'),
+                       SHARED_CACHE=os.path.join(tmp, f'cache-{warm}.sqlite'))
+            output = subprocess.run([sys.executable, '-c', script], env=env, capture_output=True, text=True,
+                                    check=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{'с прогревом ' if warm == '1' else 'без прогрева'}  импорт {result['import'] * 1000:7.1f} мс  "
+                  f"до готовности {result['ready'] * 1000:7.1f} мс  первый запрос {result['first'] * 1000:7.1f} мс")
+
+
+def bench_save(args):
+    """doc.save против save_docx (сжатые заранее части) и потокового писателя: время, CPU, размер."""
+    student_data = make_student_data(args.rows, args.sessions)
+    tech_data = make_tech_data(args.sessions)
+    with report_dir():
+        path = main.generate_conference_report(student_data, tech_data)
+        doc = main.docx.Document(path)
+        body = list(doc_templates.iter_document('report', student_data, tech_data))  # только запись, без рендеринга
+
+        def measure(save):
+            wall = cpu = 0.0
+            for _ in range(args.repeat):
+                buf = io.BytesIO()
+                start, start_cpu = time.perf_counter(), time.process_time()
+                save(buf)
+                wall += time.perf_counter() - start
+                cpu += time.process_time() - start_cpu
+            return wall / args.repeat, cpu / args.repeat, len(buf.getvalue())
+
+        cases = [('doc.save', doc.save)]
+        for level in (docx_zip.DEFAULT_LEVEL, 1, None):
+            cases.append((f"save_docx {level if level is not None else 'stored'}",
+                          lambda buf, level=level: docx_zip.save_docx(doc, buf, level)))
+            cases.append((f"docx_stream {level if level is not None else 'stored'}",
+                          lambda buf, level=level: docx_stream.write_docx(body, buf, level)))
+        for title, save in cases:
+            wall, cpu, size = measure(save)
+            print(f"{title:18} {wall * 1000:8.1f} мс  CPU {cpu * 1000:8.1f} мс  {size / 2 ** 10:8.1f} КБ")
+
+
+def _png(width, height):
+    """Небольшая PNG-картинка для синтетических докладов."""
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+    raw = b''.join(b'\x00' + bytes((x * 7 + y * 3) % 256 for x in range(width * 3)) for y in range(height))
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(raw)) + chunk(b'IEND', b''))
+
+
+def make_submission():
+    """Тезисы доклада, как их присылают: свой стиль, нумерованный список, таблица и рисунок."""
+    doc = main.docx.Document()
+    style = doc.styles.add_style('Текст тезисов', WD_STYLE_TYPE.PARAGRAPH)
+    style.base_style = doc.styles['Normal']
+    style.font.size = Pt(12)
+    doc.add_heading('ЗАГОЛОВОК', level=1)
+    for k in range(6):
+        doc.add_paragraph(f'ТЕКСТ абзац {k}: ' + 'Разработка и анализ моделей обработки данных. ' * 8,
+                          style='Текст тезисов')
+    for k in range(4):
+        doc.add_paragraph(f'Пункт списка {k}', style='List Number')
+    table = doc.add_table(rows=3, cols=3)
+    table.style = 'Table Grid'
+    for cell in table._cells:
+        cell.text = 'ТЕКСТ'
+    doc.add_picture(io.BytesIO(_png(64, 48)))
+    doc.add_paragraph('Список литературы', style='Heading 2')
+    buf = io.BytesIO()
+    doc.save(buf)
+    return buf.getvalue()
+
+
+def write_submissions(directory, student_data, missing_every=50):
+    """Файлы докладов "<строка> <Фамилия>.docx"; каждого missing_every-го нет, вместо первого из них - испорченный."""
+    with zipfile.ZipFile(io.BytesIO(make_submission())) as zf:
+        parts = [(name, zf.read(name)) for name in zf.namelist()]
+    written = 0
+    for position, row in enumerate(student_data):
+        if position % missing_every == missing_every - 1:
+            continue
+        path = os.path.join(directory, f"{position + proceedings.FIRST_ROW:05d} {row[7]}.docx")
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for name, data in parts:
+                if name == docx_stream.DOCUMENT_PART:
+                    data = data.replace('ТЕКСТ'.encode('utf-8'), docx_stream.escape(f'{row[7]} {row[13]}').encode('utf-8'))
+                    data = data.replace('ЗАГОЛОВОК'.encode('utf-8'), docx_stream.escape(row[13]).encode('utf-8'))
+                zf.writestr(name, data)
+        written += 1
+    with open(os.path.join(directory, f"{missing_every - 1 + proceedings.FIRST_ROW:05d} испорчен.docx"), 'wb') as f:
+        f.write(b'not a zip')
+    return written
+
+
+def check_volume(path):
+    """Том открывается python-docx, номера списков и связи рисунков не висят в воздухе."""
+    with zipfile.ZipFile(path) as zf:
+        assert zf.testzip() is None
+        document = zf.read(docx_stream.DOCUMENT_PART).decode('utf-8')
+        numbering = zf.read(proceedings.NUMBERING_PART).decode('utf-8')
+        rels = zf.read(proceedings.RELS_PART).decode('utf-8')
+        names = set(zf.namelist())
+    num_ids = re.findall(r'<w:num w:numId="(\d+)"', numbering)
+    assert len(num_ids) == len(set(num_ids)), 'повторяющиеся numId'
+    assert set(re.findall(r'<w:numId w:val="(\d+)"', document)) <= set(num_ids) | {'0'}, 'numId без определения'
+    targets = dict(re.findall(r'Id="([^"]+)"[^>]*Target="([^"]+)"', rels))
+    embeds = re.findall(r'r:embed="([^"]+)"', document)
+    assert all(rel_id in targets and f"word/{targets[rel_id]}" in names for rel_id in embeds), 'рисунок без связи'
+    doc = main.docx.Document(path)
+    return len(doc.paragraphs), len(doc.tables), len(embeds)
+
+
+def bench_proceedings(args):
+    """Сборник из --papers присланных .docx: время, пик памяти основного процесса, проверка тома."""
+    student_data = make_student_data(args.papers, args.sessions)
+    tech_data = make_tech_data(args.sessions)
+    for row in student_data:
+        row[16] = '1'
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        files = write_submissions(directory, student_data)
+        print(f"файлов докладов {files}, подготовка {time.perf_counter() - start:.1f} с")
+        proceedings._volume_parts()  # шаблон тома строится один раз на процесс
+        for workers in sorted({1, 2, os.cpu_count()}):
+            path = os.path.join(directory, f'volume-{workers}.out')
+            start = time.perf_counter()
+            volume = proceedings.write_proceedings(student_data, tech_data, directory, path, workers=workers)
+            elapsed = time.perf_counter() - start
+            # память - отдельным прогоном: tracemalloc сильно замедляет разбор
+            tracemalloc.start()
+            proceedings.write_proceedings(student_data, tech_data, directory, path, workers=workers)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"процессов {workers:2}  {elapsed:6.1f} с  {len(volume.included) / elapsed:7.1f} файл/с  "
+                  f"пик памяти {peak / 2 ** 20:6.1f} МБ  размер {os.path.getsize(path) / 2 ** 20:6.1f} МБ")
+        print(proceedings.format_volume(volume))
+        paragraphs, tables, pictures = check_volume(path)
+        print(f"том открывается: абзацев {paragraphs}, таблиц {tables}, рисунков {pictures}")
+
+
+def bench_admission(args):
+    """Всплеск из --clients одновременных запросов на --documents разных документов:
+    без ограничения и через AdmissionController (--limit рендерингов, --queue в очереди)."""
+    student_data = make_student_data(args.rows, args.sessions)
+    tech_data = make_tech_data(args.sessions)
+    render = lambda: docx_stream.render_docx(doc_templates.iter_document('report', student_data, tech_data))
+    render()
+
+    def burst(request):
+        latencies, codes = [], []
+        barrier = threading.Barrier(args.clients)
+
+        def client(number):
+            barrier.wait()
+            start = time.perf_counter()
+            try:
+                request(f"report:{number % args.documents}")
+                codes.append(200)
+            except Overloaded:
+                codes.append(503)
+            latencies.append(time.perf_counter() - start)
+
+        threads = [threading.Thread(target=client, args=(number,)) for number in range(args.clients)]
+        tracemalloc.start()
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        ok = sorted(latency for latency, code in zip(latencies, codes) if code == 200)
+        print(f"  всего {elapsed:6.2f} с  200: {codes.count(200):3}  503: {codes.count(503):3}  "
+              f"задержка p50 {ok[len(ok) // 2] * 1000 if ok else 0:8.1f} мс  "
+              f"max {ok[-1] * 1000 if ok else 0:8.1f} мс  пик памяти {peak / 2 ** 20:6.1f} МБ")
+
+    print(f"без ограничения ({args.clients} рендерингов одновременно):")
+    burst(lambda key: render())
+    controller = AdmissionController(args.limit, args.queue)
+    print(f"допуск: limit {args.limit}, queue {args.queue}:")
+    burst(lambda key: controller.run(key, render))
+    metrics = controller.metrics()
+    print(f"  допущено {metrics['admitted']}, присоединились к идущему рендерингу {metrics['piggybacked']}, "
+          f"отклонено {metrics['rejected']}, ожидание p95 {(metrics['wait_seconds']['p95'] or 0) * 1000:.1f} мс")
+
+
+def bench_cancel(args):
+    """Отмена рендеринга: клиент уходит через 10% времени полного рендеринга отчёта."""
+    student_data = make_student_data(args.rows, args.sessions)
+    tech_data = make_tech_data(args.sessions)
+    with report_dir():
+        for name, render in [
+            ('python-docx', lambda: main.generate_conference_report(student_data, tech_data)),
+            ('шаблон', lambda: docx_stream.render_docx(doc_templates.iter_document('report', student_data, tech_data))),
+        ]:
+            full = timed(render, 1)
+            token = cancellation.CancelToken()
+            timer = threading.Timer(full / 10, token.cancel, args=(cancellation.DISCONNECT,))
+            reset = cancellation.current.set(token)
+            timer.start()
+            start = time.perf_counter()
+            try:
+                render()
+                outcome = 'не отменён'
+            except cancellation.Cancelled as e:
+                outcome = f"отменён ({e.stage}, готово {token.done} из {token.total})"
+            finally:
+                cancellation.current.reset(reset)
+            print(f"{name:12} полный {full * 1000:8.1f} мс  до остановки {(time.perf_counter() - start) * 1000:8.1f} мс  "
+                  f"{outcome}")
+
+
+def read_spans(path):
+    return [span for line in open(path, encoding='utf-8') for resource in json.loads(line)['resourceSpans']
+            for scope in resource['scopeSpans'] for span in scope['spans']]
+
+
+def bench_tracing(args):
+    """Накладные расходы трассировки: выключена, запись 0% трасс, запись всех трасс; проверка экспорта."""
+    student_data = make_student_data(args.rows, args.sessions)
+    tech_data = make_tech_data(args.sessions)
+    with report_dir():
+        renders = [
+            ('python-docx', lambda: main.generate_conference_report(student_data, tech_data)),
+            ('шаблон', lambda: docx_stream.render_docx(doc_templates.iter_document('report', student_data, tech_data))),
+        ]
+        for mode, path, sample in [('выключена', None, 0.0), ('sample 0', 'report/traces.jsonl', 0.0),
+                                   ('sample 1', 'report/traces.jsonl', 1.0)]:
+            tracing.tracer.configure(path, sample)
+            for name, render in renders:
+                def traced():
+                    with tracing.span('bench', render=name):
+                        render()
+                print(f"{mode:10} {name:12} {timed(traced, args.repeat) * 1000:8.1f} мс")
+        tracing.tracer.flush()
+        spans = read_spans('report/traces.jsonl')
+        ids = {span['spanId'] for span in spans}
+        orphans = sum(1 for span in spans if span.get('parentSpanId') and span['parentSpanId'] not in ids)
+        names = {}
+        for span in spans:
+            names[span['name']] = names.get(span['name'], 0) + 1
+        print(f"экспортировано {len(spans)} span, без родителя {orphans}: {names}")
+        assert orphans == 0
+        assert names.get('render.session') == args.repeat * args.sessions  # заседания - в генераторе python-docx
+        tracing.tracer.configure(None)
+
+
+SOAK_ENDPOINTS = ('/conferences/programme', '/conferences/report', '/conferences/publications')
+
+
+def run_soak(client, rss, release, objects, args):
+    """Раунд - каждый документ args.concurrency раз одновременно, затем release() (gc и malloc_trim).
+    Проверяется удерживаемая память - RSS после release: без неё RSS скачет на десятки МБ от того,
+    сколько свободной памяти malloc держит в аренах потоков, а это не утечка. Удерживаемая память
+    после прогрева (первая пятая часть раундов) не должна вырасти больше чем на args.tolerance МБ."""
+    warm = max(1, args.rounds // 5)
+    statuses = Counter()
+    samples = []
+    peak = 0
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        for number in range(1, args.rounds + 1):
+            statuses.update(pool.map(lambda url: client.get(url).status_code, SOAK_ENDPOINTS * args.concurrency))
+            peak = max(peak, rss())
+            samples.append(release())
+            if number == warm:
+                objects_before = objects()
+            if number % max(1, args.rounds // 10) == 0:
+                print(f"раунд {number:5}  RSS {peak / 2 ** 20:8.1f} МБ  после release {samples[-1] / 2 ** 20:8.1f} МБ")
+    objects_after = objects()
+    tail = max(1, len(samples) // 10)
+    baseline = sorted(samples[warm - 1:warm - 1 + tail])[tail // 2]
+    final = sorted(samples[-tail:])[tail // 2]
+    growth = (final - baseline) / 2 ** 20
+    print(f"ответы {dict(statuses)}; наибольший RSS {peak / 2 ** 20:.1f} МБ; удерживается после прогрева "
+          f"{baseline / 2 ** 20:.1f} МБ, в конце {final / 2 ** 20:.1f} МБ ({growth:+.1f} МБ); "
+          f"объекты docx/lxml {objects_before} -> {objects_after}")
+    assert set(statuses) == {200}, statuses
+    assert growth <= args.tolerance, f"удерживаемая память выросла на {growth:.1f} МБ"
+
+
+def bench_soak(args):
+    """Долгий прогон программы, отчёта и списка публикаций через API: удерживаемая память не должна расти.
+    С --url - против запущенного сервера (RSS, release и объекты через /admin/memory, токен - ADMIN_TOKEN),
+    иначе - в этом процессе на синтетических данных, без кэшей листов и документов."""
+    if args.url:
+        import httpx
+
+        client = httpx.Client(base_url=args.url, timeout=600,
+                              headers={'X-Admin-Token': os.environ.get('ADMIN_TOKEN', '')})
+
+        def admin(path, method='GET'):
+            response = client.request(method, path)
+            response.raise_for_status()
+            return response.json()
+
+        return run_soak(client, lambda: admin('/admin/memory')['rss_bytes'],
+                        lambda: admin('/admin/memory/release', 'POST')['rss_after'],
+                        lambda: admin('/admin/memory/objects')['total'], args)
+    student_data = make_student_data(args.rows, args.sessions)
+    tech_data = make_tech_data(args.sessions)
+    os.environ.update(DATA_TTL='0.001', DOCUMENT_TTL='0.001', WARMUP='0', TRACE_FILE='')
+    with report_dir():
+        import v4
+        from fastapi.testclient import TestClient
+
+        v4.load_google_sheet = lambda s_id, s_range: student_data if s_range == v4.STUD_RANGE else tech_data
+        with TestClient(v4.app) as client:
+            run_soak(client, memdiag.rss_bytes, lambda: memdiag.release()['rss_after'],
+                     lambda: memdiag.object_counts()['total'], args)
+
+
+def bench_watch(args):
+    """Режим наблюдения на подделке таблицы: время от серии правок до перерисованных документов
+    (с ожиданием debounce). Что перерисовывается только изменившееся - tests/test_watch.py."""
+    student_data = make_student_data(args.rows, args.sessions)
+    tech_data = make_tech_data(args.sessions)
+    student_range, tech_range = 'Sheet1!A2:S', 'Sheet2!A2:N'
+    with report_dir():
+        watch.write_fake_sheet('sheet.json', {student_range: student_data, tech_range: tech_data})
+        watcher = watch.Watcher(watch.FakeSheets('sheet.json'), 'fake', (student_range, tech_range),
+                                interval=0.05, debounce=0.3)
+        stop = threading.Event()
+        thread = threading.Thread(target=watcher.run, args=(stop,))
+
+        def settle(cycles):
+            deadline = time.monotonic() + 600
+            while watcher.cycles < cycles and time.monotonic() < deadline:
+                time.sleep(0.02)
+            return dict(watcher.rendered)
+
+        def edit(change, times=1):
+            for n in range(times):
+                change(n)
+                watch.write_fake_sheet('sheet.json', {student_range: student_data, tech_range: tech_data})
+                time.sleep(0.05)
+
+        def decision(n):
+            student_data[n][16] = '2' if student_data[n][16] != '2' else '1'
+
+        def room(n):
+            tech_data[1][13] = f'{tech_data[1][13]}a'
+
+        def comment(n):
+            student_data[n][18] = f'примечание {n}'
+
+        thread.start()
+        try:
+            before = settle(1)
+            print(f"первый цикл: {before}")
+            for title, change, times in [
+                ('5 правок решения секции подряд', decision, 5),
+                ('аудитория заседания', room, 1),
+                ('столбец, которого нет в документах', comment, 3),
+            ]:
+                start, cycles = time.perf_counter(), watcher.cycles
+                edit(change, times)
+                after = settle(cycles + 1)
+                changed = {kind for kind in after if after[kind] != before[kind]}
+                print(f"{title:36} перерисованы {sorted(changed) or '-'} за {time.perf_counter() - start:.2f} с "
+                      f"(с ожиданием debounce)")
+                before = after
+        finally:
+            stop.set()
+            thread.join()
+
+
+XLSX_NUMERIC = re.compile(r'-?\d+(\.\d+)?')
+XLSX_DATE = re.compile(r'(\d{4})-(\d\d)-(\d\d)(?: (\d\d):(\d\d))?')
+XLSX_TIME = re.compile(r'(\d\d):(\d\d)')
+
+
+def write_xlsx(path, sheets):
+    """Книга .xlsx, как её сохраняет Excel: тексты - в общих строках, числа, даты и время - числами
+    со стилями дат. sheets - {имя листа: строки}, первая строка - заголовки."""
+    shared, cells = {}, []
+
+    def cell(ref, value):
+        if XLSX_NUMERIC.fullmatch(value):
+            return f'<c r="{ref}"><v>{value}</v></c>'
+        date, time_ = XLSX_DATE.fullmatch(value), XLSX_TIME.fullmatch(value)
+        if date:
+            days = (datetime.datetime(*map(int, date.groups()[:3])) - datetime.datetime(1899, 12, 30)).days
+            if date[4]:
+                return f'<c r="{ref}" s="3"><v>{days + (int(date[4]) * 60 + int(date[5])) / 1440}</v></c>'
+            return f'<c r="{ref}" s="1"><v>{days}</v></c>'
+        if time_:
+            return f'<c r="{ref}" s="2"><v>{(int(time_[1]) * 60 + int(time_[2])) / 1440}</v></c>'
+        return f'<c r="{ref}" t="s"><v>{shared.setdefault(value, len(shared))}</v></c>'
+
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for number, (name, rows) in enumerate(sheets.items(), 1):
+            with zf.open(f'xl/worksheets/sheet{number}.xml', 'w') as f:
+                f.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                        b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+                for r, row in enumerate(rows, 1):
+                    xml = ''.join(cell(f'{column_letter(c)}{r}', value) for c, value in enumerate(row) if value)
+                    f.write(f'<row r="{r}">{xml}</row>'.encode('utf-8'))
+                f.write(b'</sheetData></worksheet>')
+        zf.writestr('xl/sharedStrings.xml', '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                    '<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                    + ''.join(f'<si><t>{docx_stream.escape(text)}</t></si>' for text in shared) + '</sst>')
+        zf.writestr('xl/styles.xml', '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                    '<numFmts count="1"><numFmt numFmtId="164" formatCode="yyyy\\-mm\\-dd\\ hh:mm"/></numFmts>'
+                    '<cellXfs count="4"><xf numFmtId="0"/><xf numFmtId="14"/><xf numFmtId="20"/><xf numFmtId="164"/>'
+                    '</cellXfs></styleSheet>')
+        zf.writestr('xl/workbook.xml', '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+                    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"><sheets>'
+                    + ''.join(f'<sheet name="{name}" sheetId="{n}" r:id="rId{n}"/>' for n, name in enumerate(sheets, 1))
+                    + '</sheets></workbook>')
+        zf.writestr('xl/_rels/workbook.xml.rels', '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                    + ''.join(f'<Relationship Id="rId{n}" Type="http://schemas.openxmlformats.org/officeDocument/'
+                              f'2006/relationships/worksheet" Target="worksheets/sheet{n}.xml"/>'
+                              for n in range(1, len(sheets) + 1)) + '</Relationships>')
+
+
+def write_csv(path, rows):
+    with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+        csv.writer(f, delimiter=';').writerows(rows)
+
+
+def as_sheet(rows):
+    """Строки, как их отдаёт Sheets API: без пустых ячеек в конце."""
+    result = []
+    for row in rows:
+        row = list(row)
+        while row and not row[-1]:
+            row.pop()
+        result.append(row)
+    return result
+
+
+def old_layout(student_data, tech_data):
+    """Те же данные в раскладке main_old.py (A:L и A:M)."""
+    students = [['', f'{r[7]} {r[8]} {r[9]}', r[13], '', r[12], r[11], '', '', r[15], r[16], '', ''] for r in student_data]
+    tech = [row[:11] + [f'{row[11]} {row[12]}', row[13]] for row in tech_data]
+    return students, tech
+
+
+def bench_file_source(args):
+    """Чтение листов из .xlsx и .csv: строк в секунду, пиковая память при потоковом чтении,
+    совпадение с исходными данными в раскладках main.py и main_old.py и запуск генераторов."""
+    student_data = make_student_data(args.rows, args.sessions)
+    tech_data = make_tech_data(args.sessions)
+    old_students, old_tech = old_layout(student_data, tech_data)
+    header = [column_letter(c) for c in range(19)]
+    student_range, tech_range = 'Sheet1!A2:S', 'Sheet2!A2:N'
+    with report_dir():
+        os.mkdir('csv')
+        write_xlsx('main.xlsx', {'Лист1': [header] + student_data, 'Лист2': [header] + tech_data})
+        write_xlsx('old.xlsx', {'Sheet1': [header] + old_students, 'Sheet2': [header] + old_tech})
+        write_csv('csv/Sheet1.csv', [header] + student_data)
+        write_csv('csv/Sheet2.csv', [header] + tech_data)
+        cases = [
+            ('xlsx main', 'main.xlsx', student_range, tech_range, student_data, tech_data),
+            ('csv main', 'csv', student_range, tech_range, student_data, tech_data),
+            ('xlsx old', 'old.xlsx', 'Sheet1!A2:L', 'Sheet2!A2:M', old_students, old_tech),
+        ]
+        for name, path, s_range, t_range, expected_students, expected_tech in cases:
+            size = sum(os.path.getsize(os.path.join(root, file)) for root, _, files in os.walk(path)
+                       for file in files) if os.path.isdir(path) else os.path.getsize(path)
+            start = time.perf_counter()
+            students = load_file_sheet(path, s_range)
+            seconds = time.perf_counter() - start
+            assert students == as_sheet(expected_students), name
+            assert load_file_sheet(path, t_range) == as_sheet(expected_tech), name
+            file_source._shared_cache.clear()  # пик - вместе с общими строками книги
+            tracemalloc.start()
+            count = sum(1 for _ in iter_file_sheet(path, s_range))
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"{name:10} {count:7} строк {size / 2 ** 20:6.1f} МБ  {seconds:6.2f} с  "
+                  f"{count / seconds:8.0f} строк/с  пик при потоковом чтении {peak / 2 ** 20:5.1f} МБ")
+
+        # Выгрузка с другим порядком столбцов: поля раскладки по заголовкам
+        order = list(range(19))
+        random.Random(0).shuffle(order)
+        write_csv('shuffled.csv', [[f'поле {c}' for c in order]] + [[row[c] for c in order] for row in student_data])
+        fields = file_source.LAYOUTS['main']['Sheet1']
+        columns = {field: f'поле {index}' for field, index in fields.items()}
+        mapped = load_file_sheet('shuffled.csv', student_range, columns)
+        assert [[row[i] if i < len(row) else '' for i in fields.values()] for row in mapped] == \
+               [[row[i] for i in fields.values()] for row in student_data]
+
+        # Генераторы main.py и main_old.py на первых строках выгрузки (последняя строка диапазона)
+        part = min(args.rows, 10 * args.sessions) + 1
+        start = time.perf_counter()
+        main.generate_conference_report(load_file_sheet('main.xlsx', f'Sheet1!A2:S{part}'),
+                                        load_file_sheet('main.xlsx', tech_range), 'report/report.docx')
+        main_old.generate_conference_report(load_file_sheet('old.xlsx', f'Sheet1!A2:L{part}', layout='old'),
+                                            load_file_sheet('old.xlsx', 'Sheet2!A2:M', layout='old'))
+        print(f"отчёты main.py и main_old.py из .xlsx ({part - 1} строк): {time.perf_counter() - start:.2f} с")
+
+
+def bench_preview(args):
+    """Предпросмотр JSON/HTML против рендеринга .docx на тех же данных; ETag и 304 через API."""
+    student_data = make_student_data(args.rows, args.sessions)
+    tech_data = make_tech_data(args.sessions)
+    os.environ.update(DATA_TTL='0.001', DOCUMENT_TTL='0.001', WARMUP='0', TRACE_FILE='')
+    with report_dir():
+        import v4
+        from fastapi.testclient import TestClient
+
+        for kind in ('programme', 'report', 'publications'):
+            docx_seconds = timed(lambda: v4.render_document(kind, 'docx', student_data, tech_data), args.repeat)
+            stream_seconds = timed(lambda: docx_stream.render_docx(v4.DOCUMENTS[kind][1](student_data, tech_data)),
+                                   args.repeat)
+            json_seconds = timed(lambda: json.dumps(preview.build_preview(kind, student_data, tech_data),
+                                                    ensure_ascii=False), args.repeat)
+            html_seconds = timed(lambda: preview.render_html(preview.build_preview(kind, student_data, tech_data)),
+                                 args.repeat)
+            print(f"{kind:12} python-docx {docx_seconds * 1000:8.1f} мс  docx_stream {stream_seconds * 1000:7.1f} мс  "
+                  f"JSON {json_seconds * 1000:6.1f} мс  HTML {html_seconds * 1000:6.1f} мс  "
+                  f"(x{docx_seconds / json_seconds:.0f} быстрее python-docx)")
+
+        content = preview.build_preview('report', student_data, tech_data)
+        assert sum(len(session['speakers']) for session in content['sessions']) == len(student_data)
+        accepted = preview.build_preview('publications', student_data, tech_data)['accepted']
+        assert len(accepted) == sum(1 for row in student_data if row[16] in main.ACCEPTED)
+
+        data = {v4.STUD_RANGE: student_data, v4.TECH_RANGE: tech_data}
+        v4.load_google_sheet = lambda s_id, s_range: data[s_range]
+        with TestClient(v4.app) as client:
+            for output in ('json', 'html'):
+                url = f'/conferences/programme/preview?format={output}'
+                first = client.get(url)
+                etag = first.headers['etag']
+                start = time.perf_counter()
+                repeated = client.get(url, headers={'If-None-Match': etag})
+                revalidated = time.perf_counter() - start
+                assert first.status_code == 200 and repeated.status_code == 304 and not repeated.content
+                print(f"API {output:4}  200 {len(first.content) / 1024:7.1f} КБ, If-None-Match -> 304 "
+                      f"за {revalidated * 1000:.1f} мс (с повторной загрузкой листов: DATA_TTL=0.001)")
+            time.sleep(0.01)  # DATA_TTL истёк - лист загрузится заново
+            data[v4.STUD_RANGE] = [row[:13] + [row[13] + ' (испр.)'] + row[14:] for row in student_data]
+            changed = client.get(url, headers={'If-None-Match': etag})
+            assert changed.status_code == 200 and changed.headers['etag'] != etag and '(испр.)' in changed.text
+            print("после правки таблицы - новый ETag и 200")
+
+
+def bench_ordering(args):
+    """Порядок участников и заседаний на больших секциях: ключи на каждый документ против ключей,
+    посчитанных один раз на ревизию; проверка порядка в содержании документов."""
+    student_data = make_student_data(args.rows, args.sessions)
+    rnd = random.Random(1)
+    surnames = ['Ёлкин', 'Елисеев', 'Ежов', 'Жуков', 'Абрамов', 'Ли', 'Лиам', 'Петров-Водкин', 'Петрова', 'Smith']
+    for row in student_data:
+        row[7] = rnd.choice(surnames) + row[7][-2:]
+    tech_data = make_tech_data(args.sessions)
+    for number, row in enumerate(tech_data):  # заседания в листе - в обратном порядке дат
+        row[11], row[12] = f'2025-04-{28 - number % 28:02d}', f'{9 + number // 28}:00'
+
+    def naive():
+        # как в v3: каждый документ сортирует сам, ключи - заново
+        for _ in range(3):
+            sorted(student_data, key=lambda row: (int(row[15]), ordering.name_key(row)))
+            sorted(tech_data, key=lambda row: datetime.datetime.strptime(row[11], '%Y-%m-%d'))
+
+    def cold():
+        ordering._cache.clear()
+        ordering.order_data(student_data, tech_data, 'surname', 'datetime')
+
+    revision = data_revision(student_data, tech_data)
+    ordering.order_data(student_data, tech_data, 'surname', 'datetime', revision)
+    for name, func in [('ключи на каждый документ (x3)', naive),
+                       ('первый документ ревизии', cold),
+                       ('следующие документы', lambda: ordering.order_data(student_data, tech_data, 'surname',
+                                                                           'datetime', revision))]:
+        print(f"{name:30} {timed(func, args.repeat) * 1000:8.1f} мс")
+
+    for order in ordering.PARTICIPANT_ORDERS:
+        rows, tech_rows = ordering.order_data(student_data, tech_data, order, 'datetime')
+        content = preview.build_preview('report', rows, tech_rows)
+        moments = [(session['date'], session['time']) for session in content['sessions']]
+        days = [int(tech_rows[number][11][-2:]) * 100 + int(tech_rows[number][12].split(':')[0])
+                for number in range(len(content['sessions']))]
+        assert days == sorted(days), moments
+        assert sum(len(session['speakers']) for session in content['sessions']) == len(student_data)
+        for session in content['sessions']:
+            names = [speaker['name'] for speaker in session['speakers']]
+            if order == 'surname':
+                assert names == sorted(names, key=lambda name: ordering.collation_key(name.replace(' ', '\x00'))), names
+        print(f"{order:8} заседания по дате: {moments[0]} ... {moments[-1]}; участники первого заседания: "
+              f"{', '.join(speaker['name'].split()[0] for speaker in content['sessions'][0]['speakers'][::200])}")
+
+
+def write_payload(student_data, tech_data, file_path='report/payload.bin'):
+    """«Генератор» для проверки хранилища: тело пишется кусками, первые 32 байта - его sha256."""
+    seed, size = map(int, student_data[0])
+    body = random.Random(seed).randbytes(size)
+    data = hashlib.sha256(body).digest() + body
+    with open(file_path, 'wb') as f:
+        for start in range(0, len(data), 8192):
+            f.write(data[start:start + 8192])
+            f.flush()  # другие процессы видят файл недописанным
+
+
+def intact(path):
+    """True - файл целый, False - недописан или смешан из двух записей, None - файла нет."""
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    return len(data) > 32 and hashlib.sha256(data[32:]).digest() == data[:32]
+
+
+INTACT = {True: 'целая', False: 'испорчена', None: 'удалена'}
+REVISIONS = 200
+
+
+def _outputs_worker(job):
+    """Процесс с двумя потоками: публикация версий, чтение своей версии, общего файла и чужих версий;
+    сборка - в фоне и вручную, одновременно во всех процессах."""
+    root, max_bytes, grace, rounds, worker, direct = job
+    store = OutputStore(root, max_bytes=max_bytes, grace=grace)
+    latest = os.path.join(root, 'latest.bin')
+    results = []
+
+    def client(thread):
+        rnd = random.Random(worker * 100 + thread)
+        stats = Counter()
+        for i in range(rounds):
+            data = [[str(rnd.randrange(2 ** 32)), str(rnd.randrange(20, 120) * 1024)]]
+            revision = f"r{rnd.randrange(REVISIONS)}"
+            if direct:
+                write_payload(data, [], latest)  # как раньше: все пишут в один файл
+            else:
+                store.render(write_payload, data, [], revision, latest=latest)
+                stats[f"своя версия {INTACT[intact(store.path('payload.bin', revision))]}"] += 1
+                other = store.read('payload.bin', f"r{rnd.randrange(REVISIONS)}")
+                if other is not None:
+                    stats['чужая версия ' + ('целая' if hashlib.sha256(other[32:]).digest() == other[:32] else 'испорчена')] += 1
+                if i % 10 == 0:
+                    store.collect()
+            stats[f"общий файл {INTACT[intact(latest)]}"] += 1
+        results.append(stats)
+
+    store.start(0.05)
+    threads = [threading.Thread(target=client, args=(thread,)) for thread in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    store.stop()
+    return sum(results, Counter()), store.published, store.removed
+
+
+def bench_outputs(args):
+    """Хранилище документов под нагрузкой: процессы и потоки публикуют версии в общий каталог
+    с маленьким max_bytes и читают общий файл; для сравнения - запись прямо в общий файл.
+    Скорость и счётчики целых и испорченных чтений; проверки - tests/test_output_store.py."""
+    max_bytes = int(args.max_mb * 2 ** 20)
+    grace = 0.1  # в работе - минута; здесь короче, чтобы сборка шла наперегонки с публикацией
+    with report_dir() as tmp:
+        for direct in (True, False):
+            root = os.path.join(tmp, 'direct' if direct else 'store')
+            os.makedirs(root)
+            jobs = [(root, max_bytes, grace, args.rounds, worker, direct) for worker in range(args.concurrency)]
+            start = time.perf_counter()
+            with multiprocessing.Pool(args.concurrency) as pool:
+                results = pool.map(_outputs_worker, jobs)
+            elapsed = time.perf_counter() - start
+            stats = sum((counts for counts, _, _ in results), Counter())
+            published = sum(count for _, count, _ in results)
+            removed = sum(count for _, _, count in results)
+            writes = args.concurrency * 2 * args.rounds
+            print(f"{'прямая запись' if direct else 'хранилище':14} {writes} записей за {elapsed:.2f} с "
+                  f"({writes / elapsed:.0f}/с); {dict(sorted(stats.items()))}")
+            if direct:
+                continue
+            time.sleep(grace)
+            store = OutputStore(root, max_bytes=max_bytes, grace=0)
+            final = store.collect()
+            versions = store._entries()
+            print(f"опубликовано {published}, сборка удалила {removed + final['removed']}; осталось {len(versions)} "
+                  f"версий, {final['bytes'] / 2 ** 20:.2f} МБ из {args.max_mb} МБ; временных файлов "
+                  f"{len(os.listdir(store.temp_dir))}")
+
+
+BENCHMARKS = {
+    'stream': bench_stream,
+    'chunked': bench_chunked,
+    'pdf': bench_pdf,
+    'combined': bench_combined,
+    'validate': bench_validate,
+    'sync': bench_sync,
+    'search': bench_search,
+    'shared-cache': bench_shared_cache,
+    'mail-merge': bench_mail_merge,
+    'assign': bench_assign,
+    'templates': bench_templates,
+    'parallel': bench_parallel,
+    'warmup': bench_warmup,
+    'save': bench_save,
+    'proceedings': bench_proceedings,
+    'admission': bench_admission,
+    'cancel': bench_cancel,
+    'tracing': bench_tracing,
+    'soak': bench_soak,
+    'watch': bench_watch,
+    'file-source': bench_file_source,
+    'preview': bench_preview,
+    'ordering': bench_ordering,
+    'outputs': bench_outputs,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Замеры генераторов документов")
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--sessions', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--sections', type=int, default=50)
+    parser.add_argument('--recycle', type=int, default=50)
+    parser.add_argument('--papers', type=int, default=600)
+    parser.add_argument('--clients', type=int, default=40)
+    parser.add_argument('--documents', type=int, default=8)
+    parser.add_argument('--limit', type=int, default=2)
+    parser.add_argument('--queue', type=int, default=8)
+    parser.add_argument('--rounds', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=3)
+    parser.add_argument('--tolerance', type=float, default=8.0, help='допустимый рост удерживаемой памяти (RSS после release), МБ')
+    parser.add_argument('--url', help='адрес запущенного сервера v4 для soak')
+    parser.add_argument('--max-mb', type=float, default=2.0, help='размер хранилища документов для outputs, МБ')
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
@@ -0,0 +1,177 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Optional, Tuple
+
+from tracing import current_span
+
+# Кооперативная отмена: у запроса есть токен (в contextvar, поэтому виден и в потоках пула,
+# где выполняются синхронные эндпоинты), а загрузка и рендеринг в контрольных точках
+# (между заседаниями, перед записью файла, перед обращением к Sheets) проверяют, не ушёл ли
+# клиент и не вышел ли срок запроса. Вне запроса (CLI, прогрев) checkpoint ничего не делает.
+
+DISCONNECT = 'disconnect'
+DEADLINE = 'deadline'
+
+
+class Cancelled(Exception):
+    def __init__(self, reason: str, stage: str):
+        super().__init__(f"{reason} during {stage}")
+        self.reason = reason
+        self.stage = stage
+
+
+class CancelToken:
+    __slots__ = ('started', 'deadline', 'reason', 'stage', 'done', 'total')
+
+    def __init__(self, deadline: Optional[float] = None):
+        self.started = time.perf_counter()
+        self.deadline = self.started + deadline if deadline else None
+        self.reason = None
+        self.stage = None
+        self.done = None  # прогресс последней контрольной точки: сделано из total
+        self.total = None
+
+    def extend(self, seconds: float) -> None:
+        # время, когда ответ ждал клиента, в срок не входит: срок - на подготовку документа, не на отдачу
+        if self.deadline is not None:
+            self.deadline += seconds
+
+    def cancel(self, reason: str) -> None:
+        if self.reason is None:
+            self.reason = reason
+
+    def check(self, stage: str, done: Optional[int] = None, total: Optional[int] = None) -> None:
+        self.stage = stage
+        if total is not None:
+            self.done, self.total = done, total
+        if self.reason is None and self.deadline is not None and time.perf_counter() > self.deadline:
+            self.reason = DEADLINE
+        if self.reason is not None:
+            raise Cancelled(self.reason, stage)
+
+
+current: ContextVar[Optional[CancelToken]] = ContextVar('cancel_token', default=None)
+
+
+def checkpoint(stage: str, done: Optional[int] = None, total: Optional[int] = None) -> None:
+    """Контрольная точка: Cancelled, если запрос отменён; done/total - для оценки сэкономленной работы."""
+    token = current.get()
+    if token is not None:
+        token.check(stage, done, total)
+
+
+class CancellationStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.completed = 0
+        self.cancelled = Counter()  # причина -> запросов
+        self.stages = Counter()  # этап, на котором остановились -> запросов
+        self.units_saved = 0  # неотрендеренные заседания / доклады / документы
+        self.seconds_spent = 0.0  # сколько отменённые запросы успели поработать
+        self.seconds_saved = 0.0  # оценка по прогрессу: сколько работы не понадобилось
+
+    def record(self, token: CancelToken, error: Optional[Cancelled] = None) -> None:
+        elapsed = time.perf_counter() - token.started
+        with self._lock:
+            self.requests += 1
+            if error is None:
+                self.completed += 1
+                return
+            self.cancelled[error.reason] += 1
+            self.stages[error.stage] += 1
+            self.seconds_spent += elapsed
+            if token.total:
+                left = token.total - (token.done or 0)
+                self.units_saved += left
+                self.seconds_saved += elapsed * left / max(token.done or 0, 1)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            cancelled = sum(self.cancelled.values())
+            return {
+                "requests": self.requests,
+                "completed": self.completed,
+                "cancelled": dict(self.cancelled),
+                "cancel_rate": cancelled / self.requests if self.requests else 0.0,
+                "cancelled_at_stage": dict(self.stages),
+                "units_saved": self.units_saved,
+                "seconds_spent_before_cancel": round(self.seconds_spent, 3),
+                "estimated_seconds_saved": round(self.seconds_saved, 3),
+            }
+
+
+stats = CancellationStats()
+
+
+class CancelOnDisconnect:
+    """ASGI-middleware: токен отмены на запрос, отмена при http.disconnect и по сроку deadline.
+
+    Сообщения клиента читает одна задача и передаёт приложению через очередь - так
+    приложение (и StreamingResponse, который сам ждёт disconnect) видит их как обычно.
+    Срок считается без времени отправки тела: медленный клиент не обрывает поток,
+    который рендерится быстрее, чем он читает; отключение клиента отменяет как прежде."""
+
+    def __init__(self, app, deadline: Optional[float] = None, prefixes: Tuple[str, ...] = ('/',)):
+        self.app = app
+        self.deadline = deadline
+        self.prefixes = prefixes
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not scope['path'].startswith(self.prefixes):
+            return await self.app(scope, receive, send)
+        token = CancelToken(self.deadline)
+        messages = asyncio.Queue()
+        started = finished = False
+
+        async def listen() -> None:
+            while True:
+                message = await receive()
+                await messages.put(message)
+                if message['type'] == 'http.disconnect':
+                    # после отправленного ответа disconnect - обычное завершение запроса
+                    if not finished:
+                        token.cancel(DISCONNECT)
+                    return
+
+        async def send_tracked(message) -> None:
+            nonlocal started, finished
+            if message['type'] == 'http.response.start':
+                started = True
+            elif message['type'] == 'http.response.body':
+                finished = not message.get('more_body', False)
+                sending = time.perf_counter()
+                await send(message)
+                token.extend(time.perf_counter() - sending)
+                return
+            await send(message)
+
+        listener = asyncio.create_task(listen())
+        reset = current.set(token)
+        try:
+            await self.app(scope, messages.get, send_tracked)
+        except Cancelled as e:
+            stats.record(token, e)
+            current_span().set(**{'cancel.reason': e.reason, 'cancel.stage': e.stage})
+            logging.info(f"Cancelled {scope['path']}: {e} after {time.perf_counter() - token.started:.3f} s")
+            if e.reason == DISCONNECT:
+                return  # отвечать уже некому
+            if started:
+                # ответ уже идёт: обрываем соединение, чтобы клиент не принял обрезанный файл за целый
+                raise
+            await send({'type': 'http.response.start', 'status': 504,
+                        'headers': [(b'content-type', b'text/plain; charset=utf-8')]})
+            await send({'type': 'http.response.body', 'body': f"Request cancelled: {e}".encode('utf-8')})
+        else:
+            # StreamingResponse сам прекращает отдачу при disconnect и завершается без ошибки
+            if token.reason is not None and not finished:
+                stats.record(token, Cancelled(token.reason, token.stage or 'stream'))
+            else:
+                stats.record(token)
+        finally:
+            current.reset(reset)
+            listener.cancel()
@@ -0,0 +1,378 @@
+import json
+import os
+import re
+from functools import lru_cache
+from operator import attrgetter, itemgetter
+from typing import Callable, Dict, Iterator, List, Optional, Union
+
+import docx_stream
+from cancellation import checkpoint
+from docx_stream import (CELL_CENTER, CELL_LEFT, CENTER, OUTLINE, paragraph, paragraph_props, run, run_content,
+                         run_props, text_paragraph, xml_safe)
+from main import NO_DECISION, RECOMMENDATIONS, convert_to_initials, format_date
+
+# Декларативные шаблоны документов (templates/<имя>.json) вместо генераторов на Python.
+# Шаблон один раз компилируется в план рендеринга: статическая разметка собирается
+# в готовые строки заранее, а для полей остаются только функции подстановки.
+#
+# Формат шаблона:
+#   "columns": {"session": 15, "decision": 16} - столбцы строки участника
+#   "decisions": {"1": "опубликовать ...", "0": "..."}, "decision_default": "нет данных" - текст
+#     решения для фильтра |decision (без "decisions" - коды конференции, main.RECOMMENDATIONS)
+#   "body": [узел, ...], где узел - один из:
+#     {"paragraph": ТЕКСТ, "props": ..., "bold": true}      абзац из одного фрагмента
+#     {"runs": [{"text": ТЕКСТ, "bold": .., "italic": ..}], "props": ...}
+#     {"sessions": [узел, ...]}                             повтор для каждого заседания
+#     {"participants": [узел, ...], "decision": ["1", "2"]} повтор для каждого участника
+#     {"table": {"header": [ЯЧЕЙКА, ...], "cells": [ЯЧЕЙКА, ...]}}  строка на участника
+#     {"page_break": true}
+#   ЯЧЕЙКА - {"text": ТЕКСТ, "props": ...}
+#   props - "normal" (стиль Normal), "center", "cell-center", "cell-left", "outline"; по умолчанию без pPr
+#   ТЕКСТ - строка или список строк и {"text": строка, "ljust": ширина, "if": "row:11"}
+#   Поля в строке: {head:2} - первая строка техлиста, {tech:12} - строка заседания,
+#   {row:13} - строка участника ({row:7,8,9} - через пробел), {num} - номер заседания,
+#   {n} - номер участника, {spaces:40} - 40 пробелов; фильтры: |initials, |date, |decision.
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+
+PROPS = {
+    None: None,
+    'normal': '',
+    'center': CENTER,
+    'cell-center': CELL_CENTER,
+    'cell-left': CELL_LEFT,
+    'outline': OUTLINE,
+}
+
+FILTERS = {
+    'initials': convert_to_initials,
+    'date': format_date,
+}
+# |decision - по таблице решений шаблона (Plan.decide), а не по общей таблице
+DECISION_FILTER = 'decision'
+
+FIELD = re.compile(r'\{(\w+)(?::([\d,]+))?(?:\|(\w+))?\}')
+
+
+class TemplateError(ValueError):
+    pass
+
+
+class Context:
+    """Текущие данные при рендеринге: техлист, заседание, участник."""
+    __slots__ = ('head', 'tech', 'num', 'row', 'n', 'rows', 'accepted', 'decide')
+
+    def __init__(self, head: List[str], rows: List[List[str]], accepted: Optional[List[List[str]]],
+                 decide: Callable[[str], str]):
+        self.decide = decide
+        self.head = head
+        self.tech = []
+        self.num = 0
+        self.row = []
+        self.n = 0
+        self.rows = rows
+        self.accepted = accepted
+
+
+Text = Union[str, Callable[[Context], str]]
+
+
+def _cell(values: List[str], index: int) -> str:
+    return values[index] if len(values) > index else ''
+
+
+def _getter(source: str, spec: Optional[str]) -> Callable[[Context], str]:
+    if source in ('num', 'n'):
+        return (lambda c: str(c.num)) if source == 'num' else (lambda c: str(c.n))
+    if source not in ('head', 'tech', 'row') or not spec:
+        raise TemplateError(f"неизвестное поле {{{source}:{spec or ''}}}")
+    columns = tuple(int(col) for col in spec.split(','))
+    values = attrgetter(source)
+    pick = itemgetter(*columns)
+    if len(columns) == 1:
+        def get(c: Context) -> str:
+            try:
+                return pick(values(c))
+            except IndexError:
+                return ''
+    else:
+        def get(c: Context) -> str:
+            try:
+                return ' '.join(pick(values(c)))
+            except IndexError:  # короткая строка: недостающие столбцы пустые
+                return ' '.join(_cell(values(c), col) for col in columns)
+    return get
+
+
+def _field(source: str, spec: Optional[str], name: Optional[str]) -> Union[str, Callable[[Context], str]]:
+    if source == 'spaces':
+        return ' ' * int(spec or 1)
+    get = _getter(source, spec)
+    if name is None:
+        return get
+    if name == DECISION_FILTER:
+        return lambda c: c.decide(get(c))
+    if name not in FILTERS:
+        raise TemplateError(f"неизвестный фильтр |{name}")
+    apply = FILTERS[name]
+    return lambda c: apply(get(c))
+
+
+def _compile_string(text: str) -> Text:
+    """Строка с полями -> константа или функция от контекста (через str.format)."""
+    parts = []
+    pos = 0
+    for match in FIELD.finditer(text):
+        parts.append(text[pos:match.start()])
+        parts.append(_field(*match.groups()))
+        pos = match.end()
+    parts.append(text[pos:])
+
+    getters = tuple(part for part in parts if callable(part))
+    if not getters:
+        return ''.join(parts)
+    fmt = ''.join('{}' if callable(part) else part.replace('{', '{{').replace('}', '}}') for part in parts)
+    if len(getters) == 1:
+        get = getters[0]
+        return get if fmt == '{}' else lambda c: fmt.format(get(c))
+    return lambda c: fmt.format(*[get(c) for get in getters])
+
+
+def _compile_segment(segment) -> Text:
+    if isinstance(segment, str):
+        return _compile_string(segment)
+    text = _compile_string(segment['text'])
+    width = segment.get('ljust')
+    condition = segment.get('if')
+    if width:
+        inner = text
+        text = (lambda c: inner(c).ljust(width)) if callable(inner) else inner.ljust(width)
+    if condition:
+        source, _, spec = condition.partition(':')
+        check = _getter(source, spec)
+        inner = text
+        text = (lambda c: inner(c) if check(c) else '') if callable(inner) else (
+            lambda c: inner if check(c) else '')
+    return text
+
+
+def compile_text(text) -> Text:
+    if isinstance(text, str) or isinstance(text, dict):
+        return _compile_segment(text)
+    parts = [_compile_segment(segment) for segment in text]
+    if not any(callable(part) for part in parts):
+        return ''.join(parts)
+    return lambda c: ''.join(part(c) if callable(part) else part for part in parts)
+
+
+def _props(node: dict) -> Optional[str]:
+    name = node.get('props')
+    if name not in PROPS:
+        raise TemplateError(f"неизвестные props: {name!r}")
+    return PROPS[name]
+
+
+# План рендеринга - список операций; операция - готовая строка разметки или функция от контекста
+
+Op = Union[str, Callable[[Context], str]]
+
+
+def _merge(ops: List[Op]) -> List[Op]:
+    """Соседние статические куски склеиваются в одну строку."""
+    merged = []
+    for op in ops:
+        if isinstance(op, str) and merged and isinstance(merged[-1], str):
+            merged[-1] += op
+        else:
+            merged.append(op)
+    return merged
+
+
+def _compile_paragraph(node: dict) -> Op:
+    text = compile_text(node['paragraph'])
+    props = _props(node)
+    bold = node.get('bold', False)
+    if not callable(text):
+        return text_paragraph(text, props, bold)
+    # то же, что text_paragraph, но обёртка абзаца и фрагмента собрана заранее
+    head = '<w:p>' + paragraph_props(props) + '<w:r>' + run_props(bold)
+    empty = paragraph(props=props)
+
+    def render(c: Context) -> str:
+        value = xml_safe(text(c))
+        return head + run_content(value) + '</w:r></w:p>' if value else empty
+    return render
+
+
+def _compile_runs(node: dict) -> Op:
+    props = _props(node)
+    runs = []
+    for item in node['runs']:
+        text = compile_text(item['text'])
+        bold, italic = item.get('bold', False), item.get('italic', False)
+        if callable(text):
+            runs.append(lambda c, text=text, bold=bold, italic=italic: run(text(c), bold, italic))
+        else:
+            runs.append(run(text, bold, italic))
+    ops = _merge(['<w:p>' + paragraph_props(props), *runs, '</w:p>'])
+    if len(ops) == 1:
+        return ops[0]
+    return lambda c: ''.join(op(c) if callable(op) else op for op in ops)
+
+
+def _compile_cell(cell: dict) -> Op:
+    cell_props = docx_stream._template()[4].decode('utf-8')
+    inner = _compile_paragraph({'paragraph': cell['text'], 'props': cell.get('props')})
+    if callable(inner):
+        return lambda c: f'<w:tc>{cell_props}{inner(c)}</w:tc>'
+    return f'<w:tc>{cell_props}{inner}</w:tc>'
+
+
+class Plan:
+    """Скомпилированный шаблон."""
+
+    def __init__(self, template: dict, name: Optional[str] = None):
+        self.name = name  # по имени рабочие процессы находят тот же шаблон
+        columns = template.get('columns', {})
+        self.session_column = columns.get('session', 15)
+        self.decision_column = columns.get('decision', 16)
+        decisions = template.get('decisions', RECOMMENDATIONS)
+        if not isinstance(decisions, dict) or not all(isinstance(text, str) for text in decisions.values()):
+            raise TemplateError("decisions - объект {код: текст решения}")
+        default = template.get('decision_default', NO_DECISION)
+        self.decide = lambda code: decisions.get(code, default)
+        self.blocks = [self._compile_block(node) for node in template['body']]
+
+    def _compile_nodes(self, nodes: List[dict]) -> List[Op]:
+        ops = []
+        for node in nodes:
+            ops.extend(self._compile_node(node))
+        return _merge(ops)
+
+    def _compile_node(self, node: dict) -> List[Op]:
+        if 'paragraph' in node:
+            return [_compile_paragraph(node)]
+        if 'runs' in node:
+            return [_compile_runs(node)]
+        if 'page_break' in node:
+            return [docx_stream.PAGE_BREAK]
+        if 'participants' in node:
+            return [self._loop(self._compile_nodes(node['participants']), node.get('decision'))]
+        if 'table' in node:
+            table = node['table']
+            header = ['<w:tr>', *map(_compile_cell, table['header']), '</w:tr>'] if table.get('header') else []
+            cells = _merge(['<w:tr>', *map(_compile_cell, table['cells']), '</w:tr>'])
+            return [docx_stream.table_start(), *header, self._loop(cells), docx_stream.table_end()]
+        if 'sessions' in node:
+            raise TemplateError("блок sessions допустим только на верхнем уровне шаблона")
+        raise TemplateError(f"неизвестный узел шаблона: {sorted(node)}")
+
+    def _loop(self, ops: List[Op], decision: Optional[List[str]] = None) -> Callable[[Context], str]:
+        """Повтор ops для участников: заседания (внутри sessions) или всех (с фильтром по решению)."""
+        column = self.decision_column
+        accepted = tuple(decision) if decision else None
+
+        def render(c: Context) -> str:
+            out = []
+            rows = c.rows
+            if accepted is not None:
+                rows = c.accepted if c.accepted is not None else [
+                    row for row in rows if len(row) > column and row[column] in accepted]
+            for n, row in enumerate(rows, 1):
+                c.row = row
+                c.n = n
+                out.extend([op if op.__class__ is str else op(c) for op in ops])
+            return ''.join(out)
+        return render
+
+    def _compile_block(self, node: dict):
+        if 'sessions' in node:
+            return ('sessions', self._compile_nodes(node['sessions']))
+        return ('static', self._compile_nodes([node]))
+
+    def render(self, student_data: List[List[str]], tech_data: List[List[str]],
+               sessions: Optional[Dict[int, List[List[str]]]] = None,
+               accepted: Optional[List[List[str]]] = None, workers: Optional[int] = None) -> Iterator[str]:
+        """Тело документа кусками (по куску на заседание) для потокового писателя docx_stream.
+        С workers > 1 заседания рендерятся в рабочих процессах и склеиваются в исходном порядке."""
+        head = tech_data[0] if tech_data else []
+        c = Context(head, student_data, accepted, self.decide)
+        pending = []
+        for index, (kind, ops) in enumerate(self.blocks):
+            if kind == 'static':
+                pending.extend(op(c) if callable(op) else op for op in ops)
+                continue
+            if pending:
+                yield ''.join(pending)
+                pending = []
+            if sessions is None:
+                sessions = self._group(student_data)
+            total = max(sessions, default=0)
+            jobs = ((self.name, index, head, tech_data[num - 1], num, sessions.get(num, []))
+                    for num in range(1, total + 1))
+            if workers and workers > 1 and self.name:
+                rendered = docx_stream.map_ordered(_render_session_job, jobs, workers)
+            else:
+                rendered = (self.render_session(*job[1:]) for job in jobs)
+            for done, fragment in enumerate(rendered, 1):
+                yield fragment
+                checkpoint('render', done, total)
+        if pending:
+            yield ''.join(pending)
+
+    def render_session(self, index: int, head: List[str], tech: List[str], num: int,
+                       rows: List[List[str]]) -> str:
+        c = Context(head, rows, None, self.decide)
+        c.num = num
+        c.tech = tech
+        return ''.join(op(c) if callable(op) else op for op in self.blocks[index][1])
+
+    def _group(self, student_data: List[List[str]]) -> Dict[int, List[List[str]]]:
+        column = self.session_column
+        grouped = {}
+        for row in student_data:
+            grouped.setdefault(int(row[column]), []).append(row)
+        return grouped
+
+
+def _render_session_job(job) -> str:
+    """Одно заседание в рабочем процессе; план компилируется там один раз на процесс."""
+    name, *args = job
+    return compile_template(name).render_session(*args)
+
+
+def template_path(name: str) -> str:
+    if not re.fullmatch(r'[\w-]+', name):
+        raise TemplateError(f"недопустимое имя шаблона: {name!r}")
+    return os.path.join(TEMPLATE_DIR, f'{name}.json')
+
+
+def template_names() -> List[str]:
+    return sorted(file[:-5] for file in os.listdir(TEMPLATE_DIR) if file.endswith('.json'))
+
+
+@lru_cache(maxsize=32)
+def _compile(name: str, path: str, mtime: float) -> Plan:
+    with open(path, encoding='utf-8') as f:
+        return Plan(json.load(f), name)
+
+
+def compile_template(name: str) -> Plan:
+    """План для templates/<name>.json; перекомпилируется, только если файл изменился."""
+    path = template_path(name)
+    if not os.path.exists(path):
+        raise TemplateError(f"нет шаблона {name!r}")
+    return _compile(name, path, os.path.getmtime(path))
+
+
+def iter_document(name: str, student_data: List[List[str]], tech_data: List[List[str]],
+                  sessions: Optional[Dict[int, List[List[str]]]] = None,
+                  accepted: Optional[List[List[str]]] = None, workers: Optional[int] = None) -> Iterator[str]:
+    return compile_template(name).render(student_data, tech_data, sessions, accepted, workers)
+
+
+def generate_document(name: str, student_data: List[List[str]], tech_data: List[List[str]],
+                      file_path: Optional[str] = None) -> str:
+    file_path = file_path or f'report/{name}.docx'
+    docx_stream.write_docx(iter_document(name, student_data, tech_data), file_path)
+    return file_path
@@ -0,0 +1,363 @@
+import io
+import os
+import re
+import threading
+import zipfile
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import docx
+
+import docx_zip
+from cancellation import checkpoint
+from tracing import start_span
+from main import set_document_style
+
+# Потоковая запись .docx без объектной модели python-docx.
+# Статические части пакета (стили, тема, настройки) берутся из шаблона python-docx,
+# оформленного через set_document_style, а word/document.xml пишется по кускам
+# прямо в zip-поток. Разметка совпадает с той, что даёт python-docx. Здесь - абзацы, таблицы
+# и запись пакета; сами документы (программа, отчёт, список) описаны в templates/*.json (doc_templates).
+
+DOCUMENT_PART = 'word/document.xml'
+
+ADDRESS = "Санкт-Петербург, ул. Большая Морская, д. 67,"
+
+
+@lru_cache(maxsize=None)
+def _template() -> Tuple[Tuple[Tuple[str, bytes], ...], bytes, bytes, bytes, bytes]:
+    """Шаблон пакета: части пакета, начало и конец document.xml, разметка таблицы."""
+    doc = docx.Document()
+    set_document_style(doc)
+
+    # Таблица нужна только затем, чтобы взять у python-docx tblPr/tblGrid и свойства ячейки;
+    # тело document.xml всё равно заменяется при записи
+    table = doc.add_table(rows=1, cols=4)
+    table.style = 'Table Grid'
+
+    buf = io.BytesIO()
+    doc.save(buf)
+    with zipfile.ZipFile(buf) as zf:
+        parts = tuple((name, zf.read(name)) for name in zf.namelist())
+
+    document_xml = dict(parts)[DOCUMENT_PART]
+    body_start = document_xml.index(b'<w:body>') + len(b'<w:body>')
+    body_end = document_xml.index(b'<w:sectPr')
+    table_head = document_xml[document_xml.index(b'<w:tbl>') + len(b'<w:tbl>'):document_xml.index(b'<w:tr>')]
+    cell_props = document_xml[document_xml.index(b'<w:tcPr>'):document_xml.index(b'</w:tcPr>') + len(b'</w:tcPr>')]
+    return parts, document_xml[:body_start], document_xml[body_end:], table_head, cell_props
+
+
+# Управляющие символы, запрещённые в XML 1.0 (из них допустимы только \t, \n и \r). Из ячеек
+# листа они попадают в текст как есть (например, \x0b - перенос строки внутри ячейки Excel), и
+# Word отказывается открывать такой документ; python-docx на них падает с ValueError
+INVALID_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def xml_safe(text: str) -> str:
+    """Текст без символов, которых не может быть в XML."""
+    return INVALID_XML.sub('', text)
+
+
+def _markup(text: str) -> str:
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def escape(text: str) -> str:
+    return _markup(xml_safe(text))
+
+
+def _text(text: str) -> str:
+    # text уже прошёл xml_safe в run_content
+    if len(text.strip()) < len(text):
+        return f'<w:t xml:space="preserve">{_markup(text)}</w:t>'
+    return f'<w:t>{_markup(text)}</w:t>'
+
+
+def run_props(bold: bool = False, italic: bool = False) -> str:
+    if bold or italic:
+        return '<w:rPr>' + ('<w:b/>' if bold else '') + ('<w:i/>' if italic else '') + '</w:rPr>'
+    return ''
+
+
+def run_content(text: str) -> str:
+    """Содержимое <w:r> с тем же разбором \\n и \\t, что и у Run.text в python-docx."""
+    text = xml_safe(text)
+    if '\n' not in text and '\r' not in text and '\t' not in text:
+        return _text(text) if text else ''
+    content = []
+    chunk = []
+    for char in text:
+        if char in '\n\r\t':
+            if chunk:
+                content.append(_text(''.join(chunk)))
+                chunk = []
+            content.append('<w:tab/>' if char == '\t' else '<w:br/>')
+        else:
+            chunk.append(char)
+    if chunk:
+        content.append(_text(''.join(chunk)))
+    return ''.join(content)
+
+
+def run(text: str, bold: bool = False, italic: bool = False) -> str:
+    inner = run_props(bold, italic) + run_content(text)
+    return f'<w:r>{inner}</w:r>' if inner else '<w:r/>'
+
+
+def paragraph_props(props: Union[str, None] = None) -> str:
+    """props=None - без pPr, props='' - пустой <w:pPr/> (style='Normal')."""
+    if props is None:
+        return ''
+    return f'<w:pPr>{props}</w:pPr>' if props else '<w:pPr/>'
+
+
+def paragraph(*runs: str, props: Union[str, None] = None) -> str:
+    head = paragraph_props(props)
+    if not runs and not head:
+        return '<w:p/>'
+    return f'<w:p>{head}{"".join(runs)}</w:p>'
+
+
+def text_paragraph(text: str, props: Union[str, None] = None, bold: bool = False) -> str:
+    text = xml_safe(text)
+    return paragraph(run(text, bold=bold), props=props) if text else paragraph(props=props)
+
+
+CENTER = '<w:jc w:val="center"/>'
+CELL_CENTER = '<w:ind w:firstLine="0"/><w:jc w:val="center"/>'
+CELL_LEFT = '<w:ind w:firstLine="0"/><w:jc w:val="left"/>'
+
+
+def table_row(cells: Iterable[Tuple[str, Union[str, None]]]) -> str:
+    cell_props = _template()[4].decode('utf-8')
+    return '<w:tr>' + ''.join(
+        f'<w:tc>{cell_props}{text_paragraph(text, props)}</w:tc>' for text, props in cells
+    ) + '</w:tr>'
+
+
+def table_start() -> str:
+    return '<w:tbl>' + _template()[3].decode('utf-8')
+
+
+def table_end() -> str:
+    return '</w:tbl>'
+
+
+def group_by_session(student_data: List[List[str]]) -> Dict[int, List[List[str]]]:
+    """Строки участников по номерам заседаний (один проход вместо прохода на каждое заседание)."""
+    sessions = defaultdict(list)
+    for row in student_data:
+        sessions[int(row[15])].append(row)
+    return sessions
+
+
+# Заголовок программы (для предпросмотра; сами документы - в templates/*.json, см. doc_templates)
+
+PROGRAM_TITLE = 'Форма представления материалов для программы 78 МСНК ГУАП'
+
+
+# Сводная программа по нескольким секциям (одна на факультет)
+
+PAGE_BREAK = '<w:p><w:r><w:br w:type="page"/></w:r></w:p>'
+# Заголовок секции остаётся в стиле Normal, но получает уровень структуры для оглавления
+OUTLINE = '<w:outlineLvl w:val="0"/>'
+
+
+def section_title(tech_data: List[List[str]]) -> str:
+    return f"Секция каф. {tech_data[0][0]}. {tech_data[0][1]}"
+
+
+def table_of_contents(titles: Iterable[str]) -> str:
+    """Поле TOC по уровню структуры; до обновления поля в Word показывает список секций."""
+    entries = ''.join(text_paragraph(title, '<w:ind w:firstLine="0"/>') for title in titles)
+    return ''.join([
+        text_paragraph('Содержание', CENTER, bold=True),
+        '<w:p><w:r><w:fldChar w:fldCharType="begin" w:dirty="true"/></w:r>'
+        '<w:r><w:instrText xml:space="preserve"> TOC \\o "1-1" \\h \\z \\u </w:instrText></w:r>'
+        '<w:r><w:fldChar w:fldCharType="separate"/></w:r></w:p>',
+        entries,
+        '<w:p><w:r><w:fldChar w:fldCharType="end"/></w:r></w:p>',
+    ])
+
+
+def render_program_section(section: Tuple[List[List[str]], List[List[str]]]) -> str:
+    """Тело одной секции сводной программы по шаблону templates/programme_section.json;
+    выполняется в рабочих процессах."""
+    import doc_templates  # doc_templates сам импортирует docx_stream, поэтому импорт здесь
+    student_data, tech_data = section
+    return ''.join(doc_templates.iter_document('programme_section', student_data, tech_data))
+
+
+# Один пул процессов на процесс для всех map_ordered: создаётся при первом обращении, а не на
+# каждый вызов (в v4 вызов - это запрос, и fork пула на каждый запрос в многопоточном сервере
+# дороже самого рендеринга). Размер - configure_pool (в v4 - при импорте) или число ядер;
+# shutdown_pool - при остановке приложения.
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_size: Optional[int] = None
+_pool_lock = threading.Lock()
+
+
+def configure_pool(workers: Optional[int]) -> None:
+    """Размер общего пула; действует на пул, созданный после вызова."""
+    global _pool_size
+    _pool_size = workers
+
+
+def process_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        # после гибели рабочего процесса пул непригоден (BrokenProcessPool) - создаём заново
+        if _pool is None or getattr(_pool, '_broken', False):
+            _pool = ProcessPoolExecutor(max_workers=_pool_size or os.cpu_count() or 1)
+        return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(cancel_futures=True)
+
+
+def map_ordered(func: Callable, items: Iterable, workers: Optional[int] = None,
+                window: Optional[int] = None) -> Iterator:
+    """Как executor.map в общем пуле процессов, но в работе держится не больше window заданий
+    (по умолчанию workers * 2): результаты отдаются по порядку, а память не растёт с числом входов."""
+    workers = workers or _pool_size or os.cpu_count() or 1
+    window = window or workers * 2
+    executor = process_pool()
+    pending = deque()
+    try:
+        for item in items:
+            if len(pending) >= window:
+                yield pending.popleft().result()
+            pending.append(executor.submit(func, item))
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # потребитель бросил итерацию (отмена запроса): ещё не начатые задания не нужны
+        for future in pending:
+            future.cancel()
+
+
+def iter_combined_program(sections: List[Tuple[List[List[str]], List[List[str]]]],
+                          workers: Optional[int] = None) -> Iterator[str]:
+    yield text_paragraph(PROGRAM_TITLE, CENTER, bold=True)
+    yield table_of_contents(section_title(tech_data) for _, tech_data in sections)
+    for done, fragment in enumerate(map_ordered(render_program_section, sections, workers), 1):
+        yield fragment
+        checkpoint('render', done, len(sections))
+
+
+def generate_combined_program(sections, file_path='report/combined_programme.docx', workers=None):
+    write_docx(iter_combined_program(sections, workers), file_path)
+    return file_path
+
+
+# Запись пакета
+
+@lru_cache(maxsize=None)
+def _static_members(reproducible: bool = False) -> Tuple[Tuple[str, Optional[docx_zip.Member]], ...]:
+    """Части шаблона, уже сжатые; None - место word/document.xml."""
+    parts = _template()[0]
+    if reproducible:
+        parts = [(name, docx_zip.reproducible_core(data) if name == docx_zip.CORE_PART else data)
+                 for name, data in docx_zip.stable_order(parts)]
+    return tuple((name, None if name == DOCUMENT_PART else docx_zip.compressed(data)) for name, data in parts)
+
+
+def _writer(out: BinaryIO, reproducible: bool) -> docx_zip.ZipWriter:
+    return docx_zip.ZipWriter(out, docx_zip.reproducible_date_time() if reproducible else None)
+
+
+def _write_package(out: BinaryIO, body: Iterable[str], level: Optional[int] = docx_zip.DEFAULT_LEVEL,
+                   reproducible: Optional[bool] = None) -> Iterator[None]:
+    """Пишет части пакета; отдаёт управление после каждой части и каждого куска тела."""
+    _, document_head, document_tail, _, _ = _template()
+    # span без входа в контекст: генератор могут продолжать в разных потоках
+    write_span = start_span('docx.write', level='stored' if level is None else level)
+    fragments = 0
+
+    def document() -> Iterator[bytes]:
+        nonlocal fragments
+        yield document_head
+        for fragment in body:
+            fragments += 1
+            yield fragment.encode('utf-8')
+        yield document_tail
+
+    reproducible = docx_zip.is_reproducible(reproducible)
+    writer = _writer(out, reproducible)
+    for name, member in _static_members(reproducible):
+        if member is None:
+            yield from writer.write_stream(name, document(), level)
+        else:
+            writer.write_member(name, member)
+            yield
+    writer.close()
+    write_span.end(fragments=fragments, bytes=writer.offset)
+
+
+def write_docx(body: Iterable[str], file: Union[str, BinaryIO], level: Optional[int] = docx_zip.DEFAULT_LEVEL,
+               reproducible: Optional[bool] = None) -> None:
+    """Пишет .docx: сжатые части шаблона копируются как есть, тело сжимается с level
+    (None - без сжатия) по мере поступления кусков; reproducible - см. docx_zip.REPRODUCIBLE."""
+    if isinstance(file, str):
+        with open(file, 'wb') as f:
+            return write_docx(body, f, level, reproducible)
+    for _ in _write_package(file, body, level, reproducible):
+        pass
+
+
+class _ChunkSink:
+    """Приёмник записанных байтов, из которого они забираются кусками."""
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        self.size = 0
+        return data
+
+
+def iter_zip(members: Iterable[Tuple[str, bytes]], level: Optional[int] = None,
+             chunk_size: int = 64 * 1024, reproducible: Optional[bool] = None) -> Iterator[bytes]:
+    """Zip-архив из (имя, содержимое), отдаваемый кусками по мере поступления членов."""
+    sink = _ChunkSink()
+    writer = _writer(sink, docx_zip.is_reproducible(reproducible))
+    for name, data in members:
+        writer.write(name, data, level)
+        if sink.size >= chunk_size:
+            yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def iter_docx(body: Iterable[str], chunk_size: int = 64 * 1024,
+              level: Optional[int] = docx_zip.DEFAULT_LEVEL, reproducible: Optional[bool] = None) -> Iterator[bytes]:
+    """Отдаёт .docx кусками по мере записи: в памяти держится не больше одного куска
+    сжатых данных и текущий фрагмент тела (например, одно заседание)."""
+    sink = _ChunkSink()
+    for _ in _write_package(sink, body, level, reproducible):
+        if sink.size >= chunk_size:
+            yield sink.drain()
+    yield sink.drain()
+
+
+def render_docx(body: Iterable[str], level: Optional[int] = docx_zip.DEFAULT_LEVEL,
+                reproducible: Optional[bool] = None) -> bytes:
+    buf = io.BytesIO()
+    write_docx(body, buf, level, reproducible)
+    return buf.getvalue()
@@ -0,0 +1,201 @@
+import hashlib
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Tuple, Union
+
+# Запись zip-пакета .docx с повторным использованием сжатых частей.
+# Стили, тема, настройки, [Content_Types].xml и rels одинаковы у всех документов,
+# поэтому их сжатые байты считаются один раз и дальше копируются в архив как есть;
+# заново сжимается только тело (word/document.xml).
+
+STORED = 0
+DEFLATED = 8
+DEFAULT_LEVEL = 6  # как у zlib и zipfile по умолчанию
+STATIC_LEVEL = 9  # статические части сжимаются один раз, поэтому максимально
+
+# Воспроизводимый режим: одинаковые данные - побайтно одинаковый файл (для дедупликации,
+# кэша по содержимому и ETag). Время в zip и в свойствах документа берётся из
+# SOURCE_DATE_EPOCH (по умолчанию 1980-01-01 - минимальная дата zip), части идут в
+# фиксированном порядке. Включается аргументом reproducible или REPRODUCIBLE_DOCX=1.
+REPRODUCIBLE = os.environ.get('REPRODUCIBLE_DOCX', '0') == '1'
+SOURCE_DATE_EPOCH = int(os.environ.get('SOURCE_DATE_EPOCH', '315532800'))
+CORE_PART = 'docProps/core.xml'
+
+_LOCAL_HEADER = struct.Struct('<4sHHHHHIIIHH')
+_DESCRIPTOR = struct.Struct('<4sIII')
+_CENTRAL_HEADER = struct.Struct('<4sHHHHHHIIIHHHHHII')
+_END_RECORD = struct.Struct('<4sHHHHIIH')
+
+UTF8_NAME = 0x800  # имя в UTF-8 (имена файлов в ZIP рассылок)
+HAS_DESCRIPTOR = 0x08  # crc и размеры записаны после данных
+
+
+class Member:
+    """Сжатое содержимое части пакета: копируется в архив без повторного сжатия."""
+    __slots__ = ('method', 'data', 'crc', 'size')
+
+    def __init__(self, content: bytes, level: Optional[int] = STATIC_LEVEL):
+        self.crc = zlib.crc32(content)
+        self.size = len(content)
+        if level is None:
+            self.method, self.data = STORED, content
+        else:
+            compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+            self.method, self.data = DEFLATED, compressor.compress(content) + compressor.flush()
+
+
+_members = OrderedDict()
+_members_lock = threading.Lock()  # кэш общий для потоков запросов FastAPI
+CACHE_SIZE = 64
+
+
+def compressed(content: bytes, level: Optional[int] = STATIC_LEVEL) -> Member:
+    """Member из кэша по хешу содержимого: одинаковые части сжимаются один раз на процесс."""
+    key = (hashlib.blake2b(content, digest_size=16).digest(), level)
+    with _members_lock:
+        member = _members.get(key)
+        if member is not None:
+            _members.move_to_end(key)
+            return member
+    member = Member(content, level)  # сжатие - вне блокировки
+    with _members_lock:
+        member = _members.setdefault(key, member)
+        if len(_members) > CACHE_SIZE:
+            _members.popitem(last=False)
+    return member
+
+
+def dos_date_time(date_time: Tuple[int, int, int, int, int, int]) -> Tuple[int, int]:
+    year, month, day, hour, minute, second = date_time
+    return (year - 1980) << 9 | month << 5 | day, hour << 11 | minute << 5 | second // 2
+
+
+def reproducible_date_time() -> Tuple[int, int, int, int, int, int]:
+    return max(time.gmtime(SOURCE_DATE_EPOCH)[:6], (1980, 1, 1, 0, 0, 0))
+
+
+def reproducible_core(xml: bytes) -> bytes:
+    """core.xml с фиксированными датами создания/изменения, ревизией и без автора изменений."""
+    stamp = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(SOURCE_DATE_EPOCH)).encode('ascii')
+    xml = re.sub(rb'(<dcterms:(created|modified)\b[^>]*>)[^<]*(</dcterms:\2>)',
+                 lambda m: m.group(1) + stamp + m.group(3), xml)
+    xml = re.sub(rb'<cp:lastModifiedBy>[^<]*</cp:lastModifiedBy>', b'<cp:lastModifiedBy/>', xml)
+    return re.sub(rb'<cp:revision>[^<]*</cp:revision>', b'<cp:revision>1</cp:revision>', xml)
+
+
+def stable_order(members: Iterable[Tuple[str, bytes]]) -> List[Tuple[str, bytes]]:
+    """[Content_Types].xml и корневые rels первыми, остальные части - по имени."""
+    first = ('[Content_Types].xml', '_rels/.rels')
+    return sorted(members, key=lambda member: (first.index(member[0]) if member[0] in first else len(first),
+                                               member[0]))
+
+
+def is_reproducible(reproducible: Optional[bool] = None) -> bool:
+    return REPRODUCIBLE if reproducible is None else reproducible
+
+
+class ZipWriter:
+    """Минимальный писатель zip без seek: подходит и для файла, и для потока ответа."""
+
+    def __init__(self, out: BinaryIO, date_time: Optional[Tuple[int, int, int, int, int, int]] = None):
+        self.out = out
+        self.offset = 0
+        self.entries = []
+        self.date, self.time = dos_date_time(date_time or time.localtime(time.time())[:6])
+
+    def _write(self, data: bytes) -> None:
+        self.out.write(data)
+        self.offset += len(data)
+
+    def _header(self, name: bytes, flags: int, method: int, crc: int, csize: int, size: int) -> None:
+        self.entries.append((name, flags, method, crc, csize, size, self.offset))
+        self._write(_LOCAL_HEADER.pack(b'PK\x03\x04', 20, flags, method, self.time, self.date,
+                                       crc, csize, size, len(name), 0) + name)
+
+    @staticmethod
+    def _name(name: str) -> Tuple[bytes, int]:
+        try:
+            return name.encode('ascii'), 0
+        except UnicodeEncodeError:
+            return name.encode('utf-8'), UTF8_NAME
+
+    def write_member(self, name: str, member: Member) -> None:
+        """Готовые сжатые байты - без повторного сжатия."""
+        encoded, flags = self._name(name)
+        self._header(encoded, flags, member.method, member.crc, len(member.data), member.size)
+        self._write(member.data)
+
+    def write(self, name: str, content: bytes, level: Optional[int] = DEFAULT_LEVEL) -> None:
+        self.write_member(name, Member(content, level))
+
+    def write_stream(self, name: str, chunks: Iterable[bytes], level: Optional[int] = DEFAULT_LEVEL) -> Iterator[None]:
+        """Член архива из потока кусков; отдаёт управление после каждого куска."""
+        encoded, flags = self._name(name)
+        method = STORED if level is None else DEFLATED
+        self._header(encoded, flags | HAS_DESCRIPTOR, method, 0, 0, 0)
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15) if level is not None else None
+        crc = size = csize = 0
+        for chunk in chunks:
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            data = compressor.compress(chunk) if compressor else chunk
+            if data:
+                csize += len(data)
+                self._write(data)
+            yield
+        if compressor:
+            data = compressor.flush()
+            csize += len(data)
+            self._write(data)
+        self._write(_DESCRIPTOR.pack(b'PK\x07\x08', crc, csize, size))
+        name_, flags_, method_, _, _, _, offset = self.entries[-1]
+        self.entries[-1] = (name_, flags_, method_, crc, csize, size, offset)
+
+    def close(self) -> None:
+        start = self.offset
+        for name, flags, method, crc, csize, size, offset in self.entries:
+            self._write(_CENTRAL_HEADER.pack(b'PK\x01\x02', 20, 20, flags, method, self.time, self.date,
+                                             crc, csize, size, len(name), 0, 0, 0, 0, 0, offset) + name)
+        self._write(_END_RECORD.pack(b'PK\x05\x06', 0, 0, len(self.entries), len(self.entries),
+                                     self.offset - start, start, 0))
+
+
+def package_members(doc) -> Iterator[Tuple[str, bytes]]:
+    """Члены пакета python-docx в том же порядке и с тем же содержимым, что и у doc.save."""
+    from docx.opc.pkgwriter import _ContentTypesItem
+
+    package = doc.part.package
+    parts = list(package.iter_parts())
+    yield '[Content_Types].xml', _ContentTypesItem.from_parts(parts).blob
+    yield '_rels/.rels', package.rels.xml
+    for part in parts:
+        yield part.partname.membername, part.blob
+        if len(part.rels):
+            yield part.partname.rels_uri.membername, part.rels.xml
+
+
+def save_docx(doc, file: Union[str, BinaryIO], level: Optional[int] = DEFAULT_LEVEL,
+              dynamic: Tuple[str, ...] = ('word/document.xml',), reproducible: Optional[bool] = None) -> None:
+    """Замена doc.save: части из dynamic сжимаются с level (None - без сжатия),
+    остальные берутся из кэша сжатых частей."""
+    if isinstance(file, str):
+        with open(file, 'wb') as f:
+            return save_docx(doc, f, level, dynamic, reproducible)
+    members = package_members(doc)
+    if is_reproducible(reproducible):
+        members = [(name, reproducible_core(content) if name == CORE_PART else content)
+                   for name, content in stable_order(members)]
+        writer = ZipWriter(file, reproducible_date_time())
+    else:
+        writer = ZipWriter(file)
+    for name, content in members:
+        if name in dynamic:
+            writer.write(name, content, level)
+        else:
+            writer.write_member(name, compressed(content))
+    writer.close()
@@ -0,0 +1,300 @@
+import csv
+import json
+import os
+import re
+import zipfile
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from lxml import etree
+
+# Листы из локальных выгрузок .xlsx и .csv вместо Google Sheets. Строки читаются потоком:
+# лист .xlsx разбирается iterparse с освобождением прочитанных строк (в памяти - только общие
+# строки книги), .csv - построчно. Диапазон задаётся так же, как для Sheets ('Sheet1!A2:S'),
+# и строки получаются в том же виде, что отдаёт values().get: строки, без пустых ячеек в конце
+# строки и пустых строк в конце листа, даты - как '2025-04-01', время - как '10:00'.
+
+MAIN = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PKG_REL = 'http://schemas.openxmlformats.org/package/2006/relationships'
+ROW = f'{{{MAIN}}}row'
+CELL = f'{{{MAIN}}}c'
+VALUE = f'{{{MAIN}}}v'
+TEXT = f'{{{MAIN}}}t'
+PHONETIC = f'{{{MAIN}}}rPh'
+
+RANGE = re.compile(r"^(?:'?(?P<sheet>[^!']+)'?!)?(?P<first_col>[A-Z]+)(?P<first_row>\d*):(?P<last_col>[A-Z]+)(?P<last_row>\d*)$")
+
+# Поля раскладок листов, которые читают генераторы: main.py (A:S / A:N) и main_old.py (A:L / A:M)
+LAYOUTS = {
+    'main': {
+        'Sheet1': {'surname': 7, 'name': 8, 'patronymic': 9, 'group': 11, 'status': 12, 'title': 13,
+                   'session': 15, 'decision': 16},
+        'Sheet2': {'department': 0, 'section': 1, 'head': 2, 'head_position': 3, 'email': 4, 'phone': 5,
+                   'deputy': 6, 'deputy_position': 7, 'date': 11, 'time': 12, 'room': 13},
+    },
+    'old': {
+        'Sheet1': {'full_name': 1, 'title': 2, 'status': 4, 'group': 5, 'session': 8, 'decision': 9},
+        'Sheet2': {'department': 0, 'section': 1, 'head': 2, 'head_position': 3, 'email': 4, 'phone': 5,
+                   'deputy': 6, 'deputy_position': 7, 'date_time': 11, 'room': 12},
+    },
+}
+
+# Встроенные форматы Excel с датой и только со временем
+DATE_FORMATS = set(range(14, 23)) | {45, 46, 47}
+TIME_FORMATS = {18, 19, 20, 21, 45, 46, 47}
+EPOCH = datetime(1899, 12, 30)
+
+
+def column_index(letters: str) -> int:
+    """Индекс столбца с нуля по букве: A -> 0, S -> 18 (обратное sheet_data.column_letter)."""
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index - 1
+
+
+def parse_range(s_range: str) -> Tuple[Optional[str], int, int, int, Optional[int]]:
+    """'Sheet1!A2:S' -> (лист, первая строка, первый столбец, последний столбец, последняя строка или None)."""
+    match = RANGE.match(s_range.replace('$', ''))
+    if match is None:
+        raise ValueError(f"Диапазон {s_range!r} не в формате 'Лист!A2:S'")
+    return (match['sheet'], int(match['first_row'] or 1), column_index(match['first_col']),
+            column_index(match['last_col']), int(match['last_row']) if match['last_row'] else None)
+
+
+def _number(value: str) -> str:
+    """Число в том виде, как его показывает таблица: 3, а не 3.0."""
+    if '.' not in value and 'E' not in value:
+        return value
+    number = float(value)
+    return str(int(number)) if number.is_integer() else format(number, '.15g')
+
+
+def _date(value: str, time_only: bool) -> str:
+    moment = EPOCH + timedelta(days=float(value))
+    moment = moment.replace(microsecond=0) + timedelta(seconds=round(moment.microsecond / 1e6))
+    if time_only:
+        return moment.strftime('%H:%M')
+    if moment.hour == moment.minute == moment.second == 0:
+        return moment.strftime('%Y-%m-%d')
+    return moment.strftime('%Y-%m-%d %H:%M')
+
+
+def _format_kind(code: str) -> Optional[str]:
+    """'date', 'time' или None для пользовательского формата числа."""
+    code = re.sub(r'"[^"]*"|\[[^\]]*\]|\\.', '', code).lower()
+    if 'd' in code or 'y' in code:
+        return 'date'
+    if 'h' in code or 's' in code:
+        return 'time'
+    return None
+
+
+# Общие строки последней прочитанной книги: листы участников и техлист читаются из одного файла
+# подряд, а общие строки - самая долгая часть открытия большой книги
+_shared_cache: Dict[str, Tuple[Tuple[int, int], List[str]]] = {}
+
+
+def _cached_shared(path: str, reader: 'XlsxReader') -> List[str]:
+    stat = os.stat(path)
+    key, revision = os.path.abspath(path), (stat.st_mtime_ns, stat.st_size)
+    cached = _shared_cache.get(key)
+    if cached is None or cached[0] != revision:
+        _shared_cache.clear()
+        cached = _shared_cache[key] = (revision, reader._shared_strings())
+    return cached[1]
+
+
+class XlsxReader:
+    """Потоковое чтение листов .xlsx без загрузки книги целиком."""
+
+    def __init__(self, path: str):
+        self.zip = zipfile.ZipFile(path)
+        names = set(self.zip.namelist())
+        workbook = etree.fromstring(self.zip.read('xl/workbook.xml'))
+        rels = etree.fromstring(self.zip.read('xl/_rels/workbook.xml.rels'))
+        targets = {rel.get('Id'): rel.get('Target') for rel in rels.iter(f'{{{PKG_REL}}}Relationship')}
+        self.sheets = {}  # имя листа -> часть пакета, в порядке книги
+        for sheet in workbook.iter(f'{{{MAIN}}}sheet'):
+            target = targets[sheet.get(f'{{{REL}}}id')]
+            self.sheets[sheet.get('name')] = target.lstrip('/') if target.startswith('/') else f'xl/{target}'
+        self.shared = _cached_shared(path, self) if 'xl/sharedStrings.xml' in names else []
+        self.dates = self._date_styles() if 'xl/styles.xml' in names else {}
+
+    def _shared_strings(self) -> List[str]:
+        strings = []
+        with self.zip.open('xl/sharedStrings.xml') as f:
+            for _, item in etree.iterparse(f, tag=f'{{{MAIN}}}si'):
+                if len(item) == 1 and item[0].tag == TEXT:  # обычная строка без форматирования
+                    strings.append(item[0].text or '')
+                else:
+                    # фонетические подсказки (rPh) - не часть текста
+                    strings.append(''.join(t.text or '' for t in item.iter(TEXT) if t.getparent().tag != PHONETIC))
+                item.clear()
+        return strings
+
+    def _date_styles(self) -> Dict[str, bool]:
+        """Номер стиля ячейки -> True для формата времени, False для даты (остальных стилей нет)."""
+        styles = etree.fromstring(self.zip.read('xl/styles.xml'))
+        custom = {int(fmt.get('numFmtId')): _format_kind(fmt.get('formatCode', ''))
+                  for fmt in styles.iter(f'{{{MAIN}}}numFmt')}
+        dates = {}
+        xfs = styles.find(f'{{{MAIN}}}cellXfs')
+        for index, xf in enumerate(xfs if xfs is not None else []):
+            fmt = int(xf.get('numFmtId', 0))
+            kind = custom.get(fmt) or ('time' if fmt in TIME_FORMATS else 'date' if fmt in DATE_FORMATS else None)
+            if kind is not None:
+                dates[str(index)] = kind == 'time'
+        return dates
+
+    def sheet_part(self, sheet: Optional[str]) -> str:
+        """Лист по имени; 'SheetN', которого нет в книге, - N-й лист (выгрузки часто переименовывают листы)."""
+        if sheet is None:
+            return next(iter(self.sheets.values()))
+        if sheet in self.sheets:
+            return self.sheets[sheet]
+        match = re.fullmatch(r'Sheet(\d+)', sheet)
+        parts = list(self.sheets.values())
+        if match and 0 < int(match[1]) <= len(parts):
+            return parts[int(match[1]) - 1]
+        raise KeyError(f"В книге нет листа {sheet!r} (есть: {', '.join(self.sheets)})")
+
+    def _cell(self, cell, kind: Optional[str], value: Optional[str]) -> str:
+        if kind == 'inlineStr':
+            return ''.join(t.text or '' for t in cell.iter(TEXT))
+        if value is None:
+            return ''
+        if kind == 'b':
+            return 'TRUE' if value == '1' else 'FALSE'
+        if kind in ('str', 'e'):
+            return value
+        style = cell.get('s')
+        if style in self.dates:
+            return _date(value, self.dates[style])
+        return _number(value)
+
+    def iter_rows(self, sheet: Optional[str]) -> Iterator[Tuple[int, List[str]]]:
+        """(номер строки с 1, значения с 0-го столбца) для непустых строк листа."""
+        shared = self.shared
+        columns = {}  # буквы столбца -> индекс: ссылок на ячейки миллионы, разных букв - десятки
+        number = 0
+        with self.zip.open(self.sheet_part(sheet)) as f:
+            for _, row in etree.iterparse(f, tag=ROW):
+                number = int(row.get('r') or number + 1)
+                values = []
+                for cell in row:
+                    if cell.tag != CELL:
+                        continue
+                    ref = cell.get('r')
+                    if ref is not None:
+                        letters = ref.rstrip('0123456789')
+                        column = columns.get(letters)
+                        if column is None:
+                            column = columns[letters] = column_index(letters)
+                        if column > len(values):
+                            values.extend([''] * (column - len(values)))
+                    kind = cell.get('t')
+                    # <v> - последний потомок ячейки (после формулы <f>); findtext заметно медленнее
+                    value = cell[-1].text if len(cell) and cell[-1].tag == VALUE else None
+                    # большинство ячеек выгрузки - текст из общих строк
+                    values.append(shared[int(value)] if kind == 's' and value is not None
+                                  else self._cell(cell, kind, value))
+                yield number, values
+                # прочитанные строки больше не нужны: память не растёт с размером листа
+                row.clear()
+                while row.getprevious() is not None:
+                    del row.getparent()[0]
+
+    def close(self) -> None:
+        self.zip.close()
+
+
+def csv_path(path: str, sheet: Optional[str]) -> str:
+    """Файл листа: папка - '<папка>/<лист>.csv', шаблон с {sheet} - подстановка, иначе сам файл."""
+    if os.path.isdir(path):
+        return os.path.join(path, f"{sheet or 'Sheet1'}.csv")
+    return path.format(sheet=sheet or 'Sheet1') if '{sheet}' in path else path
+
+
+def iter_csv_rows(path: str) -> Iterator[Tuple[int, List[str]]]:
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        # выгрузки Excel с русскими настройками разделяют поля точкой с запятой: разделитель -
+        # самый частый из ',', ';' и табуляции в первой строке (csv.Sniffer на таких файлах ошибается)
+        first = f.readline()
+        f.seek(0)
+        delimiter = max(',;\t', key=first.count)
+        yield from enumerate(csv.reader(f, delimiter=delimiter), 1)
+
+
+def _resolve(columns: Dict[str, str], fields: Dict[str, int], header: List[str]) -> Dict[int, int]:
+    """Поле раскладки -> столбец файла (буква или заголовок) в виде {позиция в строке: столбец файла}."""
+    positions = {}
+    for field, source in columns.items():
+        if field not in fields:
+            raise KeyError(f"Нет поля {field!r} в раскладке (есть: {', '.join(fields)})")
+        if re.fullmatch(r'[A-Z]{1,3}', source):
+            positions[fields[field]] = column_index(source)
+        elif source in header:
+            positions[fields[field]] = header.index(source)
+        else:
+            raise KeyError(f"Нет столбца {source!r} для поля {field!r}")
+    return positions
+
+
+def iter_file_sheet(path: str, s_range: str, columns: Optional[Dict[str, str]] = None,
+                    layout: str = 'main') -> Iterator[List[str]]:
+    """Строки диапазона s_range из .xlsx или .csv, как их вернул бы Google Sheets.
+    columns - {поле раскладки: буква столбца или заголовок в строке над диапазоном} для выгрузок
+    с другим порядком столбцов; остальные позиции берутся из тех же столбцов файла."""
+    sheet, first_row, first_col, last_col, last_row = parse_range(s_range)
+    if path.lower().endswith(('.xlsx', '.xlsm')):
+        reader = XlsxReader(path)
+        rows = reader.iter_rows(sheet)
+    else:
+        reader = None
+        rows = iter_csv_rows(csv_path(path, sheet))
+    width = last_col - first_col + 1
+    positions = None if columns else {}
+    expected = first_row
+    try:
+        for number, values in rows:
+            if last_row is not None and number > last_row:
+                break
+            if positions is None and number == first_row - 1:
+                positions = _resolve(columns, LAYOUTS[layout].get(sheet, {}), values)
+            if number < first_row:
+                continue
+            if positions is None:
+                positions = _resolve(columns, LAYOUTS[layout].get(sheet, {}), [])
+            row = values[first_col:last_col + 1]
+            if positions:
+                row.extend([''] * (width - len(row)))
+                for position, column in positions.items():
+                    row[position] = values[column] if column < len(values) else ''
+            while row and not row[-1]:
+                row.pop()
+            if not row:
+                continue
+            # пустые строки между данными Sheets отдаёт как [], в конце листа - не отдаёт
+            for _ in range(number - expected):
+                yield []
+            expected = number + 1
+            yield row
+    finally:
+        if reader is not None:
+            reader.close()
+
+
+def load_file_sheet(path: str, s_range: str, columns: Optional[Dict[str, str]] = None,
+                    layout: str = 'main') -> List[List[str]]:
+    """Замена load_google_sheet(s_id, s_range) для локальной выгрузки."""
+    return list(iter_file_sheet(path, s_range, columns, layout))
+
+
+def load_columns(path: Optional[str]) -> Dict[str, Dict[str, str]]:
+    """Сопоставление столбцов из JSON: {"Sheet1": {"surname": "Фамилия", "title": "D"}, "Sheet2": {...}}."""
+    if path is None:
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
@@ -0,0 +1,174 @@
+import io
+import re
+import zipfile
+from functools import lru_cache
+from itertools import chain
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import docx_stream
+import docx_zip
+from cancellation import checkpoint
+from docx_stream import CENTER, DOCUMENT_PART, escape, text_paragraph
+from main import ACCEPTED, convert_to_initials, format_date, recommendation_for
+
+# Серийные документы на каждого участника (сертификаты, приглашения) по шаблону .docx.
+# В шаблоне поля записываются как {{surname}}, {{title}}, {{date}} и т.д.
+# Шаблон разбирается один раз: document.xml режется на куски текста между полями,
+# и документ участника - это склейка кусков с подставленными значениями.
+
+FIELD = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+FIRST_ROW = 2  # данные начинаются со второй строки листа (A2)
+
+
+class MergeTemplate:
+    def __init__(self, template: bytes):
+        with zipfile.ZipFile(io.BytesIO(template)) as zf:
+            parts = [(name, zf.read(name)) for name in zf.namelist()]
+        # Всё, кроме document.xml, сжимается один раз и копируется в каждый документ
+        self.members = [(name, None if name == DOCUMENT_PART else docx_zip.compressed(data)) for name, data in parts]
+        pieces = FIELD.split(dict(parts)[DOCUMENT_PART].decode('utf-8'))
+        self.literals = pieces[0::2]
+        self.fields = pieces[1::2]
+        if any('{{' in literal for literal in self.literals):
+            # Word иногда режет набранное поле на несколько фрагментов разметки
+            raise ValueError("Поле шаблона разбито форматированием: наберите {{поле}} заново одним куском")
+
+    def document_xml(self, values: Dict[str, str]) -> bytes:
+        out = [self.literals[0]]
+        for field, literal in zip(self.fields, self.literals[1:]):
+            out.append(escape(values.get(field, '')))
+            out.append(literal)
+        return ''.join(out).encode('utf-8')
+
+    def render(self, values: Dict[str, str]) -> bytes:
+        buf = io.BytesIO()
+        writer = docx_zip.ZipWriter(buf, docx_zip.reproducible_date_time() if docx_zip.is_reproducible() else None)
+        for name, member in self.members:
+            if member is None:
+                writer.write(name, self.document_xml(values))
+            else:
+                writer.write_member(name, member)
+        writer.close()
+        return buf.getvalue()
+
+
+# Встроенные шаблоны в оформлении set_document_style
+
+def _certificate() -> List[str]:
+    return [
+        text_paragraph('СЕРТИФИКАТ', CENTER, bold=True),
+        text_paragraph('участника 78 Международной студенческой научной конференции ГУАП', CENTER),
+        text_paragraph('{{surname}} {{name}} {{patronymic}}', CENTER, bold=True),
+        text_paragraph('выступил(а) с докладом «{{title}}» на заседании {{session}} '
+                       'секции каф. {{department}} {{date}}.', ''),
+        text_paragraph('Решение секции: {{decision}}.', ''),
+        text_paragraph(f"Научный руководитель секции {' ' * 40}{{{{head}}}}", ''),
+    ]
+
+
+def _invitation() -> List[str]:
+    return [
+        text_paragraph('ПРИГЛАШЕНИЕ', CENTER, bold=True),
+        text_paragraph('Уважаемый(ая) {{name}} {{patronymic}}!', CENTER),
+        text_paragraph('Приглашаем вас выступить с докладом «{{title}}» на заседании {{session}} '
+                       'секции каф. {{department}} 78 МСНК ГУАП.', ''),
+        text_paragraph('Дата и время: {{date}}, {{time}}.', ''),
+        text_paragraph(f'Адрес: {docx_stream.ADDRESS} лит. А, ауд. {{{{room}}}}.', ''),
+        text_paragraph(f"Научный руководитель секции {' ' * 40}{{{{head}}}}", ''),
+    ]
+
+
+BUILTIN_TEMPLATES = {
+    'certificate': _certificate,
+    'invitation': _invitation,
+}
+
+# Кому документ положен (список разрешённых решений): сертификат - только за принятый доклад;
+# без решения (заседание ещё не прошло) или с «доклад плохо подготовлен» сертификата нет.
+# Виды документов без записи здесь получают все участники
+ALLOWED_DECISIONS = {
+    'certificate': ACCEPTED,
+}
+
+
+@lru_cache(maxsize=None)
+def builtin_template(kind: str) -> bytes:
+    return docx_stream.render_docx(BUILTIN_TEMPLATES[kind]())
+
+
+def participant_fields(row: List[str], tech_data: List[List[str]]) -> Dict[str, str]:
+    """Значения полей шаблона для строки участника."""
+    tech_row = tech_data[int(row[15]) - 1]
+    head = tech_data[0]
+    return {
+        'surname': row[7],
+        'name': row[8],
+        'patronymic': row[9],
+        'initials': convert_to_initials(row[7] + ' ' + row[8] + ' ' + row[9]),
+        'group': row[11],
+        'status': row[12],
+        'title': row[13],
+        'session': row[15],
+        'date': format_date(tech_row[11]),
+        'time': tech_row[12],
+        'room': tech_row[13],
+        'decision': recommendation_for(row),
+        'department': f"{head[0]}. {head[1]}",
+        'head': convert_to_initials(head[2]),
+    }
+
+
+def file_name(position: int, fields: Dict[str, str], kind: str) -> str:
+    name = re.sub(r'[\\/:*?"<>|]', '', f"{position + FIRST_ROW:05d} {fields['initials']} {kind}.docx")
+    return name.strip()
+
+
+# Рендеринг в рабочих процессах общего пула (docx_stream.process_pool): задание - пачка
+# участников вместе с шаблоном, шаблон разбирается один раз на процесс, пока он не сменится
+
+MERGE_BATCH = 16
+_worker_template: Optional[Tuple[bytes, MergeTemplate]] = None
+
+
+def _render_batch(job: Tuple[bytes, List[Dict[str, str]]]) -> List[bytes]:
+    global _worker_template
+    template, batch = job
+    if _worker_template is None or _worker_template[0] != template:
+        _worker_template = (template, MergeTemplate(template))
+    return [_worker_template[1].render(fields) for fields in batch]
+
+
+def _scheduled(row: List[str], tech_data: List[List[str]]) -> bool:
+    """Номер заседания есть и у заседания есть строка техлиста (номер 0 не уводит к tech_data[-1])."""
+    return len(row) > 15 and row[15].isdigit() and 1 <= int(row[15]) <= len(tech_data)
+
+
+def iter_merge(student_data: List[List[str]], tech_data: List[List[str]], template: bytes, kind: str,
+               session: Optional[int] = None, workers: Optional[int] = None,
+               decisions: Optional[Tuple[str, ...]] = None) -> Iterator[Tuple[str, bytes]]:
+    """(имя файла, .docx) на каждого участника с номером заседания, в порядке листа;
+    если задан decisions (см. ALLOWED_DECISIONS) - только участникам с одним из этих решений."""
+    participants = [
+        (position, participant_fields(row, tech_data))
+        for position, row in enumerate(student_data)
+        if _scheduled(row, tech_data) and (session is None or int(row[15]) == session)
+        and (decisions is None or (len(row) > 16 and row[16] in decisions))
+    ]
+    names = [file_name(position, fields, kind) for position, fields in participants]
+    values = [fields for _, fields in participants]
+    if workers == 1:
+        merge = MergeTemplate(template)
+        documents = map(merge.render, values)
+    else:
+        batches = ((template, values[start:start + MERGE_BATCH]) for start in range(0, len(values), MERGE_BATCH))
+        documents = chain.from_iterable(docx_stream.map_ordered(_render_batch, batches, workers))
+    for done, item in enumerate(zip(names, documents), 1):
+        yield item
+        checkpoint('render', done, len(names))
+
+
+def iter_merge_zip(student_data: List[List[str]], tech_data: List[List[str]], template: bytes, kind: str,
+                   session: Optional[int] = None, workers: Optional[int] = None,
+                   decisions: Optional[Tuple[str, ...]] = None) -> Iterator[bytes]:
+    """ZIP со всеми документами, отдаваемый кусками (сами .docx уже сжаты, поэтому без сжатия)."""
+    return docx_stream.iter_zip(iter_merge(student_data, tech_data, template, kind, session, workers, decisions))
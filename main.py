@@ -1,10 +1,21 @@
 import docx
 import os
+import sys
 from docx.shared import Pt, Cm
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from googleapiclient.discovery import build
 from google.oauth2.service_account import Credentials
 from datetime import datetime
+from pdf_export import PdfConverterPool
+from validation import validate_data, format_problems
+from sheet_store import SheetStore
+from docx_zip import save_docx
+from session_assignment import StaleAssignment, assign_sessions, apply_assignment, write_assignment, format_assignment
+from ordering import order_data, PARTICIPANT_ORDERS, SESSION_ORDERS
+from output_store import OutputStore, default_path
+from sheet_data import data_revision
+from cancellation import checkpoint
+from tracing import span, start_span
 
 # Загрузка данных из Google Sheets
 def load_google_sheet(s_id, s_range):
@@ -41,6 +52,22 @@ def convert_to_initials(full_name):
         return full_name
     
 
+# Решение секции (столбец Q): код -> текст в отчёте; пустой код - решения ещё нет
+RECOMMENDATIONS = {
+    "1": "опубликовать доклад в сборнике МСНК",
+    "2": ("опубликовать доклад в сборнике МСНК; "
+          "рекомендовать к участию в финале конкурса "
+          "на лучшую студенческую научную работу ГУАП"),
+    "0": "доклад плохо подготовлен",
+}
+NO_DECISION = "нет данных"
+ACCEPTED = ("1", "2")  # доклады, представляемые к публикации
+
+
+def recommendation_for(row):
+    return RECOMMENDATIONS.get(row[16], NO_DECISION) if len(row) > 16 else NO_DECISION
+
+
 def format_date(date_str):
     months = {
         '01': 'января', '02': 'февраля', '03': 'марта', '04': 'апреля',
@@ -50,7 +77,16 @@ def format_date(date_str):
     date = datetime.strptime(date_str, "%Y-%m-%d")
     return f"{date.day} {months[date.strftime('%m')]} {date.year}г."
 
-def generate_conference_program(student_data, tech_data):
+# Сохранение документа со span (в v4 - этап трассировки запроса): сколько байт записано
+def save_traced(doc, file_path):
+    with span("save", path=file_path) as save_span:
+        save_docx(doc, file_path)
+        save_span.set(bytes=os.path.getsize(file_path))
+
+# Генераторы документов 1-3 на python-docx - для CLI, watch и движка docx в v4; потоковые
+# движки v4 рендерят те же документы по шаблонам templates/*.json (doc_templates).
+# Контрольные точки отмены и span заседаний вне запроса v4 ничего не делают
+def generate_conference_program(student_data, tech_data, file_path='report/2 Программа конференции.docx'):
     doc = docx.Document()
     set_document_style(doc)
 
@@ -95,6 +131,8 @@ def generate_conference_program(student_data, tech_data):
     max_value = max([int(row[15]) for row in student_data if row[15].isdigit()])
     
     for cur_num in range(1, max_value + 1):
+        checkpoint("render", cur_num - 1, max_value)
+        session_span = start_span("render.session", session=cur_num)
         
         # Заседание
         session_heading = doc.add_paragraph(f'Заседание {str(cur_num)}', style='Normal')
@@ -120,10 +158,13 @@ def generate_conference_program(student_data, tech_data):
                 doc.add_paragraph(f'{participant_num}. {initials}', style='Normal')
                 doc.add_paragraph(f'{row[13]}', style='Normal')
                 participant_num += 1
+        session_span.end(participants=participant_num - 1)
                 
-    doc.save('report/2 Программа конференции.docx')
+    checkpoint("save")
+    save_traced(doc, file_path)
+    return file_path
 
-def generate_conference_report(student_data, tech_data):
+def generate_conference_report(student_data, tech_data, file_path='report/2 Отчёт о конференции.docx'):
     doc = docx.Document()
     set_document_style(doc)
 
@@ -146,6 +187,8 @@ def generate_conference_report(student_data, tech_data):
     max_value = max([int(row[15]) for row in student_data if row[15].isdigit()])
     
     for cur_num in range(1, max_value + 1):
+        checkpoint("render", cur_num - 1, max_value)
+        session_span = start_span("render.session", session=cur_num)
         
         session_heading = doc.add_paragraph(f'Заседание {str(cur_num)}', style='Normal')
         session_heading.runs[0].bold = True
@@ -167,6 +210,7 @@ def generate_conference_report(student_data, tech_data):
         )
 
         # Таблица для списка докладов
+        table_span = start_span("render.table", session=cur_num)
         table = doc.add_table(rows=1, cols=4)
         table.style = 'Table Grid'
         
@@ -188,17 +232,7 @@ def generate_conference_report(student_data, tech_data):
             if int(row[15]) == cur_num:
                 initials = row[7] + " " + row[8] + " " + row[9]
                 status = f"{row[12]} Гр. № {row[11]}" if row[11] else row[12]
-                if len(row) > 16:
-                    if row[16] == "1":
-                        recommendation = "опубликовать доклад в сборнике МСНК"
-                    elif row[16] == "2":
-                        recommendation = ("опубликовать доклад в сборнике МСНК; "
-                                          "рекомендовать к участию в финале конкурса "
-                                          "на лучшую студенческую научную работу ГУАП")
-                    elif row[16] == "0":
-                        recommendation = "доклад плохо подготовлен"
-                else:
-                    recommendation = "нет данных"
+                recommendation = recommendation_for(row)
 
                 row_cells = table.add_row().cells
                 row_cells[0].text = str(participant_num)
@@ -211,15 +245,19 @@ def generate_conference_report(student_data, tech_data):
                     paragraph.paragraph_format.first_line_indent = Cm(0)
 
                 participant_num += 1
+        table_span.end(rows=participant_num)
 
         doc.add_paragraph()
+        session_span.end(participants=participant_num - 1)
 
     doc.add_paragraph("Подпись научного руководителя секции", style='Normal')
 
-    doc.save('report/2 Отчёт о конференции.docx')
+    checkpoint("save")
+    save_traced(doc, file_path)
+    return file_path
 
 
-def generate_conference_list(student_data, tech_data):
+def generate_conference_list(student_data, tech_data, file_path='report/2 Список представляемых к публикации докладов.docx'):
     doc = docx.Document()
     set_document_style(doc)
 
@@ -238,7 +276,7 @@ def generate_conference_list(student_data, tech_data):
 
     # Пополнение списка студентов
     for row in student_data:
-        if len(row) > 16 and row[16] == "1" or row[16] == "2":
+        if len(row) > 16 and row[16] in ACCEPTED:
             combined_paragraph = doc.add_paragraph()
             
             name_run = combined_paragraph.add_run(convert_to_initials(row[7] + " " + row[8] + " " + row[9]))
@@ -249,8 +287,9 @@ def generate_conference_list(student_data, tech_data):
     doc.add_paragraph("\n" * 2)
     doc.add_paragraph(f"Руководитель УНИДС {' ' * 40}{convert_to_initials(tech_data[0][2])}")
 
-
-    doc.save('report/2 Список представляемых к публикации докладов.docx')
+    checkpoint("save")
+    save_traced(doc, file_path)
+    return file_path
 
 if __name__ == "__main__":
 
@@ -260,29 +299,134 @@ if __name__ == "__main__":
     sheet_id = '1MROr3Pw7nMG2vYW_AeqIy2q9FTF7URD3b24tyrBYWgE'
     student_range = 'Sheet1!A2:S' 
     tech_range = 'Sheet2!A2:N'
+
+    # python main.py watch [--interval 5] [--debounce 3] [--fake листы.json] [--pdf] - документы 1-3
+    # перерисовываются сами после правок таблицы (watch импортирует main, поэтому импорт здесь)
+    if sys.argv[1:2] == ['watch']:
+        from watch import main as watch
+        watch(sys.argv[2:], sheet_id, (student_range, tech_range))
+        sys.exit()
     
-    student_data = load_google_sheet(sheet_id, student_range)
-    tech_data = load_google_sheet(sheet_id, tech_range)
+    def option(name):
+        return sys.argv[sys.argv.index(name) + 1] if name in sys.argv[:-1] else None
+
+    # python main.py --source выгрузка.xlsx (или папка с Sheet1.csv и Sheet2.csv) [--columns столбцы.json] -
+    # данные из локальной выгрузки вместо Google Sheets (file_source)
+    source = option('--source')
+    if source is not None:
+        from file_source import load_file_sheet, load_columns
+        columns = load_columns(option('--columns'))
+        sheet_id = os.path.abspath(source)  # ключ зеркала - файл выгрузки
+
+        def load_sheet(s_id, s_range):
+            return load_file_sheet(source, s_range, columns.get(s_range.split('!')[0]))
+    else:
+        load_sheet = load_google_sheet
+
+    # Локальное зеркало таблицы: данные обновляются перед каждым документом,
+    # в базу пишутся только изменившиеся строки
+    store = SheetStore('report/sheets.sqlite')
+
+    def refresh():
+        for s_range in (student_range, tech_range):
+            stats = store.sync(sheet_id, s_range, load_sheet(sheet_id, s_range))
+            print(f"{s_range}: добавлено {stats.inserted}, изменено {stats.updated}, "
+                  f"удалено {stats.deleted} ({stats.seconds * 1000:.0f} мс)")
+        return store.values(sheet_id, student_range), store.values(sheet_id, tech_range)
     
+    # python main.py --order surname|group [--session-order datetime] - участники заседания по фамилии
+    # (по русскому алфавиту) или по группе, заседания - по дате и времени; ключи сортировки общие
+    # для документов 1-3 и считаются заново только после изменения данных
+    participant_order = option('--order') or 'sheet'
+    session_order = option('--session-order') or 'number'
+    if participant_order not in PARTICIPANT_ORDERS or session_order not in SESSION_ORDERS:
+        sys.exit(f"--order: {', '.join(PARTICIPANT_ORDERS)}; --session-order: {', '.join(SESSION_ORDERS)}")
+
+    def ordered():
+        return order_data(student_data, tech_data, participant_order, session_order)
+
+    # Документ пишется во временный файл задания и публикуется версией по ревизии данных в
+    # report/outputs, а файл в report/ заменяется её копией одним rename: параллельные запуски
+    # (и main.py watch) не портят файлы друг друга; старые версии удаляет фоновая сборка
+    outputs = OutputStore('report/outputs')
+    outputs.start()
+    PREVIEW_PATH = 'report/programme_preview.docx'
+
+    def render(generate, latest=None):
+        student_rows, tech_rows = ordered()
+        return outputs.render(generate, student_rows, tech_rows, data_revision(student_rows, tech_rows),
+                              latest=latest or default_path(generate))
+
+    # python main.py --pdf - дополнительно сохранять документы в PDF
+    pdf_pool = PdfConverterPool(size=1) if '--pdf' in sys.argv else None
+
+    def export(file_path):
+        if pdf_pool is not None:
+            print(f"PDF: {pdf_pool.convert(file_path)}")
+
+    # Проверка данных перед рендерингом: печатаем все проблемы сразу
+    def data_ok(document):
+        problems = validate_data(student_data, tech_data, document)
+        if problems:
+            print("Документ не составлен, исправьте данные в таблице:")
+            print(format_problems(problems))
+        return not problems
+
     # CLI для выбора типа документа
     print("Какой документ хотите составить?")
     print("1. Программа конференции")
     print("2. Отчёт о конференции")
     print("3. Список представляемых к публикации докладов")
+    print("4. Распределить участников без заседания (с предпросмотром программы)")
+    print("5. Сборник материалов (тексты принятых докладов из папки submissions)")
     print("0. Выйти")
     while True:
-        document_type = input("Введите номер документа (1, 2 или 3): ")
+        document_type = input("Введите номер документа (1, 2, 3, 4 или 5): ")
+        if document_type in ('1', '2', '3', '4', '5'):
+            student_data, tech_data = refresh()
         if document_type == '1':
-            generate_conference_program(student_data, tech_data)
-            print("Сгенерирована программа конференции.")
+            if data_ok('programme'):
+                export(render(generate_conference_program))
+                print("Сгенерирована программа конференции.")
         elif document_type == '2':
-            generate_conference_report(student_data, tech_data)
-            print("Сгенерирован отчет о конференции.")
+            if data_ok('report'):
+                export(render(generate_conference_report))
+                print("Сгенерирован отчет о конференции.")
         elif document_type == '3':
-            generate_conference_list(student_data, tech_data)
-            print("Сгенерирован список представляемых к публикации докладов")
+            if data_ok('publications'):
+                export(render(generate_conference_list))
+                print("Сгенерирован список представляемых к публикации докладов")
+        elif document_type == '4':
+            assignment = assign_sessions(student_data, tech_data)
+            print(format_assignment(assignment))
+            planned = student_data
+            student_data = apply_assignment(student_data, assignment)
+            if assignment.sessions and data_ok('programme'):
+                # предпросмотр - в свой файл: программа в report/ остаётся по данным таблицы,
+                # пока номера заседаний не записаны
+                print(f"Предпросмотр программы: {render(generate_conference_program, PREVIEW_PATH)}")
+                if source is not None:
+                    print("Данные из выгрузки: номера заседаний нужно внести в таблицу вручную")
+                elif input("Записать номера заседаний в таблицу? (да/нет): ").strip().lower() in ('да', 'д', 'y'):
+                    try:
+                        print(f"Записано ячеек: {write_assignment(sheet_id, assignment, planned)}")
+                    except StaleAssignment as e:
+                        print(f"Таблица изменилась после распределения, номера не записаны: {e.positions}; "
+                              f"обновите данные и распределите заново")
+        elif document_type == '5':
+            # docx_stream и proceedings сами импортируют main, поэтому импорт здесь
+            from proceedings import generate_proceedings, format_volume
+            if not os.path.isdir('submissions'):
+                print("Нет папки submissions с файлами докладов (имя файла начинается с номера строки листа)")
+            elif data_ok('publications'):
+                file_path, volume = generate_proceedings(student_data, tech_data)
+                print(format_volume(volume))
+                export(file_path)
+                print("Сгенерирован сборник материалов.")
         elif document_type == '0':
             print("Завершение программы")
+            if pdf_pool is not None:
+                pdf_pool.close()
             break
         else:
             print("Ошибка: Неправильный формат ввода.")
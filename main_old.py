@@ -1,5 +1,6 @@
 import docx
 import os
+import sys
 from docx.shared import Pt, Cm
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from googleapiclient.discovery import build
@@ -235,8 +236,16 @@ if __name__ == "__main__":
     student_range = 'Sheet1!A2:L' 
     tech_range = 'Sheet2!A2:M'
     
-    student_data = load_google_sheet(student_sheet_id, student_range)
-    tech_data = load_google_sheet(tech_sheet_id, tech_range)
+    # python main_old.py --source выгрузка.xlsx (или папка с Sheet1.csv и Sheet2.csv) [--columns столбцы.json]
+    if '--source' in sys.argv[:-1]:
+        from file_source import load_file_sheet, load_columns
+        source = sys.argv[sys.argv.index('--source') + 1]
+        columns = load_columns(sys.argv[sys.argv.index('--columns') + 1] if '--columns' in sys.argv[:-1] else None)
+        student_data = load_file_sheet(source, student_range, columns.get('Sheet1'), layout='old')
+        tech_data = load_file_sheet(source, tech_range, columns.get('Sheet2'), layout='old')
+    else:
+        student_data = load_google_sheet(student_sheet_id, student_range)
+        tech_data = load_google_sheet(tech_sheet_id, tech_range)
     
     # CLI для выбора типа документа
     print("Какой документ хотите составить?")
@@ -0,0 +1,175 @@
+import ctypes
+import ctypes.util
+import gc
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, OrderedDict
+from typing import List, Optional
+
+# Диагностика памяти долгоживущего процесса: RSS, tracemalloc (старт/стоп, самые большие
+# места выделения, разница снимков) и число живых объектов python-docx и lxml.
+# Всё относится к одному процессу: при uvicorn --workers N у каждого воркера свои снимки.
+
+SNAPSHOT_LIMIT = 5  # снимки сами занимают память, старые вытесняются
+OBJECT_MODULES = ('docx', 'lxml')
+# Выделения самого tracemalloc и загрузчика модулей в отчётах только мешают
+IGNORED = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+GROUPS = ('lineno', 'filename', 'traceback')
+
+
+def rss_bytes() -> int:
+    """Текущий RSS процесса; где нет /proc - пиковый."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def collect_documents() -> int:
+    """Сборка молодых поколений после рендеринга python-docx. Документ python-docx - цикл ссылок
+    (пакет <-> части), а его деревья lxml лежат вне кучи Python: для сборщика мусора документ
+    мал, и мёртвые документы копятся до редкой полной сборки, раздувая RSS. Несколько мс на документ."""
+    return gc.collect(1)
+
+
+_libc = None
+
+
+def _malloc_trim() -> bool:
+    global _libc
+    if _libc is None:
+        name = ctypes.util.find_library('c')
+        _libc = ctypes.CDLL(name) if name else False
+    trim = getattr(_libc, 'malloc_trim', None)  # только glibc
+    return bool(trim and trim(0))
+
+
+def release() -> dict:
+    """Полная сборка мусора и возврат свободной памяти malloc системе."""
+    before = rss_bytes()
+    collected = gc.collect()
+    trimmed = _malloc_trim()
+    return {'collected': collected, 'trimmed': trimmed, 'rss_before': before, 'rss_after': rss_bytes()}
+
+
+def _stat(stat) -> dict:
+    frames = [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback]
+    return {'site': frames[0] if frames else None, 'traceback': frames, 'size': stat.size, 'count': stat.count}
+
+
+def _diff(stat) -> dict:
+    return {**_stat(stat), 'size_diff': stat.size_diff, 'count_diff': stat.count_diff}
+
+
+def object_counts(collect: bool = True, limit: int = 30) -> dict:
+    """Живые объекты классов из OBJECT_MODULES (сами классы не считаются); collect - сначала gc.collect()."""
+    unreachable = gc.collect() if collect else None
+    counts = Counter()
+    for obj in gc.get_objects():
+        cls = type(obj)
+        module = getattr(cls, '__module__', None)
+        if isinstance(module, str) and module.startswith(OBJECT_MODULES) and not isinstance(obj, type):
+            counts[f"{module}.{cls.__qualname__}"] += 1
+    return {'collected': unreachable, 'gc_counts': gc.get_count(), 'total': sum(counts.values()),
+            'types': dict(counts.most_common(limit))}
+
+
+class MemoryDiagnostics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshots = OrderedDict()  # имя -> (время, снимок)
+        self.started_at = None
+
+    def start(self, frames: int = 1) -> dict:
+        with self._lock:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+            tracemalloc.start(frames)
+            self.started_at = time.time()
+            self._snapshots.clear()  # снимки до перезапуска несравнимы с новыми
+        return self.status()
+
+    def stop(self) -> dict:
+        with self._lock:
+            tracemalloc.stop()
+            self.started_at = None
+            self._snapshots.clear()
+        return self.status()
+
+    def _require_tracing(self) -> None:
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is not running")
+
+    def status(self) -> dict:
+        tracing = tracemalloc.is_tracing()
+        current, peak = tracemalloc.get_traced_memory() if tracing else (None, None)
+        return {
+            'pid': os.getpid(),
+            'rss_bytes': rss_bytes(),
+            'peak_rss_bytes': peak_rss_bytes(),
+            'tracemalloc': {
+                'tracing': tracing,
+                'frames': tracemalloc.get_traceback_limit() if tracing else None,
+                'started_at': self.started_at,
+                'traced_bytes': current,
+                'traced_peak_bytes': peak,
+                'overhead_bytes': tracemalloc.get_tracemalloc_memory() if tracing else None,
+            },
+            'snapshots': [{'name': name, 'taken_at': taken_at} for name, (taken_at, _) in self._snapshots.items()],
+            'gc_counts': gc.get_count(),
+        }
+
+    def _take(self) -> tracemalloc.Snapshot:
+        self._require_tracing()
+        return tracemalloc.take_snapshot().filter_traces(IGNORED)
+
+    def top(self, limit: int = 20, group: str = 'lineno') -> List[dict]:
+        """Места с наибольшим объёмом живых выделений сейчас."""
+        return [_stat(stat) for stat in self._take().statistics(group)[:limit]]
+
+    def snapshot(self, name: Optional[str] = None) -> dict:
+        snapshot = self._take()
+        with self._lock:
+            name = name or f"s{len(self._snapshots) + 1}-{int(time.time())}"
+            self._snapshots.pop(name, None)
+            self._snapshots[name] = (time.time(), snapshot)
+            while len(self._snapshots) > SNAPSHOT_LIMIT:
+                self._snapshots.popitem(last=False)
+        return {'name': name, 'traced_bytes': sum(stat.size for stat in snapshot.statistics('filename'))}
+
+    def diff(self, before: str, after: Optional[str] = None, limit: int = 20, group: str = 'lineno') -> dict:
+        """Что выросло между снимками before и after (без after - между before и текущим моментом)."""
+        with self._lock:
+            if before not in self._snapshots or (after is not None and after not in self._snapshots):
+                raise KeyError(after if before in self._snapshots else before)
+            old = self._snapshots[before][1]
+            new = self._snapshots[after][1] if after is not None else None
+        if new is None:
+            new = self._take()
+        stats = new.compare_to(old, group)
+        return {
+            'before': before,
+            'after': after or 'now',
+            'size_diff': sum(stat.size_diff for stat in stats),
+            'count_diff': sum(stat.count_diff for stat in stats),
+            'top': [_diff(stat) for stat in stats[:limit]],
+        }
+
+
+diagnostics = MemoryDiagnostics()
@@ -0,0 +1,164 @@
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sheet_data import data_revision
+
+# Порядок заседаний и участников в документах: участники внутри заседания - как в листе, по
+# фамилии (по русскому алфавиту, ё рядом с е) или по группе; заседания - по номеру или по дате
+# и времени. Ключи сортировки считаются один раз на ревизию данных и общие для программы, отчёта
+# и списка публикаций. Документ получает уже упорядоченные строки, поэтому генераторы
+# (python-docx, docx_stream, шаблоны) не меняются.
+
+PARTICIPANT_ORDERS = ('sheet', 'surname', 'group')
+SESSION_ORDERS = ('number', 'datetime')
+
+ALPHABET = 'абвгдеёжзийклмнопрстуфхцчшщъыьэюя'
+LATIN = 'abcdefghijklmnopqrstuvwxyz'
+HEAD_WIDTH = 11  # столбцы A:K первой строки техлиста - данные секции, а не заседания
+
+
+def _table(distinguish_yo: bool) -> Dict[int, str]:
+    # буквы - в область частного использования по порядку алфавита: кириллица перед латиницей,
+    # цифры, пробел и дефис остаются ниже букв
+    table = {ord(letter): chr(0xE000 + index) for index, letter in enumerate(ALPHABET)}
+    if not distinguish_yo:
+        table[ord('ё')] = table[ord('е')]
+    table.update({ord(letter): chr(0xE100 + index) for index, letter in enumerate(LATIN)})
+    return table
+
+
+# Как в словарях: на первом уровне ё равна е, на втором - идёт сразу после неё
+PRIMARY = _table(False)
+SECONDARY = _table(True)
+
+
+def collation_key(text: str) -> Tuple[str, str, str]:
+    """Ключ для сравнения строк по русскому алфавиту; без locale, одинаковый на любой машине
+    (в Unicode ё стоит после я, а заглавные - перед всеми строчными)."""
+    folded = text.strip().casefold()
+    return folded.translate(PRIMARY), folded.translate(SECONDARY), text
+
+
+def _cell(row: List[str], index: int) -> str:
+    return row[index] if len(row) > index else ''
+
+
+def name_key(row: List[str]) -> Tuple[str, str, str]:
+    # \x00 ниже любого символа: «Ли Анна» раньше «Лиам Бориса»
+    return collation_key('\x00'.join((_cell(row, 7), _cell(row, 8), _cell(row, 9))))
+
+
+def group_key(group: str) -> tuple:
+    """Номер группы: числа сравниваются как числа ('4331' < '4331К' < 'М411'), без группы - в конце."""
+    parts = re.split(r'(\d+)', group.strip().casefold())
+    return (not group.strip(),) + tuple(
+        int(part) if index % 2 else part.translate(PRIMARY) for index, part in enumerate(parts))
+
+
+def _moment(tech_row: List[str]) -> tuple:
+    try:
+        day = datetime.strptime(_cell(tech_row, 11).strip(), '%Y-%m-%d').toordinal()
+    except ValueError:
+        return (1,)  # без даты - после датированных, в порядке номеров
+    match = re.match(r'(\d{1,2})[:.](\d{2})', _cell(tech_row, 12).strip())
+    return (0, day, int(match[1]) * 60 + int(match[2]) if match else 0)
+
+
+class SortKeys:
+    """Ключи одной ревизии данных; перестановки и упорядоченные строки считаются при первом
+    запросе порядка и дальше отдаются готовыми (генераторы строки не меняют)."""
+
+    def __init__(self, student_data: List[List[str]], tech_data: List[List[str]]):
+        self.student_data = student_data
+        self.tech_data = tech_data
+        self._names = None
+        self._permutations: Dict[str, List[int]] = {}
+        self._session_numbers = None
+        self._ordered: Dict[Tuple[str, str], Tuple[List[List[str]], List[List[str]]]] = {}
+
+    def names(self) -> list:
+        if self._names is None:
+            self._names = [name_key(row) for row in self.student_data]
+        return self._names
+
+    def permutation(self, order: str) -> List[int]:
+        """Позиции строк в порядке order; при равных ключах - в порядке листа."""
+        if order not in self._permutations:
+            names = self.names()
+            if order == 'surname':
+                keys = names
+            elif order == 'group':
+                keys = [(group_key(_cell(row, 11)), name) for row, name in zip(self.student_data, names)]
+            else:
+                raise ValueError(f"Неизвестный порядок участников: {order!r} (есть: {', '.join(PARTICIPANT_ORDERS)})")
+            self._permutations[order] = sorted(range(len(keys)), key=keys.__getitem__)
+        return self._permutations[order]
+
+    def session_numbers(self) -> Dict[int, int]:
+        """Старый номер заседания -> новый по дате и времени; только для заседаний, которые выводят
+        документы (1..наибольший номер у участников), и только изменившиеся."""
+        if self._session_numbers is None:
+            used = [int(row[15]) for row in self.student_data if len(row) > 15 and row[15].isdigit()]
+            count = min(max(used, default=0), len(self.tech_data))
+            moments = sorted(range(1, count + 1), key=lambda number: (_moment(self.tech_data[number - 1]), number))
+            self._session_numbers = {old: new for new, old in enumerate(moments, 1) if old != new}
+        return self._session_numbers
+
+    def ordered(self, participants: str, sessions: str) -> Tuple[List[List[str]], List[List[str]]]:
+        key = (participants, sessions)
+        if key not in self._ordered:
+            self._ordered[key] = self._arrange(participants, sessions)
+        return self._ordered[key]
+
+    def _arrange(self, participants: str, sessions: str) -> Tuple[List[List[str]], List[List[str]]]:
+        student_data, tech_data = self.student_data, self.tech_data
+        if participants != 'sheet':
+            student_data = [student_data[position] for position in self.permutation(participants)]
+        numbers = self.session_numbers() if sessions == 'datetime' else {}
+        if numbers:
+            student_data = [row[:15] + [str(numbers[int(row[15])])] + row[16:]
+                            if len(row) > 15 and row[15].isdigit() and int(row[15]) in numbers else row
+                            for row in student_data]
+            moved = {new: old for old, new in numbers.items()}
+            # строка техлиста с новым номером - данные заседания со старым номером; A:K остаются на месте
+            tech_data = [(row + [''] * (HEAD_WIDTH - len(row)))[:HEAD_WIDTH] + tech_data[moved[number] - 1][HEAD_WIDTH:]
+                         if number in moved else row
+                         for number, row in enumerate(tech_data, 1)]
+        return student_data, tech_data
+
+
+_cache = OrderedDict()
+_lock = threading.Lock()  # кэш общий для потоков запросов FastAPI
+CACHE_SIZE = 4  # ревизия держит упорядоченные копии строк
+
+
+def sort_keys(student_data: List[List[str]], tech_data: List[List[str]], revision: Optional[str] = None) -> SortKeys:
+    """SortKeys с кэшем по ревизии данных (ревизия считается, если не передана)."""
+    key = revision or data_revision(student_data, tech_data)
+    with _lock:
+        keys = _cache.get(key)
+        if keys is not None:
+            _cache.move_to_end(key)
+            return keys
+        keys = _cache[key] = SortKeys(student_data, tech_data)  # ключи считаются позже, по запросу
+        if len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return keys
+
+
+def is_default(participants: str = 'sheet', sessions: str = 'number') -> bool:
+    return participants == 'sheet' and sessions == 'number'
+
+
+def order_data(student_data: List[List[str]], tech_data: List[List[str]], participants: str = 'sheet',
+               sessions: str = 'number', revision: Optional[str] = None) -> Tuple[List[List[str]], List[List[str]]]:
+    """Строки в порядке вывода - новые списки, общие для всех документов ревизии (исходные не
+    меняются); при sessions='datetime' заседания перенумеровываются по времени вместе со строками техлиста."""
+    if sessions not in SESSION_ORDERS:
+        raise ValueError(f"Неизвестный порядок заседаний: {sessions!r} (есть: {', '.join(SESSION_ORDERS)})")
+    if is_default(participants, sessions):
+        return student_data, tech_data
+    return sort_keys(student_data, tech_data, revision).ordered(participants, sessions)
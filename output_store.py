@@ -0,0 +1,228 @@
+import inspect
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional, Tuple
+
+# Каталог готовых документов, общий для параллельных запусков (CLI, watch, воркеры v4).
+# Каждое задание пишет в свой временный файл и публикует его одним rename: читатель видит
+# либо прежнюю версию, либо новую целиком, а два запуска не пишут в один файл. Версии лежат
+# по ревизии данных - <root>/<ревизия>/<имя>; время изменения файла - время последнего
+# обращения (LRU), и фоновая сборка удаляет самые давние версии, пока каталог больше
+# max_bytes, и версии старше max_age. Отдельного индекса нет: состояние - сама файловая
+# система, поэтому хранилище можно делить между процессами без блокировок.
+
+TEMP_DIR = '.tmp'
+TEMP_TTL = 3600.0  # временные файлы заданий, упавших вместе с процессом
+GRACE = 60.0  # только что опубликованные и прочитанные версии сборка не трогает
+
+
+def _remove(path: str) -> bool:
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def _scandir(path: str) -> List[os.DirEntry]:
+    """Содержимое каталога; каталога ещё нет (ничего не записано) или его уже удалили - пусто."""
+    try:
+        with os.scandir(path) as entries:
+            return list(entries)
+    except FileNotFoundError:
+        return []
+
+
+def write_atomic(write: Callable[[str], None], file_path: str) -> str:
+    """write(путь) во временный файл рядом с file_path и замена file_path одним rename:
+    открытый в Word или копируемый файл никогда не бывает наполовину записанным."""
+    directory, name = os.path.split(file_path)
+    temp = os.path.join(directory, f".{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        write(temp)
+        os.replace(temp, file_path)
+    finally:
+        _remove(temp)
+    return file_path
+
+
+def save_atomic(doc, file_path: str) -> str:
+    """doc.save для документа python-docx через write_atomic."""
+    return write_atomic(doc.save, file_path)
+
+
+def default_path(generate: Callable) -> str:
+    """Путь, куда генератор пишет по умолчанию (параметр file_path)."""
+    return inspect.signature(generate).parameters['file_path'].default
+
+
+def _revision_dir(revision: str) -> str:
+    if not revision or revision.startswith('.') or '/' in revision or os.sep in revision:
+        raise ValueError(f"Недопустимая ревизия: {revision!r}")
+    return revision
+
+
+class OutputStore:
+    def __init__(self, root: str, max_bytes: Optional[int] = 256 * 2 ** 20, max_age: Optional[float] = None,
+                 grace: float = GRACE):
+        # каталоги создаются при первой записи, а не при создании объекта (импорт v4 ничего не пишет)
+        self.root = root
+        self.temp_dir = os.path.join(root, TEMP_DIR)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.grace = grace
+        self.published = 0
+        self.removed = 0
+        self.freed_bytes = 0
+        self.gc_runs = 0
+        self.gc_seconds = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @contextmanager
+    def temp_path(self, suffix: str = '') -> Iterator[str]:
+        """Путь для файла одного задания; неопубликованный файл удаляется при выходе."""
+        os.makedirs(self.temp_dir, exist_ok=True)
+        path = os.path.join(self.temp_dir, f"{os.getpid()}-{uuid.uuid4().hex}{suffix}")
+        try:
+            yield path
+        finally:
+            _remove(path)
+
+    def path(self, name: str, revision: str) -> str:
+        return os.path.join(self.root, _revision_dir(revision), os.path.basename(name))
+
+    def publish(self, temp: str, name: str, revision: str) -> str:
+        """Переносит готовый временный файл в версию (name, revision) одним rename."""
+        target = self.path(name, revision)
+        while True:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            try:
+                os.replace(temp, target)
+                break
+            except FileNotFoundError:
+                if not os.path.exists(temp):
+                    raise
+                # сборка удалила пустой каталог ревизии между makedirs и rename
+        self.published += 1
+        return target
+
+    def lookup(self, name: str, revision: str) -> Optional[str]:
+        """Путь к версии или None; обращение продлевает версии жизнь (время изменения - сейчас)."""
+        target = self.path(name, revision)
+        try:
+            os.utime(target)
+        except FileNotFoundError:
+            return None
+        return target
+
+    def read(self, name: str, revision: str) -> Optional[bytes]:
+        target = self.lookup(name, revision)
+        if target is None:
+            return None
+        try:
+            with open(target, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def render(self, generate: Callable, student_data: List[List[str]], tech_data: List[List[str]], revision: str,
+               latest: Optional[str] = None) -> str:
+        """generate(student_data, tech_data, file_path) во временный файл задания и публикация версии.
+        latest - путь, который атомарно заменяется копией (например, 'report/2 Программа конференции.docx');
+        без него возвращается путь версии. Имя версии - имя файла генератора по умолчанию."""
+        name = os.path.basename(default_path(generate))
+        with self.temp_path(os.path.splitext(name)[1]) as temp:
+            generate(student_data, tech_data, temp)
+            if latest is not None:
+                # копия - до публикации: сборка может удалить версию, но не временный файл задания
+                write_atomic(lambda path: shutil.copyfile(temp, path), latest)
+            published = self.publish(temp, name, revision)
+        return latest if latest is not None else published
+
+    def _entries(self) -> List[Tuple[float, int, int, str]]:
+        """(время обращения, размер, inode, путь) всех версий."""
+        entries = []
+        for revision in _scandir(self.root):
+            if revision.name == TEMP_DIR or not revision.is_dir(follow_symlinks=False):
+                continue
+            for file in _scandir(revision.path):
+                try:
+                    stat = file.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, stat.st_ino, file.path))
+        return entries
+
+    def collect(self) -> dict:
+        """Удаление версий старше max_age и самых давних, пока каталог больше max_bytes; затем -
+        пустых каталогов ревизий и брошенных временных файлов."""
+        start = time.perf_counter()
+        now = time.time()
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _, _ in entries)
+        removed = freed = 0
+        for mtime, size, inode, path in entries:
+            expired = self.max_age is not None and now - mtime > self.max_age
+            if now - mtime < self.grace or not expired and (self.max_bytes is None or total <= self.max_bytes):
+                break  # дальше - только более свежие версии
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                total -= size
+                continue
+            # пока шёл обход, версию могли опубликовать заново или прочитать - такую не трогаем
+            if stat.st_ino == inode and stat.st_mtime == mtime and _remove(path):
+                removed += 1
+                freed += size
+            total -= size
+        for revision in _scandir(self.root):
+            if revision.name != TEMP_DIR and revision.is_dir(follow_symlinks=False):
+                try:
+                    os.rmdir(revision.path)  # только пустой
+                except OSError:
+                    pass
+        for temp in _scandir(self.temp_dir):
+            try:
+                if now - temp.stat().st_mtime > TEMP_TTL:
+                    _remove(temp.path)
+            except FileNotFoundError:
+                pass
+        self.removed += removed
+        self.freed_bytes += freed
+        self.gc_runs += 1
+        self.gc_seconds = time.perf_counter() - start
+        return {'removed': removed, 'freed_bytes': freed, 'bytes': total, 'seconds': self.gc_seconds}
+
+    def start(self, interval: float = 60.0) -> None:
+        """Сборка в фоновом потоке каждые interval секунд."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,), name='output-gc', daemon=True)
+        self._thread.start()
+
+    def _run(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            try:
+                self.collect()
+            except OSError as e:
+                logging.warning(f"Output GC in {self.root} failed: {e}")
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def metrics(self) -> dict:
+        entries = self._entries()
+        return {'root': self.root, 'files': len(entries), 'bytes': sum(size for _, size, _, _ in entries),
+                'max_bytes': self.max_bytes, 'max_age': self.max_age, 'published': self.published,
+                'removed': self.removed, 'freed_bytes': self.freed_bytes, 'gc_runs': self.gc_runs,
+                'last_gc_seconds': self.gc_seconds}
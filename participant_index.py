@@ -0,0 +1,106 @@
+import threading
+from bisect import bisect_left
+from collections import OrderedDict, defaultdict
+from typing import Callable, Dict, List, Optional
+
+# Индекс участников для поиска и фильтров: строится один раз на ревизию данных.
+# Фамилии лежат отсортированным списком (поиск по префиксу - bisect),
+# по заседанию, статусу, группе и решению - списки позиций строк (и их множества
+# для пересечения нескольких фильтров).
+
+FIRST_ROW = 2  # данные начинаются со второй строки листа (A2)
+
+
+def normalize(text: str) -> str:
+    return text.strip().casefold().replace('ё', 'е')
+
+
+def _cell(row: List[str], index: int) -> str:
+    return row[index] if len(row) > index else ''
+
+
+class ParticipantIndex:
+    FILTERS = {'session': 15, 'status': 12, 'group': 11, 'decision': 16}
+
+    def __init__(self, student_data: List[List[str]]):
+        self.rows = student_data
+        self.postings: Dict[str, Dict[str, List[int]]] = {}
+        self.posting_sets: Dict[str, Dict[str, frozenset]] = {}
+        for name, index in self.FILTERS.items():
+            posting = defaultdict(list)
+            for position, row in enumerate(student_data):
+                posting[_cell(row, index)].append(position)
+            self.postings[name] = dict(posting)
+            self.posting_sets[name] = {value: frozenset(positions) for value, positions in posting.items()}
+
+        surnames = sorted((normalize(_cell(row, 7)), position) for position, row in enumerate(student_data))
+        self.surname_keys = [key for key, _ in surnames]
+        self.surname_positions = [position for _, position in surnames]
+
+    def _prefix(self, prefix: str) -> List[int]:
+        prefix = normalize(prefix)
+        start = bisect_left(self.surname_keys, prefix)
+        end = bisect_left(self.surname_keys, prefix + '\U0010ffff', start)
+        return self.surname_positions[start:end]
+
+    def search(self, prefix: Optional[str] = None, offset: int = 0, limit: int = 50, **filters) -> dict:
+        """Поиск по префиксу фамилии и точным фильтрам session/status/group/decision с постраничной выдачей."""
+        filters = {name: value for name, value in filters.items() if value is not None}
+        if filters:
+            # Пересечение множеств начинается с самого короткого
+            sets = sorted((self.posting_sets[name].get(value, frozenset()) for name, value in filters.items()),
+                          key=len)
+            matched = sets[0].intersection(*sets[1:]) if len(sets) > 1 else sets[0]
+        if prefix:
+            positions = self._prefix(prefix)  # в алфавитном порядке фамилий
+            if filters:
+                positions = [p for p in positions if p in matched]
+        elif len(filters) == 1:
+            name, value = next(iter(filters.items()))
+            positions = self.postings[name].get(value, [])
+        elif filters:
+            positions = sorted(matched)
+        else:
+            positions = range(len(self.rows))
+
+        page = positions[offset:offset + limit]
+        return {
+            'total': len(positions),
+            'offset': offset,
+            'limit': limit,
+            'items': [self.participant(position) for position in page],
+        }
+
+    def participant(self, position: int) -> dict:
+        row = self.rows[position]
+        return {
+            'row': position + FIRST_ROW,
+            'surname': _cell(row, 7),
+            'name': _cell(row, 8),
+            'patronymic': _cell(row, 9),
+            'group': _cell(row, 11),
+            'status': _cell(row, 12),
+            'title': _cell(row, 13),
+            'session': _cell(row, 15),
+            'decision': _cell(row, 16),
+        }
+
+
+_indexes = OrderedDict()
+_lock = threading.Lock()  # кэш общий для потоков запросов FastAPI
+CACHE_SIZE = 4
+
+
+def get_index(revision: str, load: Callable[[], List[List[str]]]) -> ParticipantIndex:
+    """Индекс для ревизии данных; строится из load() только при первом обращении к ревизии."""
+    with _lock:
+        index = _indexes.get(revision)
+        if index is not None:
+            _indexes.move_to_end(revision)
+            return index
+    index = ParticipantIndex(load())  # построение - вне блокировки
+    with _lock:
+        index = _indexes.setdefault(revision, index)
+        if len(_indexes) > CACHE_SIZE:
+            _indexes.popitem(last=False)
+    return index
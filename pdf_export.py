@@ -0,0 +1,167 @@
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Optional
+
+# Экспорт .docx в PDF через пул долгоживущих процессов LibreOffice.
+# Каждый рабочий поток держит свой headless soffice (со своим профилем) и
+# берёт задания из общей очереди; документы открываются и сохраняются через UNO,
+# поэтому офис стартует один раз, а не на каждый файл. Процесс перезапускается
+# после recycle_after заданий и после задания, не уложившегося в timeout.
+# Нужен LibreOffice и модуль uno (python3-uno) в том же интерпретаторе.
+
+SOFFICE = os.environ.get('SOFFICE', 'soffice')
+
+
+class _Office:
+    """Один процесс soffice, слушающий свой pipe, и UNO-подключение к нему."""
+
+    def __init__(self, name: str, soffice: str, start_timeout: float = 30.0):
+        self.pipe_name = name
+        self.profile = tempfile.mkdtemp(prefix='docx_creator_lo_')
+        self.jobs = 0
+        self.process = subprocess.Popen(
+            [
+                soffice, '--headless', '--invisible', '--nologo', '--norestore', '--nodefault', '--nolockcheck',
+                f'-env:UserInstallation={Path(self.profile).as_uri()}',
+                f'--accept=pipe,name={name};urp;StarOffice.ComponentContext',
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            self.desktop = self._connect(start_timeout)
+        except Exception:
+            self.kill()
+            raise
+
+    def _connect(self, start_timeout: float):
+        import uno
+
+        local = uno.getComponentContext()
+        resolver = local.ServiceManager.createInstanceWithContext('com.sun.star.bridge.UnoUrlResolver', local)
+        deadline = time.monotonic() + start_timeout
+        while True:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"soffice завершился при запуске (код {self.process.returncode})")
+            try:
+                context = resolver.resolve(f'uno:pipe,name={self.pipe_name};urp;StarOffice.ComponentContext')
+                return context.ServiceManager.createInstanceWithContext('com.sun.star.frame.Desktop', context)
+            except Exception:
+                if time.monotonic() > deadline:
+                    raise RuntimeError("soffice не ответил за отведённое время")
+                time.sleep(0.1)
+
+    def convert(self, src: str, dst: str) -> None:
+        import uno
+        from com.sun.star.beans import PropertyValue
+
+        def prop(name, value):
+            p = PropertyValue()
+            p.Name = name
+            p.Value = value
+            return p
+
+        document = self.desktop.loadComponentFromURL(
+            uno.systemPathToFileUrl(os.path.abspath(src)), '_blank', 0, (prop('Hidden', True),)
+        )
+        try:
+            document.storeToURL(
+                uno.systemPathToFileUrl(os.path.abspath(dst)), (prop('FilterName', 'writer_pdf_Export'),)
+            )
+        finally:
+            document.close(True)
+        self.jobs += 1
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def kill(self) -> None:
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+        shutil.rmtree(self.profile, ignore_errors=True)
+
+
+class PdfConverterPool:
+    """Пул конвертеров .docx -> PDF с очередью заданий."""
+
+    def __init__(self, size: int = 2, timeout: float = 120.0, recycle_after: int = 50, soffice: str = SOFFICE):
+        self.size = size
+        self.timeout = timeout
+        self.recycle_after = recycle_after
+        self.soffice = soffice
+        self.restarts = 0
+        self._jobs = queue.Queue()
+        self._workers = [
+            threading.Thread(target=self._work, args=(f'docx_creator_{os.getpid()}_{i}',), daemon=True)
+            for i in range(size)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, docx_path, pdf_path=None) -> Future:
+        """Ставит файл в очередь; Future вернёт путь к PDF."""
+        future = Future()
+        pdf_path = str(pdf_path or Path(docx_path).with_suffix('.pdf'))
+        self._jobs.put((str(docx_path), pdf_path, future))
+        return future
+
+    def convert(self, docx_path, pdf_path=None) -> str:
+        return self.submit(docx_path, pdf_path).result()
+
+    def close(self) -> None:
+        for _ in self._workers:
+            self._jobs.put(None)
+        for worker in self._workers:
+            worker.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _work(self, name: str) -> None:
+        office: Optional[_Office] = None
+        try:
+            while True:
+                job = self._jobs.get()
+                if job is None:
+                    break
+                src, dst, future = job
+                if not future.set_running_or_notify_cancel():
+                    continue
+
+                expired = threading.Event()
+                try:
+                    if office is None:
+                        office = _Office(name, self.soffice)
+                    # По таймауту процесс убивается, и зависший вызов UNO завершается ошибкой
+                    timer = threading.Timer(self.timeout, lambda o=office: (expired.set(), o.process.kill()))
+                    timer.start()
+                    try:
+                        office.convert(src, dst)
+                    finally:
+                        timer.cancel()
+                except Exception as e:
+                    if expired.is_set():
+                        future.set_exception(TimeoutError(f"Конвертация {src} не уложилась в {self.timeout} с"))
+                    else:
+                        future.set_exception(e)
+                else:
+                    future.set_result(dst)
+
+                if office is not None and (not office.alive() or office.jobs >= self.recycle_after):
+                    office.kill()
+                    office = None
+                    self.restarts += 1
+        finally:
+            if office is not None:
+                office.kill()
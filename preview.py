@@ -0,0 +1,166 @@
+import hashlib
+from html import escape
+from typing import List, Optional
+
+from docx_stream import PROGRAM_TITLE, group_by_session
+from main import ACCEPTED, convert_to_initials, format_date, recommendation_for
+
+# Предпросмотр документов без рендеринга .docx: то же содержание, что у программы, отчёта и
+# списка публикаций (заседания, докладчики, темы, решения), в виде словаря для JSON и простой
+# HTML-страницы. Строится за один проход по уже загруженным строкам листов; ETag зависит
+# только от ревизий листов, поэтому повторный запрос без изменений таблицы отвечается 304.
+
+PREVIEW_VERSION = '1'  # меняется вместе с содержанием предпросмотра, чтобы старые ETag не совпали
+
+TITLES = {
+    'programme': PROGRAM_TITLE,
+    'report': 'Отчёт о конференции 78 МСНК ГУАП',
+    'publications': 'Список представляемых к публикации докладов',
+}
+
+
+def _full_name(row: List[str]) -> str:
+    return f"{row[7]} {row[8]} {row[9]}"
+
+
+def _speaker(number: int, row: List[str]) -> dict:
+    return {'number': number, 'name': _full_name(row), 'initials': convert_to_initials(_full_name(row)),
+            'title': row[13]}
+
+
+def _session(number: int, tech_row: List[str]) -> dict:
+    return {'number': number, 'date': format_date(tech_row[11]), 'time': tech_row[12], 'room': tech_row[13]}
+
+
+def _sessions(student_data: List[List[str]], tech_data: List[List[str]], report: bool) -> List[dict]:
+    """Заседания с 1 по наибольший номер, как в документах (пустые заседания тоже выводятся)."""
+    sessions = group_by_session(student_data)
+    result = []
+    for number in range(1, max(sessions, default=0) + 1):
+        session = _session(number, tech_data[number - 1])
+        speakers = []
+        for participant_num, row in enumerate(sessions[number], 1):
+            speaker = _speaker(participant_num, row)
+            if report:
+                speaker.update(status=row[12], group=row[11], decision=row[16] if len(row) > 16 else '',
+                               recommendation=recommendation_for(row))
+            speakers.append(speaker)
+        session['speakers'] = speakers
+        result.append(session)
+    return result
+
+
+def _section(tech_data: List[List[str]]) -> dict:
+    head = tech_data[0]
+    return {'department': head[0], 'section': head[1], 'head': head[2], 'head_position': head[3]}
+
+
+def programme_preview(student_data: List[List[str]], tech_data: List[List[str]]) -> dict:
+    head = tech_data[0]
+    return {**_section(tech_data), 'deputy': head[6], 'deputy_position': head[7],
+            'sessions': _sessions(student_data, tech_data, report=False)}
+
+
+def report_preview(student_data: List[List[str]], tech_data: List[List[str]]) -> dict:
+    return {**_section(tech_data), 'sessions': _sessions(student_data, tech_data, report=True)}
+
+
+def publications_preview(student_data: List[List[str]], tech_data: List[List[str]]) -> dict:
+    head = tech_data[0]
+    accepted = [{**_speaker(number, row), 'session': row[15], 'decision': row[16]}
+                for number, row in enumerate((row for row in student_data if len(row) > 16 and row[16] in ACCEPTED), 1)]
+    return {**_section(tech_data), 'email': head[4], 'phone': head[5], 'accepted': accepted}
+
+
+PREVIEWS = {
+    'programme': programme_preview,
+    'report': report_preview,
+    'publications': publications_preview,
+}
+
+
+def build_preview(kind: str, student_data: List[List[str]], tech_data: List[List[str]]) -> dict:
+    return {'kind': kind, 'title': TITLES[kind], **PREVIEWS[kind](student_data, tech_data)}
+
+
+def preview_etag(kind: str, output: str, *revisions: str) -> str:
+    """Сильный ETag по виду, формату и ревизиям листов (ревизии SheetStore - хэши содержимого,
+    поэтому ETag одинаков во всех воркерах и после перезапуска)."""
+    key = ':'.join((PREVIEW_VERSION, kind, output) + revisions)
+    return f'"{hashlib.blake2b(key.encode("utf-8"), digest_size=12).hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match: '*' или список тегов через запятую; W/ при сравнении не учитывается (RFC 9110, 13.1.2)."""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or etag in (tag[2:] if tag.startswith('W/') else tag for tag in tags)
+
+
+# HTML: одна страница без скриптов и внешних ресурсов
+
+STYLE = ('body{font-family:"Times New Roman",serif;max-width:60em;margin:2em auto;padding:0 1em}'
+         'table{border-collapse:collapse;width:100%}td,th{border:1px solid #999;padding:.3em;vertical-align:top}'
+         '.meta{color:#555}')
+
+
+def _head_html(preview: dict) -> List[str]:
+    parts = [f"<h1>{escape(preview['title'])}</h1>",
+             f"<p><b><i>Секция каф. {escape(preview['department'])}. {escape(preview['section'])}</i></b></p>",
+             f"<p>Научный руководитель секции - {escape(preview['head'])}, {escape(preview['head_position'])}</p>"]
+    if preview.get('deputy'):
+        parts.append(f"<p>Зам. научного руководителя секции - {escape(preview['deputy'])}, "
+                     f"{escape(preview['deputy_position'])}</p>")
+    return parts
+
+
+def _session_html(session: dict) -> str:
+    return (f"<h2>Заседание {session['number']}</h2>"
+            f"<p class=\"meta\">{escape(session['date'])}, {escape(session['time'])}, ауд. {escape(session['room'])}</p>")
+
+
+def _programme_html(preview: dict) -> List[str]:
+    parts = []
+    for session in preview['sessions']:
+        parts.append(_session_html(session))
+        parts.append('<ol>' + ''.join(f"<li>{escape(speaker['initials'])}<br>{escape(speaker['title'])}</li>"
+                                      for speaker in session['speakers']) + '</ol>')
+    return parts
+
+
+def _report_html(preview: dict) -> List[str]:
+    parts = []
+    for session in preview['sessions']:
+        parts.append(_session_html(session))
+        parts.append('<table><tr><th>№ п/п</th><th>ФИО докладчика, название доклада</th>'
+                     '<th>Статус (магистр/студент)</th><th>Решение</th></tr>')
+        for speaker in session['speakers']:
+            status = f"{speaker['status']} Гр. № {speaker['group']}" if speaker['group'] else speaker['status']
+            parts.append(f"<tr><td>{speaker['number']}</td><td>{escape(speaker['name'])}<br>"
+                         f"{escape(speaker['title'])}</td><td>{escape(status)}</td>"
+                         f"<td>{escape(speaker['recommendation'])}</td></tr>")
+        parts.append('</table>')
+    return parts
+
+
+def _publications_html(preview: dict) -> List[str]:
+    return [f"<p class=\"meta\">e-mail: {escape(preview['email'])}, тел.: {escape(preview['phone'])}</p>",
+            '<ol>' + ''.join(f"<li><i>{escape(paper['initials'])}</i> {escape(paper['title'])}</li>"
+                             for paper in preview['accepted']) + '</ol>']
+
+
+HTML_BODIES = {
+    'programme': _programme_html,
+    'report': _report_html,
+    'publications': _publications_html,
+}
+
+
+def render_html(preview: dict) -> str:
+    parts = ['<!DOCTYPE html><html lang="ru"><head><meta charset="utf-8">',
+             f"<title>{escape(preview['title'])}</title><style>{STYLE}</style></head><body>"]
+    parts.extend(_head_html(preview))
+    parts.extend(HTML_BODIES[preview['kind']](preview))
+    parts.append('</body></html>')
+    return ''.join(parts)
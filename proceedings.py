@@ -0,0 +1,480 @@
+import os
+import posixpath
+import re
+import shutil
+import tempfile
+import zipfile
+from functools import lru_cache
+from typing import BinaryIO, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple, Union
+
+from lxml import etree
+
+import docx_stream
+import docx_zip
+from cancellation import checkpoint
+from docx_stream import (CENTER, DOCUMENT_PART, OUTLINE, PAGE_BREAK, paragraph, run, section_title,
+                         table_of_contents, text_paragraph)
+from main import ACCEPTED, convert_to_initials
+
+# Сборник материалов: тексты принятых докладов (решение 1 или 2) из присланных .docx
+# склеиваются в один том. Файл доклада ищется в папке по номеру строки листа в начале имени
+# ("00012 Иванов И.И. тезисы.docx", как у файлов рассылки), иначе по фамилии, если она однозначна.
+# Каждый файл разбирается в рабочем процессе: из тела убираются разрывы разделов и примечания,
+# стили переводятся на стили тома, номера списков, закладок и связей сдвигаются на номер доклада,
+# рисунки выкладываются во временную папку. Том пишется потоком: в памяти держатся только
+# разбираемые сейчас доклады (окно map_ordered) и накопленные стили и списки.
+
+FIRST_ROW = 2  # данные начинаются со второй строки листа (A2)
+VOLUME_TITLE = 'Сборник материалов 78 МСНК ГУАП'
+ID_STEP = 10000  # номера списков и закладок доклада index: index * ID_STEP + свой номер
+
+W = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+R = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PR = 'http://schemas.openxmlformats.org/package/2006/relationships'
+CT = 'http://schemas.openxmlformats.org/package/2006/content-types'
+IMAGE = R + '/image'
+HYPERLINK = R + '/hyperlink'
+
+STYLES_PART = 'word/styles.xml'
+NUMBERING_PART = 'word/numbering.xml'
+RELS_PART = 'word/_rels/document.xml.rels'
+CONTENT_TYPES = '[Content_Types].xml'
+PATCHED = (STYLES_PART, NUMBERING_PART, RELS_PART, CONTENT_TYPES)
+
+STYLE_REFS = ('pStyle', 'rStyle', 'tblStyle', 'numStyleLink', 'styleLink')
+STYLE_LINKS = ('basedOn', 'link', 'next')
+# Ссылки на части, которые в том не переносятся: сноски, примечания
+NOTE_REFS = ('footnoteReference', 'endnoteReference', 'commentReference')
+
+
+def w(tag: str) -> str:
+    return f'{{{W}}}{tag}'
+
+
+class Submission(NamedTuple):
+    body: str  # разметка тела без sectPr
+    styles: Dict[str, str]  # новый styleId -> определение стиля
+    abstract_nums: List[str]
+    nums: List[str]
+    rels: List[Tuple[str, str, str, bool]]  # Id, Type, Target, внешняя ссылка
+    media: List[Tuple[str, str]]  # имя части, тип содержимого; файл лежит в папке выгрузки
+    dropped: int  # удалённые объекты без поддержки (диаграммы, OLE, сноски, примечания)
+    error: Optional[str] = None
+
+
+class Volume:
+    """Итог сборки: какие доклады вошли, каких нет и что пришлось выбросить."""
+    __slots__ = ('included', 'missing', 'failed', 'dropped')
+
+    def __init__(self):
+        self.included = []  # (строка листа, файл)
+        self.missing = []  # (строка листа, ФИО) - файл не найден или найдено несколько
+        self.failed = []  # (строка листа, файл, ошибка)
+        self.dropped = 0
+
+
+# Поиск файлов докладов
+
+def submission_files(directory: str) -> List[str]:
+    return sorted(name for name in os.listdir(directory)
+                  if name.lower().endswith('.docx') and not name.startswith('~$'))
+
+
+def match_submissions(student_data: List[List[str]], directory: str
+                      ) -> List[Tuple[int, List[str], Optional[str]]]:
+    """(позиция, строка, путь или None) для каждого принятого доклада в порядке листа."""
+    files = submission_files(directory)
+    by_row = {}
+    for name in files:
+        number = re.match(r'\d+', name)
+        if number:
+            by_row.setdefault(int(number.group()), name)
+    matched = []
+    for position, row in enumerate(student_data):
+        if len(row) <= 16 or row[16] not in ACCEPTED:
+            continue
+        name = by_row.get(position + FIRST_ROW)
+        if name is None and row[7].strip():
+            surname = row[7].strip().lower()
+            candidates = [name for name in files
+                          if re.sub(r'^[\d\s_.-]+', '', name).lower().startswith(surname)]
+            name = candidates[0] if len(candidates) == 1 else None
+        matched.append((position, row, os.path.join(directory, name) if name else None))
+    return matched
+
+
+# Разбор доклада (в рабочем процессе)
+
+def _declared(xml: bytes) -> Set[Tuple[str, str]]:
+    start = xml[xml.index(b'<', xml.index(b'?>') + 2 if xml.startswith(b'<?') else 0):]
+    start = start[:start.index(b'>')].decode('utf-8')
+    return set(re.findall(r'xmlns:(\w+)="([^"]*)"', start))
+
+
+@lru_cache(maxsize=None)
+def _volume_parts() -> Dict[str, bytes]:
+    return dict(docx_stream._template()[0])
+
+
+@lru_cache(maxsize=None)
+def _volume_namespaces(part: str) -> Set[Tuple[str, str]]:
+    """Пространства имён, объявленные в корне части тома: в вставках они не повторяются."""
+    return _declared(_volume_parts()[part])
+
+
+@lru_cache(maxsize=None)
+def _volume_styles() -> Tuple[Dict[str, str], Set[str]]:
+    """Стили тома: имя (в нижнем регистре) -> styleId и множество styleId."""
+    root = etree.fromstring(_volume_parts()[STYLES_PART])
+    by_name, ids = {}, set()
+    for style in root.iter(w('style')):
+        style_id = style.get(w('styleId'))
+        name = style.find(w('name'))
+        ids.add(style_id)
+        if name is not None:
+            by_name.setdefault(name.get(w('val')).lower(), style_id)
+    return by_name, ids
+
+
+def _serialize(element, part: str) -> str:
+    """Разметка элемента без объявлений пространств имён, уже объявленных в корне части тома."""
+    xml = etree.tostring(element, encoding='unicode')
+    end = xml.index('>')
+    declared = _volume_namespaces(part)
+    head = re.sub(r' xmlns:(\w+)="([^"]*)"',
+                  lambda m: '' if (m.group(1), m.group(2)) in declared else m.group(0), xml[:end])
+    return head + xml[end:]
+
+
+def _remove(element) -> None:
+    parent = element.getparent()
+    if parent is not None:
+        parent.remove(element)
+
+
+def _enclosing_run(element):
+    found = element
+    while found is not None and found.tag != w('r'):
+        found = found.getparent()
+    return element if found is None else found
+
+
+def _style_id(style, by_name: Dict[str, str], base_ids: Set[str]) -> str:
+    """styleId в томе: стиль тома с тем же именем, иначе styleId из имени стиля -
+    одноимённые стили разных докладов становятся одним стилем тома."""
+    name = style.find(w('name'))
+    name = name.get(w('val')) if name is not None else ''
+    if name.lower() in by_name:
+        return by_name[name.lower()]
+    new_id = re.sub(r'\W', '', name) or style.get(w('styleId'))
+    while new_id in base_ids:
+        new_id += '_'
+    return new_id
+
+
+def parse_submission(job: Tuple[int, str, str]) -> Submission:
+    index, path, spool = job
+    try:
+        with zipfile.ZipFile(path) as zf:
+            return _parse(index, zf, spool)
+    except (zipfile.BadZipFile, KeyError, ValueError, etree.XMLSyntaxError, OSError) as e:
+        return Submission('', {}, [], [], [], [], 0, f'{type(e).__name__}: {e}')
+
+
+def _read_xml(zf: zipfile.ZipFile, name: str):
+    return etree.fromstring(zf.read(name)) if name in zf.namelist() else None
+
+
+def _parse(index: int, zf: zipfile.ZipFile, spool: str) -> Submission:
+    body = etree.fromstring(zf.read(DOCUMENT_PART)).find(w('body'))
+    if body is None:
+        raise ValueError('в document.xml нет w:body')
+    styles_root = _read_xml(zf, STYLES_PART)
+    numbering_root = _read_xml(zf, NUMBERING_PART)
+    rels_root = _read_xml(zf, RELS_PART)
+    types_root = _read_xml(zf, CONTENT_TYPES)
+    dropped = 0
+
+    # Разделы (поля, колонтитулы) у тома свои; примечания и сноски не переносятся
+    for element in list(body.iter(w('sectPr'), w('commentRangeStart'), w('commentRangeEnd'))):
+        _remove(element)
+    for element in list(body.iter(*(w(tag) for tag in NOTE_REFS))):
+        _remove(_enclosing_run(element))
+        dropped += 1
+
+    # Закладки: номера сдвигаются, служебная _GoBack убирается
+    go_back = {start.get(w('id')) for start in body.iter(w('bookmarkStart')) if start.get(w('name')) == '_GoBack'}
+    for element in list(body.iter(w('bookmarkStart'), w('bookmarkEnd'))):
+        if element.get(w('id')) in go_back:
+            _remove(element)
+        elif element.get(w('id'), '').isdigit():
+            element.set(w('id'), str(index * ID_STEP + int(element.get(w('id')))))
+
+    # Связи: рисунки и внешние ссылки переносятся с новыми Id, остальное удаляется
+    relationships = {}
+    if rels_root is not None:
+        for rel in rels_root.iter(f'{{{PR}}}Relationship'):
+            relationships[rel.get('Id')] = (rel.get('Type'), rel.get('Target'), rel.get('TargetMode') == 'External')
+    defaults = {}
+    if types_root is not None:
+        defaults = {default.get('Extension').lower(): default.get('ContentType')
+                    for default in types_root.iter(f'{{{CT}}}Default')}
+    renamed, rels, media, unsupported = {}, [], [], []
+    for element in body.iter():
+        for attr, value in element.attrib.items():
+            if not attr.startswith(f'{{{R}}}'):
+                continue
+            if value not in renamed:
+                rel_type, target, external = relationships.get(value, (None, None, False))
+                new_id = f'rIdP{index}_{len(renamed) + 1}'
+                if rel_type == HYPERLINK and external:
+                    rels.append((new_id, rel_type, target, True))
+                elif rel_type == IMAGE and not external:
+                    source = posixpath.normpath(posixpath.join('word', target)).lstrip('/')
+                    ext = posixpath.splitext(source)[1].lower()
+                    name = f'word/media/p{index}_{len(renamed) + 1}{ext}'
+                    with zf.open(source) as src, open(os.path.join(spool, posixpath.basename(name)), 'wb') as dst:
+                        shutil.copyfileobj(src, dst)
+                    media.append((name, defaults.get(ext.lstrip('.'), 'application/octet-stream')))
+                    rels.append((new_id, rel_type, posixpath.relpath(name, 'word'), False))
+                else:
+                    new_id = None
+                renamed[value] = new_id
+            if renamed[value] is None:
+                unsupported.append(_enclosing_run(element))
+                break
+            element.set(attr, renamed[value])
+    for element in dict.fromkeys(unsupported):
+        _remove(element)
+        dropped += 1
+
+    # Списки: номера num и abstractNum сдвигаются, nsid убирается, чтобы Word не связал
+    # одинаково созданные списки разных докладов
+    def shift(element) -> None:
+        value = element.get(w('val'))
+        if value and value.isdigit() and value != '0':
+            element.set(w('val'), str(index * ID_STEP + int(value)))
+
+    abstract_nums, nums = [], []
+    style_refs = [element for element in body.iter(*(w(tag) for tag in STYLE_REFS))]
+    if numbering_root is not None:
+        for abstract in numbering_root.iter(w('abstractNum')):
+            abstract.set(w('abstractNumId'), str(index * ID_STEP + int(abstract.get(w('abstractNumId')))))
+            for nsid in abstract.findall(w('nsid')):
+                abstract.remove(nsid)
+            style_refs.extend(abstract.iter(*(w(tag) for tag in STYLE_REFS)))
+        for num in numbering_root.iter(w('num')):
+            num.set(w('numId'), str(index * ID_STEP + int(num.get(w('numId')))))
+            for element in num.iter(w('abstractNumId')):
+                shift(element)
+    for element in body.iter(w('numId')):
+        shift(element)
+
+    # Стили: используемые доклады и их предки переводятся на styleId тома
+    by_name, base_ids = _volume_styles()
+    definitions = {}
+    if styles_root is not None:
+        definitions = {style.get(w('styleId')): style for style in styles_root.iter(w('style'))}
+    new_ids, styles = {}, {}
+    pending = [element.get(w('val')) for element in style_refs]
+    while pending:
+        style_id = pending.pop()
+        if style_id in new_ids or style_id not in definitions:
+            continue
+        style = definitions[style_id]
+        new_ids[style_id] = _style_id(style, by_name, base_ids)
+        if new_ids[style_id] not in base_ids:
+            pending.extend(link.get(w('val')) for link in style.iter(*(w(tag) for tag in STYLE_LINKS)))
+    for element in style_refs:
+        if element.get(w('val')) in new_ids:
+            element.set(w('val'), new_ids[element.get(w('val'))])
+    for old_id, new_id in new_ids.items():
+        if new_id in base_ids:
+            continue
+        style = definitions[old_id]
+        style.set(w('styleId'), new_id)
+        for link in style.iter(*(w(tag) for tag in STYLE_LINKS)):
+            if link.get(w('val')) in new_ids:
+                link.set(w('val'), new_ids[link.get(w('val'))])
+            else:
+                _remove(link)
+        for element in style.iter(w('numId')):
+            shift(element)
+        styles[new_id] = _serialize(style, STYLES_PART)
+
+    # В том идут только используемые списки: шаблон Word несёт десятки лишних определений
+    if numbering_root is not None:
+        used = {element.get(w('val')) for element in body.iter(w('numId'))}
+        used.update(element.get(w('val')) for old_id, new_id in new_ids.items() if new_id not in base_ids
+                    for element in definitions[old_id].iter(w('numId')))
+        kept = [num for num in numbering_root.iter(w('num')) if num.get(w('numId')) in used]
+        abstract_ids = {element.get(w('val')) for num in kept for element in num.iter(w('abstractNumId'))}
+        abstract_nums = [_serialize(abstract, NUMBERING_PART) for abstract in numbering_root.iter(w('abstractNum'))
+                         if abstract.get(w('abstractNumId')) in abstract_ids]
+        nums = [_serialize(num, NUMBERING_PART) for num in kept]
+
+    content = ''.join(_serialize(element, DOCUMENT_PART) for element in body
+                      if isinstance(element.tag, str))
+    return Submission(content, styles, abstract_nums, nums, rels, media, dropped)
+
+
+# Сборка тома
+
+def paper_heading(row: List[str]) -> str:
+    initials = convert_to_initials(row[7] + " " + row[8] + " " + row[9])
+    return paragraph(run(initials, italic=True), run(f" {row[13]}", bold=True), props=OUTLINE)
+
+
+def paper_title(row: List[str]) -> str:
+    return f"{convert_to_initials(row[7] + ' ' + row[8] + ' ' + row[9])} {row[13]}"
+
+
+class _Merged:
+    """Стили, списки, связи и типы рисунков всех докладов - для частей, пишущихся после тела."""
+
+    def __init__(self):
+        self.styles = {}
+        self.abstract_nums = []
+        self.nums = []
+        self.rels = []
+        self.media = []
+        self.defaults = {}
+
+    def add(self, submission: Submission) -> None:
+        for style_id, xml in submission.styles.items():
+            self.styles.setdefault(style_id, xml)
+        self.abstract_nums.extend(submission.abstract_nums)
+        self.nums.extend(submission.nums)
+        self.rels.extend(submission.rels)
+        for name, content_type in submission.media:
+            self.media.append(name)
+            self.defaults.setdefault(posixpath.splitext(name)[1].lstrip('.'), content_type)
+
+    def patch(self, name: str, data: bytes) -> bytes:
+        xml = data.decode('utf-8')
+        if name == STYLES_PART:
+            xml = xml.replace('</w:styles>', ''.join(self.styles.values()) + '</w:styles>')
+        elif name == NUMBERING_PART:
+            # схема требует все abstractNum до первого num
+            first = xml.find('<w:num ')
+            first = first if first >= 0 else xml.index('</w:numbering>')
+            xml = xml[:first] + ''.join(self.abstract_nums) + xml[first:]
+            xml = xml.replace('</w:numbering>', ''.join(self.nums) + '</w:numbering>')
+        elif name == RELS_PART:
+            external_mode = ' TargetMode="External"'
+            xml = xml.replace('</Relationships>', ''.join(
+                f'<Relationship Id="{rel_id}" Type="{rel_type}" Target="{docx_stream.escape(target)}"'
+                f'{external_mode if external else ""}/>'
+                for rel_id, rel_type, target, external in self.rels) + '</Relationships>')
+        elif name == CONTENT_TYPES:
+            known = set(re.findall(r'<Default Extension="([^"]+)"', xml))
+            xml = xml.replace('<Default ', ''.join(
+                f'<Default Extension="{ext}" ContentType="{content_type}"/>'
+                for ext, content_type in sorted(self.defaults.items()) if ext not in known) + '<Default ', 1)
+        return xml.encode('utf-8')
+
+
+def _write_volume(out: BinaryIO, student_data: List[List[str]], tech_data: List[List[str]], directory: str,
+                  volume: Volume, level: Optional[int] = docx_zip.DEFAULT_LEVEL, workers: Optional[int] = None,
+                  window: Optional[int] = None, reproducible: Optional[bool] = None) -> Iterator[None]:
+    """Пишет том; отдаёт управление после каждой части и каждого доклада."""
+    papers = []
+    for position, row, path in match_submissions(student_data, directory):
+        if path is None:
+            volume.missing.append((position + FIRST_ROW, f"{row[7]} {row[8]} {row[9]}".strip()))
+        else:
+            papers.append((position, row, path))
+    _, document_head, document_tail, _, _ = docx_stream._template()
+    reproducible = docx_zip.is_reproducible(reproducible)
+    merged = _Merged()
+
+    with tempfile.TemporaryDirectory(prefix='proceedings-') as spool:
+        def document() -> Iterator[bytes]:
+            yield document_head
+            yield ''.join([
+                text_paragraph(VOLUME_TITLE, CENTER, bold=True),
+                text_paragraph(section_title(tech_data), CENTER),
+                table_of_contents(paper_title(row) for _, row, _ in papers),
+            ]).encode('utf-8')
+            jobs = [(index, path, spool) for index, (_, _, path) in enumerate(papers, 1)]
+            if workers == 1:
+                submissions = map(parse_submission, jobs)
+            else:
+                submissions = docx_stream.map_ordered(parse_submission, jobs, workers, window)
+            for done, ((position, row, path), submission) in enumerate(zip(papers, submissions)):
+                checkpoint('render', done, len(papers))
+                yield (PAGE_BREAK + paper_heading(row)).encode('utf-8')
+                if submission.error:
+                    volume.failed.append((position + FIRST_ROW, path, submission.error))
+                    yield text_paragraph('Файл доклада не удалось прочитать.').encode('utf-8')
+                    continue
+                volume.included.append((position + FIRST_ROW, path))
+                volume.dropped += submission.dropped
+                merged.add(submission)
+                yield submission.body.encode('utf-8')
+            yield document_tail
+
+        writer = docx_zip.ZipWriter(out, docx_zip.reproducible_date_time() if reproducible else None)
+        yield from writer.write_stream(DOCUMENT_PART, document(), level)
+        for name in merged.media:
+            # рисунки уже сжаты - кладутся без сжатия
+            with open(os.path.join(spool, posixpath.basename(name)), 'rb') as f:
+                writer.write(name, f.read(), None)
+            yield
+        parts = _volume_parts().items()
+        for name, data in docx_zip.stable_order(parts) if reproducible else parts:
+            if name == DOCUMENT_PART:
+                continue
+            if name in PATCHED:
+                writer.write(name, merged.patch(name, data), level)
+            elif reproducible and name == docx_zip.CORE_PART:
+                writer.write_member(name, docx_zip.compressed(docx_zip.reproducible_core(data)))
+            else:
+                writer.write_member(name, docx_zip.compressed(data))
+            yield
+        writer.close()
+
+
+def write_proceedings(student_data: List[List[str]], tech_data: List[List[str]], directory: str,
+                      file: Union[str, BinaryIO], level: Optional[int] = docx_zip.DEFAULT_LEVEL,
+                      workers: Optional[int] = None, window: Optional[int] = None,
+                      reproducible: Optional[bool] = None) -> Volume:
+    """Собирает том в файл; workers=1 - разбор в текущем процессе."""
+    if isinstance(file, str):
+        with open(file, 'wb') as f:
+            return write_proceedings(student_data, tech_data, directory, f, level, workers, window, reproducible)
+    volume = Volume()
+    for _ in _write_volume(file, student_data, tech_data, directory, volume, level, workers, window, reproducible):
+        pass
+    return volume
+
+
+def iter_proceedings(student_data: List[List[str]], tech_data: List[List[str]], directory: str,
+                     volume: Optional[Volume] = None, chunk_size: int = 64 * 1024,
+                     level: Optional[int] = docx_zip.DEFAULT_LEVEL, workers: Optional[int] = None,
+                     reproducible: Optional[bool] = None) -> Iterator[bytes]:
+    """Том кусками по мере сборки (для потоковой отдачи)."""
+    sink = docx_stream._ChunkSink()
+    for _ in _write_volume(sink, student_data, tech_data, directory, volume or Volume(), level, workers,
+                           reproducible=reproducible):
+        if sink.size >= chunk_size:
+            yield sink.drain()
+    yield sink.drain()
+
+
+def generate_proceedings(student_data, tech_data, directory='submissions', file_path='report/proceedings.docx',
+                         workers=None):
+    return file_path, write_proceedings(student_data, tech_data, directory, file_path, workers=workers)
+
+
+def format_volume(volume: Volume) -> str:
+    lines = [f"Вошло докладов: {len(volume.included)}"]
+    if volume.missing:
+        lines.append(f"Нет файла: {len(volume.missing)} (строки "
+                     f"{', '.join(str(number) for number, _ in volume.missing[:20])}"
+                     f"{'...' if len(volume.missing) > 20 else ''})")
+    for number, path, error in volume.failed[:20]:
+        lines.append(f"Строка {number}: {os.path.basename(path)} не прочитан ({error})")
+    if volume.dropped:
+        lines.append(f"Удалено объектов без поддержки (сноски, примечания, диаграммы): {volume.dropped}")
+    return '\n'.join(lines)
@@ -0,0 +1,171 @@
+import math
+from collections import Counter, defaultdict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# Автоматическое распределение участников по заседаниям.
+# Заседания - строки техлиста с датой, временем и аудиторией (L, M, N).
+# Участники без номера заседания (столбец P пуст) раскладываются группами (L):
+# группа целиком идёт в заседание, где уже есть её участники, иначе в наименее
+# загруженное из тех, куда она помещается; группу, не влезающую никуда, делим
+# по заседаниям с наибольшим запасом мест.
+
+FIRST_ROW = 2  # данные начинаются со второй строки листа (A2)
+SESSION_COLUMN = 'P'
+CAPACITY_INDEX = 14  # необязательная вместимость заседания в столбце O техлиста
+
+
+class Assignment(NamedTuple):
+    sessions: Dict[int, int]  # позиция строки -> номер заседания (только новые назначения)
+    loads: Dict[int, int]  # заседание -> участников после распределения
+    capacities: Dict[int, int]
+    unplaced: List[int]  # позиции, которым не хватило мест
+
+
+class StaleAssignment(Exception):
+    """Лист изменился после расчёта распределения: строки по этим позициям - уже другие участники
+    или им уже назначено заседание. Номера не записаны, распределение нужно пересчитать."""
+
+    def __init__(self, positions: List[int]):
+        super().__init__(f"rows changed since the assignment was planned: {[p + FIRST_ROW for p in positions]}")
+        self.positions = positions
+
+
+def is_unassigned(row: List[str]) -> bool:
+    return len(row) <= 15 or not row[15].strip()
+
+
+def participant_key(row: List[str]) -> Tuple[str, ...]:
+    """Чем участник опознаётся в строке (отдельного ID в листе нет): ФИО и тема доклада."""
+    return tuple(row[index] if len(row) > index else '' for index in (7, 8, 9, 13))
+
+
+def session_capacities(tech_data: List[List[str]], participants: int,
+                       capacity: Optional[int] = None) -> Dict[int, int]:
+    """Вместимость заседаний: столбец O техлиста, иначе capacity, иначе поровну на всех."""
+    sessions = [num for num, row in enumerate(tech_data, 1) if len(row) >= 14 and row[11]]
+    if capacity is None:
+        capacity = math.ceil(participants / len(sessions)) if sessions else 0
+    capacities = {}
+    for num in sessions:
+        row = tech_data[num - 1]
+        own = row[CAPACITY_INDEX].strip() if len(row) > CAPACITY_INDEX else ''
+        capacities[num] = int(own) if own.isdigit() else capacity
+    return capacities
+
+
+def assign_sessions(student_data: List[List[str]], tech_data: List[List[str]],
+                    capacity: Optional[int] = None) -> Assignment:
+    loads = Counter()
+    homes = defaultdict(Counter)  # группа -> заседания, где уже есть её участники
+    groups = defaultdict(list)
+    for position, row in enumerate(student_data):
+        group = row[11] if len(row) > 11 else ''
+        if is_unassigned(row):
+            # участники без группы друг с другом не связаны
+            groups[group or f'#{position}'].append(position)
+        elif row[15].isdigit():
+            loads[int(row[15])] += 1
+            homes[group][int(row[15])] += 1
+
+    waiting = sum(len(positions) for positions in groups.values())
+    capacities = session_capacities(tech_data, sum(loads.values()) + waiting, capacity)
+    loads = {num: loads[num] for num in capacities}
+    free = {num: capacities[num] - loads[num] for num in capacities}
+
+    def fill(num: int, positions: List[int]) -> None:
+        for position in positions:
+            assigned[position] = num
+        loads[num] += len(positions)
+        free[num] -= len(positions)
+
+    assigned = {}
+    unplaced = []
+    # Крупные группы первыми: мелкие потом выравнивают загрузку
+    for group, positions in sorted(groups.items(), key=lambda item: -len(item[1])):
+        size = len(positions)
+        fits = [num for num in capacities if free[num] >= size]
+        if fits:
+            home = [num for num, _ in homes[group].most_common() if num in fits]
+            fill(home[0] if home else min(fits, key=lambda num: (loads[num] / max(capacities[num], 1), num)),
+                 positions)
+            continue
+        while positions:
+            num = max(capacities, key=lambda num: (free[num], -num), default=None)
+            if num is None or free[num] <= 0:
+                unplaced.extend(positions)
+                break
+            part = positions[:free[num]]
+            fill(num, part)
+            positions = positions[len(part):]
+
+    return Assignment(assigned, loads, capacities, sorted(unplaced))
+
+
+def apply_assignment(student_data: List[List[str]], assignment: Assignment) -> List[List[str]]:
+    """Копия строк с проставленными номерами заседаний - для предпросмотра программы."""
+    rows = []
+    for position, row in enumerate(student_data):
+        num = assignment.sessions.get(position)
+        if num is not None:
+            row = row + [''] * (16 - len(row)) if len(row) < 16 else list(row)
+            row[15] = str(num)
+        rows.append(row)
+    return rows
+
+
+def stale_positions(assignment: Assignment, planned: List[List[str]], current: List[List[str]]) -> List[int]:
+    """Назначенные позиции, где в текущих строках листа другой участник, чем в строках,
+    по которым считалось распределение, или номер заседания уже кем-то проставлен."""
+    return [position for position in sorted(assignment.sessions)
+            if position >= len(current) or not is_unassigned(current[position])
+            or participant_key(current[position]) != participant_key(planned[position])]
+
+
+def update_ranges(assignment: Assignment, sheet: str = 'Sheet1') -> List[dict]:
+    """Данные для values.batchUpdate: один диапазон столбца P от первой до последней
+    назначенной строки; ячейки между ними передаются как null и не меняются."""
+    if not assignment.sessions:
+        return []
+    first, last = min(assignment.sessions), max(assignment.sessions)
+    values = [[str(assignment.sessions[position])] if position in assignment.sessions else [None]
+              for position in range(first, last + 1)]
+    return [{
+        'range': f"{sheet}!{SESSION_COLUMN}{first + FIRST_ROW}:{SESSION_COLUMN}{last + FIRST_ROW}",
+        'values': values,
+    }]
+
+
+def write_assignment(s_id: str, assignment: Assignment, planned: List[List[str]], sheet: str = 'Sheet1') -> int:
+    """Записывает номера заседаний в таблицу одним запросом batchUpdate; возвращает число ячеек.
+    Запись идёт по позициям строк, поэтому прямо перед ней лист перечитывается в обход кэшей и
+    сверяется с planned - строками, по которым считалось распределение (StaleAssignment, если
+    строки сдвинулись или номера уже проставлены)."""
+    from googleapiclient.discovery import build
+    from google.oauth2.service_account import Credentials
+
+    if not assignment.sessions:
+        return 0
+    creds = Credentials.from_service_account_file(
+        'service.json', scopes=['https://www.googleapis.com/auth/spreadsheets'])
+    service = build('sheets', 'v4', credentials=creds)
+    current = service.spreadsheets().values().get(
+        spreadsheetId=s_id, range=f"{sheet}!A{FIRST_ROW}:S").execute().get('values', [])
+    stale = stale_positions(assignment, planned, current)
+    if stale:
+        raise StaleAssignment(stale)
+    result = service.spreadsheets().values().batchUpdate(spreadsheetId=s_id, body={
+        'valueInputOption': 'RAW',
+        'data': update_ranges(assignment, sheet),
+    }).execute()
+    return result.get('totalUpdatedCells', len(assignment.sessions))
+
+
+def format_assignment(assignment: Assignment) -> str:
+    lines = [f"Заседание {num}: {assignment.loads[num]} из {assignment.capacities[num]}"
+             for num in sorted(assignment.capacities)]
+    lines.append(f"Назначено: {len(assignment.sessions)}")
+    if assignment.unplaced:
+        lines.append(f"Не хватило мест: {len(assignment.unplaced)} (строки "
+                     f"{', '.join(str(position + FIRST_ROW) for position in assignment.unplaced[:20])}"
+                     f"{'...' if len(assignment.unplaced) > 20 else ''})")
+    return '\n'.join(lines)
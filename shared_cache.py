@@ -0,0 +1,142 @@
+import fcntl
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from cancellation import checkpoint
+
+# Кэш, общий для всех воркеров uvicorn/gunicorn на одной машине: значения лежат
+# в файле SQLite, а тяжёлые вычисления (загрузка листа, рендеринг документа)
+# защищены межпроцессной блокировкой flock - пока один воркер считает значение
+# для ключа, остальные ждут и потом берут готовое из кэша.
+# У каждого ключа свой файл блокировки (ожидание чужого ключа не задерживает), а ждут его
+# опросом flock с LOCK_NB: между попытками - контрольная точка отмены запроса и срок ожидания.
+# flock есть только на Unix, как и сам gunicorn.
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL
+);
+'''
+
+PRUNE_EVERY = 100  # удалять просроченные записи раз в столько записей
+LOCK_POLL = 0.005  # первая пауза между попытками взять занятую блокировку, дальше вдвое
+LOCK_POLL_MAX = 0.05
+LOCK_TIMEOUT = 300.0  # дольше чужое вычисление не ждём (в v4 запрос раньше отменит RENDER_DEADLINE)
+
+
+class LockTimeout(TimeoutError):
+    def __init__(self, key: str, timeout: float):
+        super().__init__(f"lock for {key!r} is held longer than {timeout:g} s")
+        self.key = key
+        self.timeout = timeout
+
+
+class SharedCache:
+    def __init__(self, path: str, lock_timeout: float = LOCK_TIMEOUT):
+        # Файлы кэша создаются при первом обращении, а не при создании объекта (импорт v4 ничего не пишет)
+        self.path = path
+        self.lock_dir = path + '.locks'
+        self.lock_timeout = lock_timeout
+        self._local = threading.local()
+        self._create_lock = threading.Lock()
+        self._created = False
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _create(self) -> None:
+        with self._create_lock:
+            if not self._created:
+                os.makedirs(self.lock_dir, exist_ok=True)
+                init = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+                init.executescript(SCHEMA)
+                init.close()
+                self._created = True
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            if not self._created:
+                self._create()
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[bytes]:
+        found = self._connection().execute(
+            'SELECT value FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)', (key, time.time())
+        ).fetchone()
+        return found[0] if found else None
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        conn = self._connection()
+        conn.execute('INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+                     (key, value, time.time() + ttl if ttl else None))
+        self._writes += 1
+        if self._writes % PRUNE_EVERY == 0:
+            conn.execute('DELETE FROM cache WHERE expires IS NOT NULL AND expires <= ?', (time.time(),))
+
+    def delete(self, key: str) -> None:
+        self._connection().execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    @contextmanager
+    def lock(self, key: str, timeout: Optional[float] = None):
+        """Эксклюзивная блокировка ключа для всех процессов на машине. Пока она занята, ожидание
+        прерывается отменой запроса (Cancelled) и сроком timeout (LockTimeout)."""
+        if not self._created:
+            self._create()
+        path = os.path.join(self.lock_dir, hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest() + '.lock')
+        timeout = self.lock_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        delay = LOCK_POLL
+        while True:
+            lock_file = open(path, 'a')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                checkpoint('cache.lock')
+                if time.monotonic() >= deadline:
+                    raise LockTimeout(key, timeout)
+                time.sleep(delay)
+                delay = min(delay * 2, LOCK_POLL_MAX)
+                continue
+            # Владелец удаляет файл, отпуская блокировку; если его удалили между open и flock,
+            # блокировка взята на уже ничей файл - открываем заново
+            try:
+                current = os.path.samestat(os.fstat(lock_file.fileno()), os.stat(path))
+            except FileNotFoundError:
+                current = False
+            if current:
+                break
+            lock_file.close()
+        try:
+            yield
+        finally:
+            os.unlink(path)  # ещё под блокировкой: файлы по ключам не копятся
+            lock_file.close()
+
+    def get_or_create(self, key: str, create: Callable[[], bytes], ttl: Optional[float] = None) -> bytes:
+        """Значение из кэша; при промахе его вычисляет только один процесс."""
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        with self.lock(key):
+            value = self.get(key)
+            if value is not None:
+                self.hits += 1
+                return value
+            self.misses += 1
+            value = create()
+            self.set(key, value, ttl)
+            return value
@@ -0,0 +1,25 @@
+import hashlib
+from typing import List
+
+# Общие помощники для данных листов (списки строк, как их возвращает Sheets API)
+
+
+def data_revision(*tables: List[List[str]]) -> str:
+    """Отпечаток содержимого листов: одинаковые данные - одинаковая ревизия."""
+    digest = hashlib.blake2b(digest_size=16)
+    for table in tables:
+        for row in table:
+            digest.update('\x1f'.join(row).encode('utf-8'))
+            digest.update(b'\x1e')
+        digest.update(b'\x1d')
+    return digest.hexdigest()
+
+
+def column_letter(index: int) -> str:
+    """Буква столбца по индексу с нуля: 0 -> A, 15 -> P."""
+    letters = ''
+    index += 1
+    while index:
+        index, rest = divmod(index - 1, 26)
+        letters = chr(ord('A') + rest) + letters
+    return letters
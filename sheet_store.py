@@ -0,0 +1,167 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+# Локальное зеркало листов Google Sheets в SQLite.
+# Каждая строка хранится под своим номером в листе вместе с хешем содержимого;
+# при синхронизации применяются только вставки, изменения и удаления.
+# Для выборок по заседанию (P), решению (Q), группе (L) и фамилии (H) есть индексы.
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS sheet_rows (
+    source TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    row_hash TEXT NOT NULL,
+    data TEXT NOT NULL,
+    session INTEGER,
+    decision TEXT,
+    grp TEXT,
+    surname TEXT,
+    PRIMARY KEY (source, position)
+);
+CREATE INDEX IF NOT EXISTS sheet_rows_session ON sheet_rows (source, session);
+CREATE INDEX IF NOT EXISTS sheet_rows_decision ON sheet_rows (source, decision);
+CREATE INDEX IF NOT EXISTS sheet_rows_grp ON sheet_rows (source, grp);
+CREATE INDEX IF NOT EXISTS sheet_rows_surname ON sheet_rows (source, surname);
+CREATE TABLE IF NOT EXISTS sheet_meta (
+    source TEXT PRIMARY KEY,
+    revision TEXT NOT NULL,
+    synced_at REAL NOT NULL
+);
+'''
+
+
+class SyncStats(NamedTuple):
+    inserted: int
+    updated: int
+    deleted: int
+    seconds: float
+
+
+def row_hash(row: List[str]) -> str:
+    return hashlib.blake2b('\x1f'.join(row).encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _cell(row: List[str], index: int) -> Optional[str]:
+    return row[index] if len(row) > index else None
+
+
+def _indexed(row: List[str]):
+    session = _cell(row, 15)
+    return (
+        int(session) if session and session.isdigit() else None,
+        _cell(row, 16),
+        _cell(row, 11),
+        _cell(row, 7),
+    )
+
+
+class SheetStore:
+    def __init__(self, path: str):
+        # Файл базы создаётся при первом обращении, а не при создании объекта (импорт v4 ничего не пишет)
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._created = False
+
+    def _connection(self) -> sqlite3.Connection:
+        # Отдельное соединение на поток: эндпоинты FastAPI выполняются в пуле потоков
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            if not self._created:
+                with self._write_lock:
+                    if not self._created:
+                        directory = os.path.dirname(self.path)
+                        if directory:
+                            os.makedirs(directory, exist_ok=True)
+                        with sqlite3.connect(self.path, timeout=30) as init:
+                            init.executescript(SCHEMA)
+                        init.close()
+                        self._created = True
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def source(s_id: str, s_range: str) -> str:
+        return f"{s_id}/{s_range}"
+
+    def sync(self, s_id: str, s_range: str, values: List[List[str]]) -> SyncStats:
+        """Приводит зеркало диапазона к values, меняя только отличающиеся строки."""
+        start = time.perf_counter()
+        source = self.source(s_id, s_range)
+        conn = self._connection()
+        with self._write_lock, conn:
+            stored = dict(conn.execute('SELECT position, row_hash FROM sheet_rows WHERE source = ?', (source,)))
+            revision = hashlib.blake2b(digest_size=16)
+            inserts = []
+            updates = []
+            for position, row in enumerate(values):
+                digest = row_hash(row)
+                revision.update(digest.encode('ascii'))
+                old = stored.pop(position, None)
+                if old == digest:
+                    continue
+                record = (digest, json.dumps(row, ensure_ascii=False), *_indexed(row), source, position)
+                (inserts if old is None else updates).append(record)
+
+            conn.executemany(
+                'INSERT INTO sheet_rows (row_hash, data, session, decision, grp, surname, source, position) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', inserts)
+            conn.executemany(
+                'UPDATE sheet_rows SET row_hash = ?, data = ?, session = ?, decision = ?, grp = ?, surname = ? '
+                'WHERE source = ? AND position = ?', updates)
+            conn.executemany('DELETE FROM sheet_rows WHERE source = ? AND position = ?',
+                             [(source, position) for position in stored])
+            conn.execute('INSERT OR REPLACE INTO sheet_meta (source, revision, synced_at) VALUES (?, ?, ?)',
+                         (source, revision.hexdigest(), time.time()))
+        return SyncStats(len(inserts), len(updates), len(stored), time.perf_counter() - start)
+
+    def revision(self, s_id: str, s_range: str) -> Optional[str]:
+        found = self._connection().execute(
+            'SELECT revision FROM sheet_meta WHERE source = ?', (self.source(s_id, s_range),)).fetchone()
+        return found[0] if found else None
+
+    def synced_at(self, s_id: str, s_range: str) -> Optional[float]:
+        found = self._connection().execute(
+            'SELECT synced_at FROM sheet_meta WHERE source = ?', (self.source(s_id, s_range),)).fetchone()
+        return found[0] if found else None
+
+    def _rows(self, sql: str, params: Iterable) -> List[List[str]]:
+        return [json.loads(data) for (data,) in self._connection().execute(sql, tuple(params))]
+
+    def values(self, s_id: str, s_range: str) -> List[List[str]]:
+        """Строки диапазона в порядке листа - то же, что вернул бы Sheets API."""
+        return self._rows('SELECT data FROM sheet_rows WHERE source = ? ORDER BY position',
+                          (self.source(s_id, s_range),))
+
+    def sessions(self, s_id: str, s_range: str) -> Dict[int, List[List[str]]]:
+        """Участники по номерам заседаний (по индексу session)."""
+        sessions = defaultdict(list)
+        rows = self._connection().execute(
+            'SELECT session, data FROM sheet_rows WHERE source = ? AND session IS NOT NULL '
+            'ORDER BY session, position', (self.source(s_id, s_range),))
+        for session, data in rows:
+            sessions[session].append(json.loads(data))
+        return sessions
+
+    def session(self, s_id: str, s_range: str, session: int) -> List[List[str]]:
+        return self._rows('SELECT data FROM sheet_rows WHERE source = ? AND session = ? ORDER BY position',
+                          (self.source(s_id, s_range), session))
+
+    def by_decision(self, s_id: str, s_range: str, decisions: Iterable[str]) -> List[List[str]]:
+        decisions = list(decisions)
+        marks = ', '.join('?' * len(decisions))
+        return self._rows(f'SELECT data FROM sheet_rows WHERE source = ? AND decision IN ({marks}) ORDER BY position',
+                          (self.source(s_id, s_range), *decisions))
+
+    def by_group(self, s_id: str, s_range: str, group: str) -> List[List[str]]:
+        return self._rows('SELECT data FROM sheet_rows WHERE source = ? AND grp = ? ORDER BY position',
+                          (self.source(s_id, s_range), group))
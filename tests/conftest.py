@@ -0,0 +1,63 @@
+import os
+import random
+import sys
+
+import pytest
+
+# Модули лежат в корне репозитория
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SESSIONS = 4
+
+
+def make_student_data(rows, sessions=SESSIONS, seed=0):
+    """Строки Sheet1 как их отдаёт Google Sheets: пустые ячейки в конце строки отброшены,
+    поэтому длина строк разная (без решения - 16 столбцов, с решением - 17, с заметкой - 19,
+    в том числе при пустом решении)."""
+    rnd = random.Random(seed)
+    surnames = ['Иванов', 'Петров', 'Сидоров', 'Кузнецов', 'Ёлкин', 'Смирнов']
+    names = ['Алексей', 'Борис', 'Виктор', 'Григорий']
+    patronymics = ['Андреевич', 'Сергеевич', 'Павлович']
+    data = []
+    for i in range(rows):
+        row = [''] * 19
+        row[7] = f'{rnd.choice(surnames)}{i}'
+        row[8] = rnd.choice(names)
+        row[9] = rnd.choice(patronymics)
+        row[11] = f'4{rnd.randint(1, 4)}{rnd.randint(10, 99)}' if rnd.random() > 0.2 else ''
+        row[12] = rnd.choice(['студент', 'магистр'])
+        row[13] = f'Разработка системы № {i} для обработки данных & анализа <моделей>  '
+        row[15] = str(i % sessions + 1)
+        row[16] = rnd.choice(['', '0', '1', '2'])
+        if rnd.random() < 0.3:
+            row[18] = 'заметка'
+        while row and row[-1] == '':
+            row.pop()
+        data.append(row)
+    return data
+
+
+def make_tech_data(sessions=SESSIONS):
+    head = ['43', 'Компьютерных технологий и программной инженерии', 'Охотников Владимир Викторович',
+            'доцент', 'unids@guap.ru', '+7 812 000-00-00', 'Петров Пётр Петрович', 'ст. преподаватель',
+            '', '', '']
+    return [head + [f'2025-04-{k % 28 + 1:02d}', '10:00', f'52-{k:02d}'] for k in range(sessions)]
+
+
+@pytest.fixture
+def student_data():
+    return make_student_data(60)
+
+
+@pytest.fixture
+def tech_data():
+    return make_tech_data()
+
+
+@pytest.fixture
+def report_dir(tmp_path, monkeypatch):
+    """Рабочий каталог с report/, куда пишут генераторы из main.py."""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'report').mkdir()
+    return tmp_path
@@ -0,0 +1,107 @@
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import cancellation
+import docx_zip
+import ordering
+import participant_index
+import shared_cache
+import validation
+
+# Кэши модулей делят потоки запросов FastAPI: вытеснение в одном потоке не должно ронять другой
+
+
+def hammer(func, keys, rounds=4000, threads=8):
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # потоки переключаются чаще - гонка проявляется сразу
+    try:
+        with ThreadPoolExecutor(threads) as pool:
+            list(pool.map(func, (keys[i % len(keys)] for i in range(rounds))))
+    finally:
+        sys.setswitchinterval(interval)
+
+
+def test_compressed_members():
+    contents = [f'часть {i}'.encode('utf-8') * 50 for i in range(docx_zip.CACHE_SIZE * 2)]
+    hammer(lambda content: docx_zip.compressed(content), contents)
+    assert len(docx_zip._members) <= docx_zip.CACHE_SIZE
+    member = docx_zip.compressed(contents[0])
+    assert docx_zip.compressed(contents[0]) is member
+
+
+def test_validation_cache(student_data, tech_data):
+    revisions = [f'r{i}' for i in range(validation.CACHE_SIZE * 2)]
+    hammer(lambda revision: validation.validate_cached(student_data, tech_data, 'programme', revision), revisions,
+           rounds=2000)
+    assert len(validation._cache) <= validation.CACHE_SIZE
+
+
+def test_sort_keys_and_index_caches(student_data, tech_data):
+    revisions = [f'r{i}' for i in range(ordering.CACHE_SIZE * 3)]
+    hammer(lambda revision: ordering.sort_keys(student_data, tech_data, revision), revisions)
+    hammer(lambda revision: participant_index.get_index(revision, lambda: student_data), revisions, rounds=1000)
+    assert len(ordering._cache) <= ordering.CACHE_SIZE
+    assert len(participant_index._indexes) <= participant_index.CACHE_SIZE
+
+
+def test_shared_cache_locks_per_key(tmp_path):
+    # чужой ключ не ждёт занятый, свой ждёт с контрольными точками и сроком; файлы блокировок не копятся
+    cache = shared_cache.SharedCache(str(tmp_path / 'cache.sqlite'), lock_timeout=0.2)
+    with cache.lock('sheet:a'):
+        start = time.monotonic()
+        assert cache.get_or_create('sheet:b', lambda: b'b') == b'b'
+        assert time.monotonic() - start < 0.1
+        with pytest.raises(shared_cache.LockTimeout):
+            cache.get_or_create('sheet:a', lambda: b'a')
+        token = cancellation.CancelToken()
+        token.cancel(cancellation.DISCONNECT)
+        reset = cancellation.current.set(token)
+        try:
+            with pytest.raises(cancellation.Cancelled), cache.lock('sheet:a', timeout=60):
+                pass
+        finally:
+            cancellation.current.reset(reset)
+    assert cache.get_or_create('sheet:a', lambda: b'a') == b'a'
+    assert os.listdir(cache.lock_dir) == []
+
+
+def test_shared_cache_single_create_under_contention(tmp_path):
+    cache = shared_cache.SharedCache(str(tmp_path / 'cache.sqlite'))
+    creates = []
+
+    def create():
+        creates.append(1)
+        time.sleep(0.05)
+        return b'value'
+
+    with ThreadPoolExecutor(8) as pool:
+        # у каждого потока своё соединение и свой open файла блокировки - как у разных воркеров
+        values = list(pool.map(lambda _: cache.get_or_create('docx:report', create), range(32)))
+    assert values == [b'value'] * 32 and len(creates) == 1
+    assert os.listdir(cache.lock_dir) == []
+
+
+def test_participant_index_follows_shared_cache(student_data, tmp_path, monkeypatch):
+    import v4
+    from sheet_store import SheetStore
+
+    fetches = []
+    rows = [student_data[:10]]
+
+    def fetch(s_id, s_range):
+        fetches.append(s_range)
+        return rows[0]
+
+    monkeypatch.setattr(v4, 'shared_cache', shared_cache.SharedCache(str(tmp_path / 'cache.sqlite')))
+    monkeypatch.setattr(v4, 'sheet_store', SheetStore(str(tmp_path / 'sheets.sqlite')))
+    monkeypatch.setattr(v4, 'load_google_sheet', fetch)
+    index = v4.participant_index()
+    assert v4.participant_index() is index and len(fetches) == 1  # второй раз - из общего кэша
+    assert index.search()['total'] == 10
+    rows[0] = student_data[:20]
+    v4.shared_cache.delete(f"sheet:{v4.GOOGLE_SHEET_ID}:{v4.STUD_RANGE}")  # как после записи распределения
+    assert v4.participant_index().search()['total'] == 20 and len(fetches) == 2
@@ -0,0 +1,124 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pytest
+from starlette.responses import StreamingResponse
+
+import admission
+import cancellation
+from admission import AdmissionController, Overloaded
+from cancellation import CancelOnDisconnect, checkpoint
+
+# Срок RENDER_DEADLINE - на подготовку документа: медленный клиент не должен обрывать поток
+
+
+def chunks(count, produce=0.0):
+    for i in range(count):
+        time.sleep(produce)
+        checkpoint('render', i, count)
+        yield b'x' * 1024
+
+
+def run(body, deadline, read=0.0):
+    async def app(scope, receive, send):
+        await StreamingResponse(body)(scope, receive, send)
+
+    sent = []
+
+    async def receive():
+        await asyncio.sleep(60)  # клиент не уходит
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.body':
+            await asyncio.sleep(read)
+        sent.append(message)
+
+    scope = {'type': 'http', 'path': '/conferences/report', 'method': 'GET', 'headers': []}
+    middleware = CancelOnDisconnect(app, deadline=deadline, prefixes=('/conferences',))
+    try:
+        asyncio.run(middleware(scope, receive, send))
+    except cancellation.Cancelled as e:
+        return sent, e
+    return sent, None
+
+
+def test_slow_client_is_not_cut_off():
+    # отдача идёт 10 * 0.05 с - дольше срока, рендеринг укладывается
+    sent, error = run(chunks(10), deadline=0.2, read=0.05)
+    assert error is None
+    assert sent[0]['status'] == 200
+    assert b''.join(m.get('body', b'') for m in sent[1:]) == b'x' * 1024 * 10
+    assert not sent[-1].get('more_body', False)
+
+
+def test_slow_render_still_hits_deadline():
+    sent, error = run(chunks(10, produce=0.05), deadline=0.2)
+    # ответ уже начат - соединение обрывается, а не отдаётся обрезанный файл
+    assert error is not None and error.reason == cancellation.DEADLINE
+    assert sent[0]['status'] == 200
+    assert sent[-1].get('more_body', False)
+
+
+def test_deadline_before_response_gives_504():
+    def late():
+        time.sleep(0.1)
+        checkpoint('render')
+        yield b''
+
+    async def app(scope, receive, send):
+        next(late())
+
+    async def receive():
+        await asyncio.sleep(60)
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'path': '/conferences/report', 'method': 'GET', 'headers': []}
+    asyncio.run(CancelOnDisconnect(app, deadline=0.05, prefixes=('/conferences',))(scope, receive, send))
+    assert sent[0]['status'] == 504
+
+
+
+def test_leader_cancelled_follower_renders_again():
+    # рендеринг отменён вместе с запросом, который его начал: ожидавший запускает его сам
+    controller = AdmissionController(limit=2, queue=2)
+    gate = threading.Event()
+    calls = []
+
+    def cancelled_with_leader():
+        calls.append('leader')
+        gate.wait()
+        raise cancellation.Cancelled(cancellation.DISCONNECT, 'render')
+
+    with ThreadPoolExecutor(2) as pool:
+        leader = pool.submit(controller.run, 'report', cancelled_with_leader)
+        while not controller.metrics()['in_flight_keys']:
+            time.sleep(0.005)
+        follower = pool.submit(controller.run, 'report', lambda: calls.append('follower') or b'docx')
+        while not controller.metrics()['piggybacked']:
+            time.sleep(0.005)
+        gate.set()
+        assert follower.result(5) == b'docx'
+        assert isinstance(leader.exception(5), cancellation.Cancelled)
+    assert calls == ['leader', 'follower'] and controller.metrics()['in_flight_keys'] == 0
+
+
+def test_follower_retries_are_bounded():
+    # каждый раз находится чужой рендеринг, и каждый отменён: не бесконечный повтор, а 503
+    class AlwaysCancelled(dict):
+        def get(self, key, default=None):
+            flight = Future()
+            flight.set_exception(cancellation.Cancelled(cancellation.DISCONNECT, 'render'))
+            return flight
+
+    controller = AdmissionController(limit=2, queue=2)
+    controller._flights = AlwaysCancelled()
+    with pytest.raises(Overloaded):
+        controller.run('report', lambda: b'docx')
+    assert controller.metrics()['piggybacked'] == admission.RETRIES + 1
@@ -0,0 +1,72 @@
+import zipfile
+
+import pytest
+
+import doc_templates
+import docx_stream
+import main
+import main_old
+
+# Скомпилированные шаблоны templates/*.json дают тот же word/document.xml, что и генераторы на python-docx
+
+
+def document_xml(path):
+    with zipfile.ZipFile(path) as zf:
+        return zf.read(docx_stream.DOCUMENT_PART)
+
+
+def template_xml(name, student_data, tech_data):
+    return document_xml(doc_templates.generate_document(name, student_data, tech_data, 'template.docx'))
+
+
+def old_layout(student_data, tech_data):
+    """Те же участники в раскладке main_old.py (A:L и A:M)."""
+    cell = lambda row, index: row[index] if len(row) > index else ''
+    students = [['', f'{r[7]} {r[8]} {r[9]}', r[13], '', r[12], r[11], '', '', r[15], cell(r, 16), '', '']
+                for r in student_data]
+    tech = [row[:11] + [f'{row[11]} {row[12]}', row[13]] for row in tech_data]
+    return students, tech
+
+
+@pytest.mark.parametrize('name, generate', [
+    ('programme', main.generate_conference_program),
+    ('report', main.generate_conference_report),
+    ('publications', main.generate_conference_list),
+])
+def test_template_matches_generator(name, generate, student_data, tech_data, report_dir):
+    assert {len(row) for row in student_data} == {16, 17, 19}
+    assert template_xml(name, student_data, tech_data) == document_xml(generate(student_data, tech_data))
+
+
+@pytest.mark.parametrize('name, generate, path', [
+    ('programme_main_old', main_old.generate_conference_program, 'report/Программа конференции.docx'),
+    ('report_main_old', main_old.generate_conference_report, 'report/Отчёт о конференции.docx'),
+    ('publications_main_old', main_old.generate_conference_list,
+     'report/Список представляемых к публикации докладов.docx'),
+])
+def test_main_old_template_matches_generator(name, generate, path, student_data, tech_data, report_dir):
+    students, tech = old_layout(student_data, tech_data)
+    generate(students, tech)
+    assert template_xml(name, students, tech) == document_xml(path)
+
+
+def test_combined_section_matches_programme(student_data, tech_data):
+    # секция сводной программы: разрыв страницы, заголовок с уровнем структуры, дальше - как в программе
+    programme = ''.join(doc_templates.iter_document('programme', student_data, tech_data))
+    section = docx_stream.render_program_section((student_data, tech_data))
+    tail = lambda body: body[body.rindex('<w:p>', 0, body.index('Научный руководитель секции')):]
+    assert section.startswith(docx_stream.PAGE_BREAK) and docx_stream.OUTLINE in section
+    assert tail(section) == tail(programme)
+
+
+def test_decision_texts_come_from_template():
+    plan = doc_templates.Plan({
+        'decisions': {'1': 'в сборник'},
+        'decision_default': 'не в сборник',
+        'body': [{'participants': [{'paragraph': '{row:7}: {row:16|decision}'}]}],
+    })
+    rows = [[''] * 7 + ['А'] + [''] * 8 + ['1'], [''] * 7 + ['Б'] + [''] * 8 + ['2'], [''] * 7 + ['В']]
+    body = ''.join(plan.render(rows, [[]]))
+    assert 'А: в сборник' in body and 'Б: не в сборник' in body and 'В: не в сборник' in body
+    with pytest.raises(doc_templates.TemplateError):
+        doc_templates.Plan({'decisions': ['1'], 'body': []})
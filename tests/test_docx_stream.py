@@ -0,0 +1,71 @@
+import io
+import zipfile
+
+import pytest
+
+from functools import partial
+
+import doc_templates
+import docx_stream
+import main
+
+# Потоковый писатель с телом по шаблонам templates/ должен давать тот же word/document.xml,
+# что и генераторы main.py на python-docx, и на краевых данных (обычный случай - tests/test_doc_templates.py)
+
+DOCUMENTS = [
+    (main.generate_conference_program, partial(doc_templates.iter_document, 'programme')),
+    (main.generate_conference_report, partial(doc_templates.iter_document, 'report')),
+    (main.generate_conference_list, partial(doc_templates.iter_document, 'publications')),
+]
+
+
+def document_xml(path_or_file):
+    with zipfile.ZipFile(path_or_file) as zf:
+        return zf.read(docx_stream.DOCUMENT_PART)
+
+
+def assert_same(generate, iter_body, student_data, tech_data, tmp_path):
+    expected = document_xml(generate(student_data, tech_data))
+    docx_stream.write_docx(iter_body(student_data, tech_data), str(tmp_path / 'stream.docx'))
+    assert document_xml(str(tmp_path / 'stream.docx')) == expected
+
+
+@pytest.mark.parametrize('generate, iter_body', DOCUMENTS, ids=['programme', 'report', 'publications'])
+def test_same_document_xml_without_decisions(generate, iter_body, student_data, tech_data, report_dir):
+    # середина конференции: решений ещё нет ни у кого
+    student_data = [row[:16] for row in student_data]
+    assert_same(generate, iter_body, student_data, tech_data, report_dir)
+
+
+@pytest.mark.parametrize('generate, iter_body', DOCUMENTS, ids=['programme', 'report', 'publications'])
+def test_same_document_xml_special_text(generate, iter_body, student_data, tech_data, report_dir):
+    student_data[0][13] = 'Тема\tс табуляцией\nи переносом  '
+    student_data[1][13] = ' ведущий пробел & <разметка> "кавычки"'
+    student_data[2][13] = ''
+    assert_same(generate, iter_body, student_data, tech_data, report_dir)
+
+
+def test_stream_chunks_form_same_package(student_data, tech_data):
+    body = list(doc_templates.iter_document('report', student_data, tech_data))
+    whole = docx_stream.render_docx(iter(body))
+    chunked = b''.join(docx_stream.iter_docx(iter(body), chunk_size=1024))
+    with zipfile.ZipFile(io.BytesIO(chunked)) as zf:
+        assert zf.testzip() is None
+    assert document_xml(io.BytesIO(chunked)) == document_xml(io.BytesIO(whole))
+
+
+@pytest.mark.parametrize('generate, iter_body', DOCUMENTS, ids=['programme', 'report', 'publications'])
+def test_control_characters_are_dropped(generate, iter_body, student_data, tech_data, report_dir):
+    # \x0b - перенос строки внутри ячейки Excel; python-docx на таких символах падает,
+    # поток выбрасывает их и даёт то же, что python-docx на очищенных данных
+    dirty = [list(row) for row in student_data]
+    for row in dirty[:8]:
+        row[7] = row[7][:2] + '\x01' + row[7][2:]
+        row[12] += '\x0c'
+        row[13] = row[13].replace(' ', '\x0b', 1) + '\x1f'
+    clean = [[docx_stream.xml_safe(cell) for cell in row] for row in dirty]
+    expected = document_xml(generate(clean, tech_data))
+    docx_stream.write_docx(iter_body(dirty, tech_data), 'stream.docx')
+    assert document_xml('stream.docx') == expected
+    with pytest.raises(ValueError):
+        generate(dirty, tech_data)
@@ -0,0 +1,64 @@
+import io
+import zipfile
+
+from lxml import etree
+
+import docx_stream
+import mail_merge
+import main
+
+
+def merged(student_data, tech_data, kind):
+    return list(mail_merge.iter_merge(student_data, tech_data, mail_merge.builtin_template(kind), kind, workers=1,
+                                      decisions=mail_merge.ALLOWED_DECISIONS.get(kind)))
+
+
+def document_text(content):
+    with zipfile.ZipFile(io.BytesIO(content)) as zf:
+        return ''.join(etree.fromstring(zf.read(docx_stream.DOCUMENT_PART)).itertext())
+
+
+def test_session_outside_tech_sheet_is_skipped(student_data, tech_data):
+    student_data = student_data[:4]
+    student_data[0][15] = '0'  # tech_data[-1] - последнее заседание, не «нулевое»
+    student_data[1][15] = str(len(tech_data) + 1)
+    names = [name for name, _ in merged(student_data, tech_data, 'invitation')]
+    assert len(names) == 2 and names[0].startswith('00004 ')
+
+
+def test_certificate_only_for_accepted_report(student_data, tech_data):
+    # без решения (короткая строка или пустая ячейка) и с решением '0' сертификата нет
+    student_data[0][16:17] = ['']
+    decisions = [row[16] if len(row) > 16 else '' for row in student_data]
+    assert {'0', '1', '2', ''} <= set(decisions) and any(len(row) <= 16 for row in student_data)
+    certificates = merged(student_data, tech_data, 'certificate')
+    invitations = merged(student_data, tech_data, 'invitation')
+    assert len(certificates) == decisions.count('1') + decisions.count('2')
+    assert len(invitations) == len(student_data)
+    texts = [document_text(content) for _, content in certificates]
+    assert all(main.RECOMMENDATIONS['0'] not in text and main.NO_DECISION not in text for text in texts)
+
+
+def test_control_characters_in_fields(student_data, tech_data):
+    student_data = student_data[:1]
+    student_data[0][13] = 'Тема\x0bв две строки\x01'
+    (_, content), = merged(student_data, tech_data, 'invitation')
+    assert 'Темав две строки' in document_text(content)
+
+
+def test_worker_processes_match_and_pool_is_shared(student_data, tech_data):
+    # пачки по MERGE_BATCH в общем пуле: те же документы в том же порядке, пул - один на все запросы
+    template = mail_merge.builtin_template('invitation')
+    texts = lambda merge: [(name, document_text(content)) for name, content in merge]
+    in_thread = texts(mail_merge.iter_merge(student_data, tech_data, template, 'приглашение', workers=1))
+    docx_stream.configure_pool(2)
+    try:
+        for _ in range(2):
+            pooled = texts(mail_merge.iter_merge(student_data, tech_data, template, 'приглашение', workers=2))
+            assert pooled == in_thread
+            pool = docx_stream.process_pool()
+            assert len(pool._processes) <= 2
+        assert docx_stream.process_pool() is pool
+    finally:
+        docx_stream.shutdown_pool()
+        docx_stream.configure_pool(None)
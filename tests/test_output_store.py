@@ -0,0 +1,100 @@
+import hashlib
+import multiprocessing
+import os
+import random
+import threading
+import zipfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import main
+from output_store import OutputStore, default_path
+
+# Процессы и потоки публикуют версии в общий каталог с маленьким max_bytes, читают свои и чужие
+# версии и общий файл, сборка идёт в фоне и вручную: ни одного недописанного или смешанного файла
+
+MAX_BYTES = 2 * 2 ** 20
+GRACE = 0.1  # в работе - минута; здесь короче, чтобы сборка шла наперегонки с публикацией
+REVISIONS = 200
+
+
+def write_payload(student_data, tech_data, file_path='report/payload.bin'):
+    """«Генератор»: тело пишется кусками, первые 32 байта - его sha256."""
+    seed, size = map(int, student_data[0])
+    body = random.Random(seed).randbytes(size)
+    data = hashlib.sha256(body).digest() + body
+    with open(file_path, 'wb') as f:
+        for start in range(0, len(data), 8192):
+            f.write(data[start:start + 8192])
+            f.flush()  # другие процессы видят файл недописанным
+
+
+def intact(data):
+    return len(data) > 32 and hashlib.sha256(data[32:]).digest() == data[:32]
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def publish_and_read(job):
+    """Процесс с двумя потоками; счётчик целых и испорченных чтений."""
+    root, rounds, worker = job
+    store = OutputStore(root, max_bytes=MAX_BYTES, grace=GRACE)
+    latest = os.path.join(root, 'latest.bin')
+    stats = Counter()
+
+    def client(thread):
+        rnd = random.Random(worker * 100 + thread)
+        for i in range(rounds):
+            data = [[str(rnd.randrange(2 ** 32)), str(rnd.randrange(20, 120) * 1024)]]
+            store.render(write_payload, data, [], f"r{rnd.randrange(REVISIONS)}", latest=latest)
+            stats[f"latest {intact(read(latest))}"] += 1
+            other = store.read('payload.bin', f"r{rnd.randrange(REVISIONS)}")
+            if other is not None:
+                stats[f"other {intact(other)}"] += 1
+            if i % 10 == 0:
+                store.collect()
+
+    store.start(0.05)
+    threads = [threading.Thread(target=client, args=(thread,)) for thread in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    store.stop()
+    return stats, store.removed
+
+
+def test_concurrent_publish_and_collect(tmp_path):
+    root = str(tmp_path / 'outputs')
+    with multiprocessing.get_context('spawn').Pool(3) as pool:
+        results = pool.map(publish_and_read, [(root, 40, worker) for worker in range(3)])
+    stats = sum((counts for counts, _ in results), Counter())
+    assert stats['latest True'] == 3 * 2 * 40
+    assert not stats['latest False'] and not stats['other False']
+    assert sum(removed for _, removed in results) > 0  # сборка действительно шла наперегонки
+
+    store = OutputStore(root, max_bytes=MAX_BYTES, grace=0)
+    assert store.collect()['bytes'] <= MAX_BYTES
+    assert not os.listdir(store.temp_dir)
+    assert all(intact(read(path)) for _, _, _, path in store._entries())
+    assert intact(read(os.path.join(root, 'latest.bin')))
+
+
+def test_concurrent_render_of_one_revision(student_data, tech_data, report_dir):
+    # один документ на строках разной длины из нескольких потоков: версия и файл пункта меню - целые .docx
+    generate = main.generate_conference_report
+    with zipfile.ZipFile(generate(student_data, tech_data, 'expected.docx')) as zf:
+        expected = zf.read('word/document.xml')
+    store = OutputStore('report/outputs')
+    latest = default_path(generate)
+    with ThreadPoolExecutor(4) as pool:
+        paths = list(pool.map(lambda _: store.render(generate, student_data, tech_data, 'r1', latest=latest), range(8)))
+    assert set(paths) == {latest}
+    for path in (latest, store.path(latest, 'r1')):
+        with zipfile.ZipFile(path) as zf:
+            assert zf.testzip() is None
+            assert zf.read('word/document.xml') == expected
+    assert not os.listdir(store.temp_dir)
@@ -0,0 +1,51 @@
+import importlib.util
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import doc_templates
+import docx_stream
+import pdf_export
+
+HAS_OFFICE = shutil.which(pdf_export.SOFFICE) is not None and importlib.util.find_spec('uno') is not None
+
+
+def test_first_requests_share_one_pool(monkeypatch):
+    import v4
+
+    created = []
+
+    class Pool:
+        def __init__(self, size):
+            time.sleep(0.05)  # запуск пула небыстрый - остальные потоки успевают войти в get_pdf_pool
+            created.append(self)
+
+    monkeypatch.setattr(v4, 'PdfConverterPool', Pool)
+    monkeypatch.setattr(v4, 'pdf_pool', None)
+    barrier = threading.Barrier(8)
+
+    def first_request(_):
+        barrier.wait()
+        return v4.get_pdf_pool()
+
+    with ThreadPoolExecutor(8) as pool:
+        pools = set(pool.map(first_request, range(8)))
+    assert len(created) == 1 and pools == {created[0]}
+
+
+@pytest.mark.skipif(not HAS_OFFICE, reason='нужны soffice и python3-uno')
+def test_convert_with_recycled_office(student_data, tech_data, tmp_path):
+    paths = []
+    for i in range(3):
+        path = tmp_path / f'programme_{i}.docx'
+        docx_stream.write_docx(doc_templates.iter_document('programme', student_data, tech_data), str(path))
+        paths.append(path)
+    with pdf_export.PdfConverterPool(size=1, recycle_after=2) as pool:
+        results = [future.result(timeout=300) for future in [pool.submit(path) for path in paths]]
+    assert pool.restarts >= 1
+    for result in results:
+        with open(result, 'rb') as f:
+            assert f.read(5) == b'%PDF-'
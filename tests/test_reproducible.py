@@ -0,0 +1,56 @@
+import hashlib
+import io
+import multiprocessing
+import os
+import time
+
+# REPRODUCIBLE_DOCX=1: одинаковые данные в разных процессах (свой PYTHONHASHSEED) и в разные
+# секунды дают побайтно одинаковые .docx и ZIP; doc.save без режима - для контроля, что проверка видит разницу
+
+
+def render_hashes(job):
+    """Рендеринг в свежем процессе: хеши всех видов вывода."""
+    workdir, delay = job
+    import docx
+    import doc_templates
+    import docx_stream
+    import mail_merge
+    import main
+    from conftest import make_student_data, make_tech_data
+
+    time.sleep(delay)  # чтобы процессы писали в разные секунды
+    os.chdir(workdir)
+    os.makedirs('report')
+    student_data = make_student_data(120)
+    tech_data = make_tech_data()
+    digest = lambda data: hashlib.sha256(data).hexdigest()
+    with open(main.generate_conference_program(student_data, tech_data), 'rb') as f:
+        python_docx = f.read()
+    doc = docx.Document()
+    doc.add_paragraph('doc.save')
+    buf = io.BytesIO()
+    doc.save(buf)
+    return {
+        'main.generate_conference_program': digest(python_docx),
+        'docx_stream.render_docx': digest(docx_stream.render_docx(
+            doc_templates.iter_document('programme', student_data, tech_data))),
+        'docx_stream.iter_docx': digest(b''.join(docx_stream.iter_docx(
+            doc_templates.iter_document('report', student_data, tech_data)))),
+        'doc_templates': digest(docx_stream.render_docx(
+            doc_templates.iter_document('publications', student_data, tech_data), None)),
+        'mail_merge': digest(b''.join(mail_merge.iter_merge_zip(
+            student_data[:50], tech_data, mail_merge.builtin_template('invitation'), 'приглашение', workers=1))),
+        'doc.save': digest(buf.getvalue()),
+    }
+
+
+def test_same_bytes_across_processes(tmp_path, monkeypatch):
+    monkeypatch.setenv('REPRODUCIBLE_DOCX', '1')
+    context = multiprocessing.get_context('spawn')  # свежие интерпретаторы, разные PYTHONHASHSEED
+    jobs = [(str(tmp_path / str(i)), 1.1 * i) for i in range(3)]
+    for workdir, _ in jobs:
+        os.makedirs(workdir)
+    with context.Pool(3) as pool:
+        results = pool.map(render_hashes, jobs)
+    different = {name for name in results[0] if len({result[name] for result in results}) > 1}
+    assert different == {'doc.save'}
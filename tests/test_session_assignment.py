@@ -0,0 +1,77 @@
+import pytest
+from google.oauth2.service_account import Credentials
+import googleapiclient.discovery
+
+import session_assignment
+from session_assignment import StaleAssignment, assign_sessions, write_assignment
+
+
+class FakeSheet:
+    """values().get/batchUpdate поверх списка строк, как в Sheets."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.updates = []
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def get(self, spreadsheetId, range):
+        return FakeRequest({'values': self.rows})
+
+    def batchUpdate(self, spreadsheetId, body):
+        self.updates.append(body['data'])
+        return FakeRequest({'totalUpdatedCells': sum(len(data['values']) for data in body['data'])})
+
+
+class FakeRequest:
+    def __init__(self, result):
+        self.result = result
+
+    def execute(self):
+        return self.result
+
+
+@pytest.fixture
+def planned(student_data, tech_data):
+    for row in student_data[::5]:
+        row[15] = ''
+    return student_data, assign_sessions(student_data, tech_data)
+
+
+@pytest.fixture
+def sheet(monkeypatch):
+    def install(rows):
+        fake = FakeSheet(rows)
+        monkeypatch.setattr(Credentials, 'from_service_account_file', lambda *args, **kwargs: None)
+        monkeypatch.setattr(googleapiclient.discovery, 'build', lambda *args, **kwargs: fake)
+        return fake
+    return install
+
+
+def test_write_when_rows_unchanged(planned, sheet):
+    student_data, assignment = planned
+    fake = sheet([list(row) for row in student_data])
+    assert write_assignment('sheet', assignment, student_data) == len(fake.updates[0][0]['values'])
+    assert fake.updates[0] == session_assignment.update_ranges(assignment)
+
+
+def test_nothing_written_when_rows_moved_or_assigned(planned, sheet):
+    student_data, assignment = planned
+    first, *rest = sorted(assignment.sessions)
+    current = [list(row) for row in student_data]
+    current.insert(first, current[first - 1])  # строку вставили выше: назначенные участники съехали вниз
+    fake = sheet(current)
+    with pytest.raises(StaleAssignment) as e:
+        write_assignment('sheet', assignment, student_data)
+    assert first in e.value.positions and not fake.updates
+
+    current = [list(row) for row in student_data]
+    current[rest[0]][15] = '1'  # номер уже проставили вручную
+    fake = sheet(current)
+    with pytest.raises(StaleAssignment) as e:
+        write_assignment('sheet', assignment, student_data)
+    assert e.value.positions == [rest[0]] and not fake.updates
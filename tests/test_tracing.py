@@ -0,0 +1,38 @@
+import json
+
+import pytest
+
+import tracing
+
+
+@pytest.fixture
+def tracer(tmp_path):
+    tracing.tracer.configure(str(tmp_path / 'traces.jsonl'), 1.0, max_bytes=4096)
+    yield tracing.tracer
+    tracing.tracer.configure(None)
+
+
+def test_trace_file_is_rotated(tracer, tmp_path):
+    path = tmp_path / 'traces.jsonl'
+    for batch in range(20):
+        for i in range(5):
+            with tracing.span('request', batch=batch, i=i):
+                with tracing.span('render', rows=i):
+                    pass
+        tracer.flush()
+        assert path.stat().st_size <= 4096
+    assert tracer.rotations > 0
+    backup = tmp_path / 'traces.jsonl.1'
+    assert backup.stat().st_size <= 4096
+    # каждая строка обоих файлов - целая пачка OTLP/JSON
+    for line in path.read_text(encoding='utf-8').splitlines() + backup.read_text(encoding='utf-8').splitlines():
+        assert json.loads(line)['resourceSpans'][0]['scopeSpans'][0]['spans']
+
+
+def test_tracing_is_off_without_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    tracing.tracer.configure(None)
+    with tracing.span('request') as root:
+        assert not root.sampled
+    tracing.tracer.flush()
+    assert not list(tmp_path.iterdir())
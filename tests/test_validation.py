@@ -0,0 +1,37 @@
+import main
+import validation
+from validation import validate_data
+
+# Пустое решение при заметке в столбце S: строка длиннее 16 столбцов, но решения ещё нет
+
+
+def undecided_with_note(student_data):
+    row = student_data[0]
+    row.extend([''] * (19 - len(row)))
+    row[16], row[18] = '', 'заметка'
+    return row
+
+
+def test_blank_decision_with_note_is_valid(student_data, tech_data):
+    undecided_with_note(student_data)
+    for document in validation.DOCUMENTS:
+        assert validate_data(student_data, tech_data, document) == []
+
+
+def test_unknown_decision_is_reported(student_data, tech_data):
+    student_data[0].extend([''] * (17 - len(student_data[0])))
+    student_data[0][16] = '3'
+    problems = validate_data(student_data, tech_data, 'report')
+    assert [(p.row, p.column) for p in problems] == [(validation.FIRST_ROW, 'Q')]
+
+
+def test_report_with_blank_decision(student_data, tech_data, report_dir):
+    # раньше: UnboundLocalError (или решение предыдущего участника) в отчёте python-docx
+    row = undecided_with_note(student_data)
+    student_data[1].extend([''] * (17 - len(student_data[1])))
+    student_data[1][16] = '2'
+    doc = main.docx.Document(main.generate_conference_report(student_data, tech_data))
+    decisions = {r.cells[1].text: r.cells[3].text for table in doc.tables for r in table.rows}
+    assert decisions[f"{row[7]} {row[8]} {row[9]}\n{row[13]}"] == main.NO_DECISION
+    assert main.recommendation_for(row) == main.NO_DECISION
+    assert main.recommendation_for(student_data[1]) == main.RECOMMENDATIONS['2']
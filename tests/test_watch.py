@@ -0,0 +1,128 @@
+import os
+import threading
+import time
+
+import pytest
+
+import watch
+
+# Режим наблюдения на подделке таблицы: серия правок - один цикл, перерисовываются
+# только документы, чьи столбцы изменились
+
+STUDENT_RANGE, TECH_RANGE = 'Sheet1!A2:S', 'Sheet2!A2:N'
+
+
+def cell(row, column, value):
+    # строки листа разной длины: пустые ячейки в конце Google Sheets не отдаёт
+    row.extend([''] * (column + 1 - len(row)))
+    row[column] = value
+
+
+class Sheet:
+    def __init__(self, student_data, tech_data):
+        self.student_data = student_data
+        self.tech_data = tech_data
+        self.save()
+        self.watcher = watch.Watcher(watch.FakeSheets('sheet.json'), 'fake', (STUDENT_RANGE, TECH_RANGE),
+                                     interval=0.05, debounce=0.3)
+
+    def save(self):
+        watch.write_fake_sheet('sheet.json', {STUDENT_RANGE: self.student_data, TECH_RANGE: self.tech_data})
+
+    def edit(self, change, times=1):
+        for n in range(times):
+            change(n)
+            self.save()
+            time.sleep(0.05)  # правки чаще, чем debounce
+
+    def settle(self, cycles):
+        deadline = time.monotonic() + 60
+        while self.watcher.cycles < cycles and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert self.watcher.cycles == cycles
+        time.sleep(self.watcher.debounce * 2)  # лишних циклов быть не должно
+        assert self.watcher.cycles == cycles
+        return dict(self.watcher.rendered)
+
+
+@pytest.fixture
+def sheet(student_data, tech_data, report_dir):
+    sheet = Sheet(student_data, tech_data)
+    stop = threading.Event()
+    thread = threading.Thread(target=sheet.watcher.run, args=(stop,))
+    thread.start()
+    yield sheet
+    stop.set()
+    thread.join()
+    assert not [name for name in os.listdir('report') if name.endswith('.tmp')]
+
+
+def decision(sheet):
+    def change(n):
+        row = sheet.student_data[n]
+        cell(row, 16, '2' if len(row) <= 16 or row[16] != '2' else '1')
+    return change
+
+
+def room(sheet):
+    def change(n):
+        sheet.tech_data[1][13] += 'a'
+    return change
+
+
+def comment(sheet):
+    def change(n):
+        cell(sheet.student_data[n], 18, f'примечание {n}')
+    return change
+
+
+@pytest.mark.parametrize('change, times, expected', [
+    (decision, 5, {'report', 'publications'}),
+    (room, 1, {'programme', 'report'}),
+    (comment, 3, set()),  # столбец, которого нет в документах
+], ids=['decisions', 'room', 'unused-column'])
+def test_series_of_edits_renders_changed_documents_once(sheet, change, times, expected):
+    before = sheet.settle(1)
+    assert set(before.values()) == {1}
+    sheet.edit(change(sheet), times)
+    after = sheet.settle(2)
+    assert {kind for kind in after if after[kind] != before[kind]} == expected
+    assert set(after.values()) <= {1, 2}
+
+
+class Flaky:
+    """Подделка, у которой первые failures обращений к значениям падают, как Sheets при сбое сети."""
+
+    def __init__(self, backend, failures):
+        self.backend = backend
+        self.failures = failures
+
+    def revision(self, s_id):
+        return self.backend.revision(s_id)
+
+    def values(self, s_id, s_range):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('сбой сети')
+        return self.backend.values(s_id, s_range)
+
+
+def test_errors_are_retried_with_backoff(student_data, tech_data, report_dir):
+    sheet = Sheet(student_data, tech_data)
+    watcher = sheet.watcher
+    watcher.backend = Flaky(watcher.backend, 3)
+    watcher.max_backoff = 0.2
+    stop = threading.Event()
+    thread = threading.Thread(target=watcher.run, args=(stop,))
+    thread.start()
+    try:
+        before = sheet.settle(1)  # первый цикл удался после трёх ошибок
+        assert set(before.values()) == {1} and watcher.backend.failures == 0
+        watcher.backend.failures = 2  # сбой при перерисовке правки: версия не принята, правка повторяется
+        sheet.edit(room(sheet))
+        after = sheet.settle(2)
+        assert after == {'programme': 2, 'report': 2, 'publications': 1}
+        assert watcher.revision == watcher.backend.revision('fake') and watcher.failures == 0
+    finally:
+        stop.set()
+        thread.join()
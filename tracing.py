@@ -0,0 +1,296 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Optional, Tuple
+
+# Трассировка этапов загрузки и рендеринга без внешних зависимостей.
+# Решение о записи принимается один раз на трассу (корневой span, обычно HTTP-запрос) с
+# вероятностью sample; в невыбранных трассах span - общий пустой объект, и работа
+# трассировки сводится к одной проверке contextvar. Готовые span копятся в очереди и
+# фоновым потоком пишутся в файл строками OTLP/JSON (как у file exporter OpenTelemetry
+# Collector: такой файл читает его otlpjsonfile receiver). Заголовок traceparent (W3C)
+# продолжает внешнюю трассу и её решение о записи.
+
+FLUSH_SECONDS = 1.0
+BATCH = 512
+QUEUE_LIMIT = 10000  # при переполнении span отбрасываются, а не копятся в памяти
+MAX_BYTES = 64 * 2 ** 20  # файл больше - переименовывается в <файл>.1 (прежний .1 удаляется)
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+STATUS_ERROR = 2
+
+
+def _attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {'key': key, 'value': {'boolValue': value}}
+    if isinstance(value, int):
+        return {'key': key, 'value': {'intValue': str(value)}}
+    if isinstance(value, float):
+        return {'key': key, 'value': {'doubleValue': value}}
+    return {'key': key, 'value': {'stringValue': str(value)}}
+
+
+class _NoopSpan:
+    """Span невыбранной трассы: все операции ничего не делают."""
+    sampled = False
+
+    def set(self, **attributes) -> None:
+        pass
+
+    def end(self, **attributes) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+NOOP = _NoopSpan()
+
+
+class _UnsampledRoot(_NoopSpan):
+    """Корень невыбранной трассы: помечает контекст, чтобы вложенные span тоже не писались."""
+    __slots__ = ('_reset',)
+
+    def __enter__(self):
+        self._reset = current.set(NOOP)
+        return NOOP
+
+    def __exit__(self, *exc) -> None:
+        current.reset(self._reset)
+
+
+class Span:
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent_id', 'kind', 'start', 'finish', 'attributes',
+                 'status', '_reset')
+    sampled = True
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: dict,
+                 kind: int = SPAN_KIND_INTERNAL):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.kind = kind
+        self.start = time.time_ns()
+        self.finish = None
+        self.attributes = attributes
+        self.status = None
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def end(self, **attributes) -> None:
+        if self.finish is None:
+            self.attributes.update(attributes)
+            self.finish = time.time_ns()
+            tracer.export(self)
+
+    def __enter__(self):
+        self._reset = current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        current.reset(self._reset)
+        if exc is not None:
+            self.status = {'code': STATUS_ERROR, 'message': f"{exc_type.__name__}: {exc}"}
+        self.end()
+
+    def to_otlp(self) -> dict:
+        span = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start),
+            'endTimeUnixNano': str(self.finish),
+            'attributes': [_attribute(key, value) for key, value in self.attributes.items()],
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        if self.status:
+            span['status'] = self.status
+        return span
+
+
+current: ContextVar[Optional[object]] = ContextVar('trace_span', default=None)
+
+
+class Tracer:
+    def __init__(self):
+        self.path = None  # None - трассировка выключена
+        self.sample = 0.0
+        self.service = 'conference'
+        self.max_bytes = MAX_BYTES
+        self.exported = 0
+        self.rotations = 0
+        self.dropped = 0
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def configure(self, path: Optional[str], sample: float = 0.01, service: str = 'conference',
+                  max_bytes: Optional[int] = MAX_BYTES) -> None:
+        """max_bytes=None - файл без ротации (например, его забирает и обрезает коллектор)."""
+        self.flush()
+        self.path = path or None
+        self.sample = sample
+        self.service = service
+        self.max_bytes = max_bytes
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def root(self, name: str, attributes: dict, parent: Optional[Tuple[str, str, bool]] = None,
+             kind: int = SPAN_KIND_INTERNAL):
+        """Корневой span: parent - (trace_id, span_id, sampled) из traceparent."""
+        if not self.enabled:
+            return NOOP
+        if parent is not None:
+            trace_id, parent_id, sampled = parent
+        else:
+            trace_id, parent_id, sampled = os.urandom(16).hex(), None, random.random() < self.sample
+        if not sampled:
+            return _UnsampledRoot()
+        return Span(name, trace_id, parent_id, attributes, kind)
+
+    def export(self, span: Span) -> None:
+        with self._lock:
+            if len(self._queue) >= QUEUE_LIMIT:
+                self.dropped += 1
+                return
+            self._queue.append(span)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='trace-exporter', daemon=True)
+                self._thread.start()
+        if len(self._queue) >= BATCH:
+            self._wake.set()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(FLUSH_SECONDS)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            spans, self._queue = list(self._queue), deque()
+        if not spans or self.path is None:
+            return
+        resource = {'attributes': [_attribute('service.name', self.service), _attribute('process.pid', os.getpid())]}
+        lines = [json.dumps({'resourceSpans': [{
+            'resource': resource,
+            'scopeSpans': [{'scope': {'name': 'conference'},
+                            'spans': [span.to_otlp() for span in spans[start:start + BATCH]]}],
+        }]}, ensure_ascii=False) + '\n' for start in range(0, len(spans), BATCH)]
+        try:
+            self._rotate(sum(map(len, lines)))
+            # одна запись на пачку: строки разных процессов в общем файле не перемешиваются
+            with open(self.path, 'a', encoding='utf-8') as f:
+                for line in lines:
+                    f.write(line)
+        except OSError as e:
+            self.dropped += len(spans)
+            logging.warning(f"Trace export to {self.path} failed: {e}")
+        else:
+            self.exported += len(spans)
+
+    def _rotate(self, incoming: int) -> None:
+        """Старый файл - в <файл>.1, если с новой пачкой он превысит max_bytes. Файл общий для
+        воркеров: если его уже переименовал другой процесс, пачка просто пишется в новый."""
+        if self.max_bytes is None:
+            return
+        try:
+            if os.path.getsize(self.path) + incoming <= self.max_bytes:
+                return
+            os.replace(self.path, self.path + '.1')
+        except FileNotFoundError:
+            return
+        self.rotations += 1
+
+    def metrics(self) -> dict:
+        return {'enabled': self.enabled, 'sample': self.sample, 'file': self.path, 'max_bytes': self.max_bytes,
+                'rotations': self.rotations, 'exported': self.exported, 'queued': len(self._queue),
+                'dropped': self.dropped}
+
+
+tracer = Tracer()
+
+
+def span(name: str, **attributes):
+    """Span этапа, вложенный в текущий (with span(...) as s: ... s.set(rows=...))."""
+    parent = current.get()
+    if parent is None:
+        return tracer.root(name, attributes)
+    if not parent.sampled:
+        return NOOP
+    return Span(name, parent.trace_id, parent.span_id, attributes)
+
+
+def start_span(name: str, **attributes):
+    """Span без входа в контекст - для кусков цикла и генераторов; закрывается через end()."""
+    parent = current.get()
+    if parent is None or not parent.sampled:
+        return NOOP
+    return Span(name, parent.trace_id, parent.span_id, attributes)
+
+
+def current_span():
+    return current.get() or NOOP
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """W3C traceparent: 00-<trace_id>-<span_id>-<flags>."""
+    parts = (header or '').strip().split('-')
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+        return parts[1], parts[2], bool(int(parts[3], 16) & 1)
+    except ValueError:
+        return None
+
+
+class TracingMiddleware:
+    """ASGI-middleware: корневой span на HTTP-запрос с кодом ответа и размером тела."""
+
+    def __init__(self, app, prefixes: Tuple[str, ...] = ('/',)):
+        self.app = app
+        self.prefixes = prefixes
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not tracer.enabled or not scope['path'].startswith(self.prefixes):
+            return await self.app(scope, receive, send)
+        headers = dict(scope.get('headers') or [])
+        parent = parse_traceparent(headers.get(b'traceparent', b'').decode('latin-1'))
+        target = scope['path'] + (f"?{scope['query_string'].decode('latin-1')}" if scope.get('query_string') else '')
+        root = tracer.root(f"{scope['method']} {scope['path']}", {'http.method': scope['method'], 'http.target': target},
+                           parent, SPAN_KIND_SERVER)
+        if not root.sampled:
+            with root:
+                return await self.app(scope, receive, send)
+        sent = 0
+
+        async def send_measured(message) -> None:
+            nonlocal sent
+            if message['type'] == 'http.response.start':
+                root.set(**{'http.status_code': message['status']})
+            elif message['type'] == 'http.response.body':
+                sent += len(message.get('body', b''))
+            await send(message)
+
+        with root:
+            try:
+                await self.app(scope, receive, send_measured)
+            finally:
+                root.set(**{'http.response_bytes': sent})
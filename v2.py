@@ -5,6 +5,8 @@ from google.oauth2.service_account import Credentials
 from datetime import datetime
 import docx
 import os
+from output_store import save_atomic
+from main import recommendation_for
 
 # Загрузка данных из Google Sheets
 def load_google_sheet(s_id, s_range):
@@ -93,7 +95,7 @@ def generate_conference_program(tech_data):
                 doc.add_paragraph(f'{row[13]}', style='Normal') 
                 participant_num += 1
 
-    doc.save('report/(1) Программа конференции.docx')
+    save_atomic(doc, 'report/(1) Программа конференции.docx')
 
 def generate_conference_report(tech_data):
     doc = docx.Document()
@@ -155,18 +157,8 @@ def generate_conference_report(tech_data):
                 initials = row[7] + " " + row[8] + " " + row[9]
                 status = f"{row[12]} Гр. № {row[11]}" if row[11] else row[12]
                 
-                # Решение с учётом трёх вариантов
-                if len(row) > 16:
-                    if row[16] == "1":
-                        recommendation = "опубликовать доклад в сборнике МСНК"
-                    elif row[16] == "2":
-                        recommendation = ("опубликовать доклад в сборнике МСНК; "
-                                          "рекомендовать к участию в финале конкурса "
-                                          "на лучшую студенческую научную работу ГУАП")
-                    elif row[16] == "0":
-                        recommendation = "доклад плохо подготовлен"
-                else:
-                    recommendation = "нет данных"
+                # Решение: код из столбца Q, пустой или неизвестный - "нет данных"
+                recommendation = recommendation_for(row)
 
                 row_cells = table.add_row().cells
                 row_cells[0].text = str(participant_num)
@@ -184,7 +176,7 @@ def generate_conference_report(tech_data):
 
     doc.add_paragraph("Подпись научного руководителя секции", style='Normal')
 
-    doc.save('report/(1) Отчёт о конференции.docx')
+    save_atomic(doc, 'report/(1) Отчёт о конференции.docx')
 
 def generate_conference_list(tech_data):
     doc = docx.Document()
@@ -200,7 +192,7 @@ def generate_conference_list(tech_data):
     doc.add_paragraph(f"Кафедра 43. Компьютерных технологий и программной инженерии")
     
     for row in tech_data:
-        if len(row) > 16 and row[16] == "1" or row[16] == "2":
+        if len(row) > 16 and row[16] in ("1", "2"):
             combined_paragraph = doc.add_paragraph()
             
             name_run = combined_paragraph.add_run(convert_to_initials(row[7] + " " + row[8] + " " + row[9]))
@@ -212,7 +204,7 @@ def generate_conference_list(tech_data):
     doc.add_paragraph("\n" * 2)
     doc.add_paragraph(f"Руководитель УНИДС {' ' * 40}")
 
-    doc.save('report/(1) Список представляемых к публикации докладов.docx')
+    save_atomic(doc, 'report/(1) Список представляемых к публикации докладов.docx')
 
 if __name__ == "__main__":
     if not os.path.exists('report'):
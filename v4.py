@@ -1,313 +1,660 @@
-from fastapi import FastAPI, HTTPException, Depends
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Header
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from googleapiclient.discovery import build
 from google.oauth2.service_account import Credentials
-from typing import Optional, List, Tuple
-from datetime import datetime
+from typing import Optional, List, Tuple, Literal
 import os
-import docx
-from docx.shared import Pt, Cm
-from docx.enum.text import WD_ALIGN_PARAGRAPH
 from pathlib import Path
 import logging
+import time
+import docx_stream
+from pdf_export import PdfConverterPool
+from validation import validate_cached
+from sheet_store import SheetStore
+import docx_zip
+from participant_index import ParticipantIndex, get_index
+from shared_cache import LockTimeout, SharedCache
+import mail_merge
+import proceedings
+import preview
+import ordering
+from admission import AdmissionController, Overloaded
+from cancellation import CancelOnDisconnect, checkpoint
+import cancellation
+from tracing import TracingMiddleware, span, tracer
+import doc_templates
+from functools import partial
+from session_assignment import Assignment, StaleAssignment, assign_sessions, apply_assignment, write_assignment
+import json
+import secrets
+import threading
+from memdiag import GROUPS, collect_documents, diagnostics, object_counts, release
+from output_store import OutputStore
+from contextlib import asynccontextmanager
+from main import ACCEPTED, generate_conference_program, generate_conference_report, generate_conference_list
+
+# Прогрев при старте: клиент Sheets, шаблоны, данные и документы готовятся в фоне,
+# /health/live отвечает сразу, /health/ready - когда прогрев закончен
+warmup_state = {"started": None, "finished": None, "steps": []}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warmup_state["started"] = time.time()
+    if os.environ.get("WARMUP", "1") != "0":
+        threading.Thread(target=warmup, name="warmup", daemon=True).start()
+    else:
+        warmup_state["finished"] = warmup_state["started"]
+    output_store.start()
+    yield
+    output_store.stop()
+    docx_stream.shutdown_pool()
+    if pdf_pool is not None:
+        pdf_pool.close()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 GOOGLE_SHEET_ID = '1MROr3Pw7nMG2vYW_AeqIy2q9FTF7URD3b24tyrBYWgE'
 STUD_RANGE = 'Sheet1!A2:S' 
 TECH_RANGE = 'Sheet2!A2:N'
+DOCX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+# Клиент Sheets: ключ сервисного аккаунта читается один раз, клиент строится один раз на поток
+# (httplib2 внутри клиента не потокобезопасен, а эндпоинты выполняются в пуле потоков)
+_sheets = threading.local()
+_credentials = None
+
+def sheets_service():
+    global _credentials
+    service = getattr(_sheets, "service", None)
+    if service is None:
+        if _credentials is None:
+            with span("sheets.credentials"):
+                _credentials = Credentials.from_service_account_file("service.json")
+        with span("sheets.client"):
+            service = build("sheets", "v4", credentials=_credentials)
+        _sheets.service = service
+    return service
+
+# Размер загруженного листа - для span и журнала вместо самих данных
+def sheet_summary(values: List[List[str]]) -> dict:
+    return {"rows": len(values), "cells": sum(map(len, values)),
+            "chars": sum(len(cell) for row in values for cell in row)}
 
 # Загрузка данных из Google Sheets
 def load_google_sheet(s_id: str, s_range: str) -> List[List[str]]:
-    try:
-        creds = Credentials.from_service_account_file("service.json")
-        service = build("sheets", "v4", credentials=creds)
-        sheet = service.spreadsheets()
-        result = sheet.values().get(spreadsheetId=s_id, range=s_range).execute()
-        logging.info(f"Google Sheets data: {result}")
-        return result.get("values", [])
-    except Exception as e:
-        logging.exception(f"Error loading data from Google Sheets: {e}")
-        raise HTTPException(status_code=500, detail=f"Error loading data from Google Sheets: {e}")
-
-
-# Установка стиля для документа
-def set_document_style(doc):
-    style = doc.styles['Normal']
-    font = style.font
-    font.name = 'Times New Roman'
-    font.size = Pt(12)
-    paragraph_format = style.paragraph_format
-    paragraph_format.line_spacing = 1.5
-    paragraph_format.first_line_indent = Cm(1)
-    paragraph_format.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
-    doc.sections[0].left_margin = Cm(2)
-    doc.sections[0].right_margin = Cm(2)
-    doc.sections[0].top_margin = Cm(2)
-    doc.sections[0].bottom_margin = Cm(2)
-
-def convert_to_initials(full_name):
-    parts = full_name.split()
-    if len(parts) == 3:
-        surname, name, patronymic = parts
-        return f"{surname} {name[0]}.{patronymic[0]}."
-    elif len(parts) == 2:
-        surname, name = parts
-        return f"{surname} {name[0]}."
+    checkpoint("fetch")  # клиент ушёл - не тратим квоту Sheets
+    with span("sheets.fetch", spreadsheet=s_id, range=s_range) as fetch_span:
+        try:
+            sheet = sheets_service().spreadsheets()
+            result = sheet.values().get(spreadsheetId=s_id, range=s_range).execute()
+            values = result.get("values", [])
+        except Exception as e:
+            logging.exception(f"Error loading data from Google Sheets: {e}")
+            raise HTTPException(status_code=500, detail=f"Error loading data from Google Sheets: {e}")
+        if fetch_span.sampled:
+            summary = sheet_summary(values)
+            fetch_span.set(**summary)
+            logging.info(f"Google Sheets {s_range}: {summary['rows']} rows, {summary['cells']} cells, "
+                         f"{summary['chars']} chars")
+        return values
+
+
+# Локальное зеркало листов: после каждой загрузки применяются только изменившиеся строки
+sheet_store = SheetStore(os.environ.get("SHEET_STORE", "report/sheets.sqlite"))
+
+def load_synced(s_range: str, s_id: str = GOOGLE_SHEET_ID) -> List[List[str]]:
+    values = load_google_sheet(s_id, s_range)
+    with span("sheets.sync", range=s_range) as sync_span:
+        stats = sheet_store.sync(s_id, s_range, values)
+        sync_span.set(inserted=stats.inserted, updated=stats.updated, deleted=stats.deleted)
+    logging.info(f"Sync {s_range}: +{stats.inserted} ~{stats.updated} -{stats.deleted} "
+                 f"in {stats.seconds * 1000:.1f} ms")
+    return values
+
+# Данные листа считаются свежими DATA_TTL секунд
+DATA_TTL = float(os.environ.get("DATA_TTL", "60"))
+
+# Кэш, общий для всех воркеров на машине: загруженные листы и готовые документы.
+# Пока один воркер загружает лист или рендерит документ, остальные ждут его результата.
+shared_cache = SharedCache(os.environ.get("SHARED_CACHE", "report/cache.sqlite"))
+DOCUMENT_TTL = float(os.environ.get("DOCUMENT_TTL", "3600"))
+
+# Временные файлы рендеринга и PDF - у каждого задания свои (параллельные запросы не пишут
+# в один report/programme.docx); файлы заданий упавших процессов удаляет фоновая сборка
+output_store = OutputStore(os.environ.get("OUTPUT_DIR", "report/outputs"),
+                           max_bytes=int(float(os.environ.get("OUTPUT_MAX_MB", "256")) * 2 ** 20))
+
+def load_cached(s_range: str, s_id: str = GOOGLE_SHEET_ID) -> Tuple[List[List[str]], str]:
+    """Строки листа и их ревизия в зеркале; из Sheets лист грузит один воркер раз в DATA_TTL."""
+    def fetch() -> bytes:
+        values = load_synced(s_range, s_id)
+        payload = {"revision": sheet_store.revision(s_id, s_range), "values": values}
+        return json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+    with span("sheets.load", range=s_range):
+        raw = shared_cache.get_or_create(f"sheet:{s_id}:{s_range}", fetch, DATA_TTL)
+        with span("sheets.parse", bytes=len(raw)) as parse_span:
+            payload = json.loads(raw)
+            parse_span.set(rows=len(payload["values"]))
+    return payload["values"], payload["revision"]
+
+# Поиск участников: индекс строится один раз на ревизию данных; строки и ревизия - одной записью
+# общего кэша (как у документов), поэтому индекс не окажется собран по строкам другой ревизии
+def participant_index() -> ParticipantIndex:
+    student_data, revision = load_cached(STUD_RANGE)
+    return get_index(revision, lambda: student_data)
+
+# Выборка для генераторов docx_stream из индексов хранилища (строки в порядке листа);
+# если зеркало уже ушло вперёд от ревизии revision или ревизии нет (строки переупорядочены),
+# генераторы разложат строки сами
+def stored_selection(kind: str, revision: Optional[str] = None, s_id: str = GOOGLE_SHEET_ID) -> dict:
+    if revision is None or sheet_store.revision(s_id, STUD_RANGE) != revision:
+        return {}
+    if kind == "publications":
+        return {"accepted": sheet_store.by_decision(s_id, STUD_RANGE, ACCEPTED)}
+    return {"sessions": sheet_store.sessions(s_id, STUD_RANGE)}
+
+
+def attachment(filename: str) -> dict:
+    return {"Content-Disposition": f'attachment; filename="{filename}"'}
+
+# Сжатие тела документа: уровень deflate 0-9 или "stored" (без сжатия); остальные части
+# пакета сжаты заранее и копируются как есть
+DOCX_LEVEL = os.environ.get("DOCX_LEVEL", str(docx_zip.DEFAULT_LEVEL))
+DOCX_LEVEL = None if DOCX_LEVEL == "stored" else int(DOCX_LEVEL)
+
+# Допуск рендерингов: RENDER_CONCURRENCY одновременно, ещё RENDER_QUEUE в очереди не дольше
+# RENDER_QUEUE_TIMEOUT секунд, остальным - 503 с Retry-After; одинаковые запросы ждут один рендеринг
+render_admission = AdmissionController(
+    limit=int(os.environ.get("RENDER_CONCURRENCY", str(max(2, os.cpu_count() or 1)))),
+    queue=int(os.environ.get("RENDER_QUEUE", "32")),
+    timeout=float(os.environ.get("RENDER_QUEUE_TIMEOUT", "30")),
+)
+
+@app.exception_handler(Overloaded)
+def overloaded_handler(request: Request, exc: Overloaded) -> JSONResponse:
+    logging.warning(f"Rejected {request.url.path}: {exc.reason}, retry after {exc.retry_after} s")
+    return JSONResponse({"detail": f"Server is busy: {exc.reason}"}, status_code=503,
+                        headers={"Retry-After": str(exc.retry_after)})
+
+# Тот же документ или лист дольше срока готовит другой воркер - тоже 503, а не 500
+@app.exception_handler(LockTimeout)
+def lock_timeout_handler(request: Request, exc: LockTimeout) -> JSONResponse:
+    logging.warning(f"Rejected {request.url.path}: {exc}")
+    return JSONResponse({"detail": "Server is busy: the same document is being prepared"}, status_code=503,
+                        headers={"Retry-After": str(render_admission.retry_after())})
+
+# Отмена загрузки и рендеринга, если клиент закрыл соединение или подготовка идёт дольше
+# RENDER_DEADLINE секунд (0 - без срока; отправка тела клиенту в срок не входит): 504,
+# при обрыве соединения - 499 в журнале
+RENDER_DEADLINE = float(os.environ.get("RENDER_DEADLINE", "120"))
+app.add_middleware(CancelOnDisconnect, deadline=RENDER_DEADLINE or None, prefixes=("/conferences", "/documents"))
+
+# Трассировка: span на запрос и на этапы загрузки и рендеринга, записывается доля TRACE_SAMPLE
+# запросов (или решение из заголовка traceparent) в TRACE_FILE строками OTLP/JSON; без TRACE_FILE -
+# выключено. Файл больше TRACE_MAX_MB переименовывается в TRACE_FILE.1 (TRACE_MAX_MB=0 - без ротации)
+TRACE_MAX_MB = float(os.environ.get("TRACE_MAX_MB", "64"))
+tracer.configure(os.environ.get("TRACE_FILE"), float(os.environ.get("TRACE_SAMPLE", "0.01")),
+                 service="conference-v4", max_bytes=int(TRACE_MAX_MB * 2 ** 20) or None)
+app.add_middleware(TracingMiddleware, prefixes=("/conferences", "/documents"))
+
+# Готовый документ из общего кэша; при промахе - рендеринг через допуск
+def admitted_render(key: str, create) -> bytes:
+    content = shared_cache.get(key)
+    if content is None:
+        content = render_admission.run(key, lambda: shared_cache.get_or_create(key, create, DOCUMENT_TTL))
+    return content
+
+# Потоковый ответ занимает место рендеринга, пока не будет отдан целиком
+def admitted_stream(chunks, media_type: str, filename: str) -> StreamingResponse:
+    return StreamingResponse(render_admission.stream(chunks), media_type=media_type, headers=attachment(filename))
+
+# Потоковая отдача .docx: zip пишется и отправляется по мере рендеринга заседаний
+def stream_docx_response(body, filename: str) -> StreamingResponse:
+    return admitted_stream(docx_stream.iter_docx(body, level=DOCX_LEVEL), DOCX_MEDIA_TYPE, filename)
+
+# Пул конвертеров в PDF создаётся при первом запросе PDF; первые запросы приходят из разных
+# потоков одновременно, и без блокировки каждый запустил бы свой пул процессов LibreOffice
+pdf_pool: Optional[PdfConverterPool] = None
+_pdf_pool_lock = threading.Lock()
+
+def get_pdf_pool() -> PdfConverterPool:
+    global pdf_pool
+    if pdf_pool is None:
+        with _pdf_pool_lock:
+            if pdf_pool is None:
+                pdf_pool = PdfConverterPool(size=int(os.environ.get("PDF_WORKERS", "2")))
+    return pdf_pool
+
+# Документ: генератор python-docx из main, тело по скомпилированному шаблону templates/<kind>.json, имя файла
+DOCUMENTS = {
+    "programme": (generate_conference_program, partial(doc_templates.iter_document, "programme"),
+                  "conference_programme"),
+    "report": (generate_conference_report, partial(doc_templates.iter_document, "report"), "conference_report"),
+    "publications": (generate_conference_list, partial(doc_templates.iter_document, "publications"),
+                     "conference_publications"),
+}
+
+# Проверка данных до рендеринга: все проблемы сразу, без 500 посреди документа
+def check_data(student_data, tech_data, kind: str, s_id: str = GOOGLE_SHEET_ID,
+               revision: Optional[str] = None) -> None:
+    with span("validate", kind=kind, rows=len(student_data)) as validate_span:
+        problems = validate_cached(student_data, tech_data, kind, revision)
+        validate_span.set(problems=len(problems))
+    if problems:
+        raise HTTPException(status_code=422, detail={
+            "message": "Conference data is invalid",
+            "spreadsheet": s_id,
+            "problems": [problem._asdict() for problem in problems],
+        })
+
+# Заседания рендерятся в RENDER_WORKERS процессах (1 - последовательно в потоке запроса)
+RENDER_WORKERS = int(os.environ.get("RENDER_WORKERS", "1"))
+
+Engine = Literal["docx", "stream", "chunked"]
+OutputFormat = Literal["docx", "pdf"]
+
+# Порядок участников внутри заседания и порядок заседаний (ordering); по умолчанию - из окружения,
+# в запросе - ?order=surname|group|sheet&session_order=datetime|number
+ParticipantOrder = Literal["sheet", "surname", "group"]
+SessionOrder = Literal["number", "datetime"]
+PARTICIPANT_ORDER = os.environ.get("PARTICIPANT_ORDER", "sheet")
+SESSION_ORDER = os.environ.get("SESSION_ORDER", "number")
+
+def ordered_data(student_data, tech_data, order: str, session_order: str, student_revision: str,
+                 tech_revision: str) -> Tuple[List[List[str]], List[List[str]], Optional[str]]:
+    """Строки в порядке вывода и ревизия для stored_selection (None, если порядок не как в листе)."""
+    if ordering.is_default(order, session_order):
+        return student_data, tech_data, student_revision
+    student_data, tech_data = ordering.order_data(student_data, tech_data, order, session_order,
+                                                  f"{student_revision}:{tech_revision}")
+    return student_data, tech_data, None
+
+def render_document(kind: str, engine: str, student_data, tech_data, revision: Optional[str] = None) -> bytes:
+    generate, iter_body, _ = DOCUMENTS[kind]
+    with span("render", kind=kind, engine=engine, rows=len(student_data), sessions=len(tech_data)) as render_span:
+        if engine == "docx":
+            try:
+                with output_store.temp_path(".docx") as file_path:
+                    generate(student_data, tech_data, file_path)
+                    with open(file_path, "rb") as f:
+                        content = f.read()
+            finally:
+                collect_documents()  # иначе деревья lxml мёртвых документов копятся в RSS
+        else:
+            content = docx_stream.render_docx(iter_body(student_data, tech_data, **stored_selection(kind, revision),
+                                                        workers=RENDER_WORKERS), DOCX_LEVEL)
+        render_span.set(bytes=len(content))
+    return content
+
+def convert_to_pdf(kind: str, content: bytes) -> bytes:
+    checkpoint("pdf")
+    with output_store.temp_path(f"-{kind}.docx") as file_path, output_store.temp_path(f"-{kind}.pdf") as pdf_path:
+        with open(file_path, "wb") as f:
+            f.write(content)
+        try:
+            get_pdf_pool().convert(file_path, pdf_path)
+            with open(pdf_path, "rb") as f:
+                return f.read()
+        except Exception as e:
+            logging.exception(f"Error converting {file_path} to PDF: {e}")
+            raise HTTPException(status_code=500, detail=f"Error converting document to PDF: {e}")
+
+# Оба движка дают одинаковый document.xml, но ключи у них раздельные
+def document_key(kind: str, engine: str, student_revision: str, tech_revision: str,
+                 order: str = "sheet", session_order: str = "number") -> str:
+    key = f"{kind}:{'docx' if engine == 'docx' else 'stream'}:{student_revision}:{tech_revision}"
+    return key if ordering.is_default(order, session_order) else f"{key}:{order}:{session_order}"
+
+def document_response(kind: str, engine: str, output: str, order: str = PARTICIPANT_ORDER,
+                      session_order: str = SESSION_ORDER) -> Response:
+    tech_data, tech_revision = load_cached(TECH_RANGE)
+    student_data, student_revision = load_cached(STUD_RANGE)
+    if (not tech_data) or (not student_data):
+        raise HTTPException(status_code=404, detail="Conference data not found")
+
+    check_data(student_data, tech_data, kind, revision=f"{student_revision}:{tech_revision}")
+    filename = DOCUMENTS[kind][2]
+    key = document_key(kind, engine, student_revision, tech_revision, order, session_order)
+    if engine == "chunked" and output == "docx":
+        content = shared_cache.get(f"docx:{key}")
+        if content is None:
+            student_data, tech_data, revision = ordered_data(student_data, tech_data, order, session_order,
+                                                             student_revision, tech_revision)
+            body = DOCUMENTS[kind][1](student_data, tech_data, **stored_selection(kind, revision),
+                                      workers=RENDER_WORKERS)
+            return stream_docx_response(body, f"{filename}.docx")
     else:
-        return full_name
-    
-
-def format_date(date_str):
-    months = {
-        '01': 'января', '02': 'февраля', '03': 'марта', '04': 'апреля',
-        '05': 'мая', '06': 'июня', '07': 'июля', '08': 'августа',
-        '09': 'сентября', '10': 'октября', '11': 'ноября', '12': 'декабря'
-    }
-    date = datetime.strptime(date_str, "%Y-%m-%d")
-    return f"{date.day} {months[date.strftime('%m')]} {date.year}г."
-
-def generate_conference_program(student_data, tech_data):
-    doc = docx.Document()
-    set_document_style(doc)
-
-    first_paragraph = doc.add_paragraph(
-        'Форма представления материалов для программы 78 МСНК ГУАП',
-        style='Normal'
-    )
-    first_paragraph.runs[0].bold = True
-    first_paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
-
-    # Секция кафедры
-    section_heading = doc.add_paragraph()
-    run1 = section_heading.add_run(f" {' ' * 4} Секция каф. ")
-    run1.bold = True
-    run1.italic = True
-    run2 = section_heading.add_run(f"{tech_data[0][0]}. {tech_data[0][1]}")
-    run2.bold = True
-    run2.italic = True
-
-    # Научный руководитель
-    doc.add_paragraph(
-        f" {' ' * 10} Научный руководитель секции - {tech_data[0][2]}",
-        style='Normal'
-    )
-
-    doc.add_paragraph(
-        f" {' ' * 10} {tech_data[0][3]}",
-        style='Normal'
-    )
-
-    # Зам. научного руководителя
-    doc.add_paragraph(
-        f" {' ' * 10} Зам. научного руководителя секции - {tech_data[0][6]}",
-        style='Normal'
-    )
-
-    doc.add_paragraph(
-        f" {' ' * 10} {tech_data[0][7]}",
-        style='Normal'
-    )
-    
-    max_value = max([int(row[15]) for row in student_data if row[15].isdigit()])
-    
-    for cur_num in range(1, max_value + 1):
-        
-        # Заседание
-        session_heading = doc.add_paragraph(f'Заседание {str(cur_num)}', style='Normal')
-        session_heading.runs[0].bold = True
-        
-        # Дата и время + адрес
-        session_info = doc.add_paragraph()
-        # Форматируем дату и текст до нужной длины 61 символ
-        formatted_text = f"{format_date(tech_data[cur_num - 1][11])}, {tech_data[cur_num - 1][12]}"
-        formatted_text = formatted_text.ljust(58)  # Дополняем пробелами до 61 символа
-
-        # Добавляем к строке адрес
-        session_info.add_run(f"{formatted_text}Санкт-Петербург, ул. Большая Морская, д. 67,")
-
-        room_info = doc.add_paragraph()
-        run = room_info.add_run(f"{' ' * 73} лит. А, ауд. {tech_data[cur_num - 1][13]}")
-
-        # Список участников с темами
-        participant_num = 1
-        for row in student_data:
-            if int(row[15]) == cur_num:
-                initials = convert_to_initials(row[7] + ' ' + row[8] + ' ' + row[9]) 
-                doc.add_paragraph(f'{participant_num}. {initials}', style='Normal')
-                doc.add_paragraph(f'{row[13]}', style='Normal')
-                participant_num += 1
-                
-    file_path = 'report/programme.docx'
-    doc.save(file_path)
-    return file_path
-
-def generate_conference_report(student_data, tech_data):
-    doc = docx.Document()
-    set_document_style(doc)
-
-    first_paragraph = doc.add_paragraph(
-        'Отчёт о конференции 78 МСНК ГУАП',
-        style='Normal'
-    )
-    first_paragraph.runs[0].bold = True
-    first_paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
-
-    # Секция кафедры
-    section_heading = doc.add_paragraph()
-    run1 = section_heading.add_run(f" {' ' * 4} Секция каф. ")
-    run1.bold = True
-    run1.italic = True
-    run2 = section_heading.add_run(f"{tech_data[0][0]}. {tech_data[0][1]}")
-    run2.bold = True
-    run2.italic = True
-
-    max_value = max([int(row[15]) for row in student_data if row[15].isdigit()])
-    
-    for cur_num in range(1, max_value + 1):
-        
-        session_heading = doc.add_paragraph(f'Заседание {str(cur_num)}', style='Normal')
-        session_heading.runs[0].bold = True
-        
-        session_info = doc.add_paragraph()
-        session_info.add_run(f"{format_date(tech_data[cur_num - 1][11])}, {tech_data[cur_num - 1][12]}{' ' * 35}Санкт-Петербург, ул. Большая Морская, д. 67,")
-
-        room_info = doc.add_paragraph()
-        run = room_info.add_run(f"{' ' * 73} лит. А, ауд. {tech_data[cur_num - 1][13]}")
-
-        doc.add_paragraph(
-            f"Научный руководитель секции - {tech_data[0][3]} {convert_to_initials(tech_data[0][2])}",
-            style='Normal'
-        )
-
-        doc.add_paragraph(
-            f"Список докладов",
-            style='Normal'
-        )
-
-        # Таблица для списка докладов
-        table = doc.add_table(rows=1, cols=4)
-        table.style = 'Table Grid'
-        
-        hdr_cells = table.rows[0].cells
-        hdr_cells[0].text = '№ п/п'
-        hdr_cells[1].text = 'ФИО докладчика, название доклада'
-        hdr_cells[2].text = 'Статус (магистр/студент)'
-        hdr_cells[3].text = 'Решение'
-
-        # Выравнивание текста в заголовке таблицы по центру
-        for cell in hdr_cells:
-            for paragraph in cell.paragraphs:
-                paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                paragraph.paragraph_format.first_line_indent = Cm(0)
-
-        # Заполнение таблицы
-        participant_num = 1
-        for row in student_data:
-            if int(row[15]) == cur_num:
-                initials = row[7] + " " + row[8] + " " + row[9]
-                status = f"{row[12]} Гр. № {row[11]}" if row[11] else row[12]
-                if len(row) > 16:
-                    if row[16] == "1":
-                        recommendation = "опубликовать доклад в сборнике МСНК"
-                    elif row[16] == "2":
-                        recommendation = ("опубликовать доклад в сборнике МСНК; "
-                                          "рекомендовать к участию в финале конкурса "
-                                          "на лучшую студенческую научную работу ГУАП")
-                    elif row[16] == "0":
-                        recommendation = "доклад плохо подготовлен"
-                else:
-                    recommendation = "нет данных"
-
-                row_cells = table.add_row().cells
-                row_cells[0].text = str(participant_num)
-                row_cells[1].text = f"{initials}\n{row[13]}" 
-                row_cells[2].text = status 
-                row_cells[3].text = recommendation  
-
-                for paragraph in row_cells[1].paragraphs + row_cells[2].paragraphs + row_cells[3].paragraphs:
-                    paragraph.alignment = WD_ALIGN_PARAGRAPH.LEFT
-                    paragraph.paragraph_format.first_line_indent = Cm(0)
-
-                participant_num += 1
-
-        doc.add_paragraph()
-
-    doc.add_paragraph("Подпись научного руководителя секции", style='Normal')
-
-    file_path = 'report/report.docx'
-    doc.save(file_path)
-    return file_path
-
-def generate_conference_list(student_data, tech_data):
-    doc = docx.Document()
-    set_document_style(doc)
-
-    first_paragraph = doc.add_paragraph(
-        'Список представляемых к публикации докладов',
-        style='Normal'
-    )
-    first_paragraph.runs[0].bold = True
-    first_paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
-
-    # Секция кафедры
-    doc.add_paragraph(f"Кафедра {tech_data[0][1]}")
-    doc.add_paragraph(tech_data[0][2])
-    doc.add_paragraph(f"e-mail: {tech_data[0][4]}")
-    doc.add_paragraph(f"тел.: {tech_data[0][5]}")
-
-    # Пополнение списка студентов
-    for row in student_data:
-        if len(row) > 16 and row[16] == "1" or row[16] == "2":
-            combined_paragraph = doc.add_paragraph()
-            
-            name_run = combined_paragraph.add_run(convert_to_initials(row[7] + " " + row[8] + " " + row[9]))
-            name_run.italic = True
-            
-            combined_paragraph.add_run(f"{row[13]}")
-
-    doc.add_paragraph("\n" * 2)
-    doc.add_paragraph(f"Руководитель УНИДС {' ' * 40}{convert_to_initials(tech_data[0][2])}")
-
-    file_path = 'report/publications.docx'
-    doc.save(file_path)
-    return file_path
+        def render() -> bytes:
+            rows, tech_rows, revision = ordered_data(student_data, tech_data, order, session_order,
+                                                     student_revision, tech_revision)
+            return render_document(kind, engine, rows, tech_rows, revision)
+
+        content = admitted_render(f"docx:{key}", render)
+
+    if output == "pdf":
+        content = admitted_render(f"pdf:{key}", lambda: convert_to_pdf(kind, content))
+        return Response(content, media_type="application/pdf", headers=attachment(f"{filename}.pdf"))
+    return Response(content, media_type=DOCX_MEDIA_TYPE, headers=attachment(f"{filename}.docx"))
 
 @app.get("/conferences/programme")
-def get_programme() -> FileResponse:
-    tech_data = load_google_sheet(GOOGLE_SHEET_ID, TECH_RANGE)
-    student_data = load_google_sheet(GOOGLE_SHEET_ID, STUD_RANGE)
-    if not tech_data or not student_data:
-        raise HTTPException(status_code=404, detail="Conference data not found")
+def get_programme(engine: Engine = "docx", format: OutputFormat = "docx", order: ParticipantOrder = PARTICIPANT_ORDER,
+                  session_order: SessionOrder = SESSION_ORDER) -> Response:
+    return document_response("programme", engine, format, order, session_order)
 
-    # Generate the program document
-    file_path = generate_conference_program(student_data, tech_data)
 
-    # Return the FileResponse with the generated file
-    return FileResponse(path=file_path, media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document", filename="conference_programme.docx")
+# Сводная программа: по секции на каждую таблицу sheet_id (листы в той же раскладке, что и основная)
+@app.get("/conferences/programme/combined")
+def get_combined_programme(sheet_id: List[str] = Query(...)) -> Response:
+    sections = []
+    for s_id in sheet_id:
+        tech_data = load_google_sheet(s_id, TECH_RANGE)
+        student_data = load_google_sheet(s_id, STUD_RANGE)
+        if (not tech_data) or (not student_data):
+            raise HTTPException(status_code=404, detail=f"Conference data not found: {s_id}")
+        check_data(student_data, tech_data, "programme", s_id)
+        sections.append((student_data, tech_data))
+    return stream_docx_response(docx_stream.iter_combined_program(sections), "conference_programme_combined.docx")
 
 
 # Endpoint for generating conference report document
 @app.get("/conferences/report")
-def get_report() -> FileResponse:
-    tech_data = load_google_sheet(GOOGLE_SHEET_ID, TECH_RANGE)
-    student_data = load_google_sheet(GOOGLE_SHEET_ID, STUD_RANGE)
-    if (not tech_data) or (not student_data):
-        raise HTTPException(status_code=404, detail="Conference data not found")
-
-    file_path = generate_conference_report(student_data, tech_data)
-    return FileResponse(file_path, media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document", filename="conference_report.docx")
+def get_report(engine: Engine = "docx", format: OutputFormat = "docx", order: ParticipantOrder = PARTICIPANT_ORDER,
+               session_order: SessionOrder = SESSION_ORDER) -> Response:
+    return document_response("report", engine, format, order, session_order)
 
 # Endpoint for generating conference publications list document
 @app.get("/conferences/publications")
-def get_publications() -> FileResponse:
-    tech_data = load_google_sheet(GOOGLE_SHEET_ID, TECH_RANGE)
-    student_data = load_google_sheet(GOOGLE_SHEET_ID, STUD_RANGE)
+def get_publications(engine: Engine = "docx", format: OutputFormat = "docx", order: ParticipantOrder = PARTICIPANT_ORDER,
+                     session_order: SessionOrder = SESSION_ORDER) -> Response:
+    return document_response("publications", engine, format, order, session_order)
+
+# Предпросмотр без рендеринга .docx: содержание документа в JSON или HTML из кэша листов.
+# ETag - по ревизиям листов: пока таблица не менялась, If-None-Match получает 304 без построения
+PreviewKind = Literal["programme", "report", "publications"]
+PreviewFormat = Literal["json", "html"]
+
+@app.get("/conferences/{kind}/preview")
+def get_preview(kind: PreviewKind, format: PreviewFormat = "json", order: ParticipantOrder = PARTICIPANT_ORDER,
+                session_order: SessionOrder = SESSION_ORDER, if_none_match: Optional[str] = Header(None)) -> Response:
+    tech_data, tech_revision = load_cached(TECH_RANGE)
+    student_data, student_revision = load_cached(STUD_RANGE)
+    if (not tech_data) or (not student_data):
+        raise HTTPException(status_code=404, detail="Conference data not found")
+
+    etag = preview.preview_etag(kind, f"{format}:{order}:{session_order}", student_revision, tech_revision)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}  # браузер каждый раз сверяет ETag
+    if preview.etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    check_data(student_data, tech_data, kind, revision=f"{student_revision}:{tech_revision}")
+    student_data, tech_data, _ = ordered_data(student_data, tech_data, order, session_order,
+                                              student_revision, tech_revision)
+    with span("preview", kind=kind, format=format) as preview_span:
+        content = preview.build_preview(kind, student_data, tech_data)
+        if format == "html":
+            body, media_type = preview.render_html(content).encode("utf-8"), "text/html; charset=utf-8"
+        else:
+            body, media_type = json.dumps(content, ensure_ascii=False).encode("utf-8"), "application/json"
+        preview_span.set(bytes=len(body))
+    return Response(body, media_type=media_type, headers=headers)
+
+# Поиск участников: префикс фамилии, фильтры по заседанию, статусу, группе и решению
+@app.get("/participants")
+def search_participants(
+    q: Optional[str] = None,
+    session: Optional[str] = None,
+    status: Optional[str] = None,
+    group: Optional[str] = None,
+    decision: Optional[str] = None,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500),
+) -> dict:
+    return participant_index().search(q, offset, limit, session=session, status=status, group=group, decision=decision)
+
+# Сертификаты и приглашения: по .docx на участника, все в одном ZIP, отдаваемом по мере рендеринга
+MergeKind = Literal["certificate", "invitation"]
+# MERGE_WORKERS процессов на запрос (1 - в потоке запроса); процессы - из одного общего пула
+# docx_stream на всё приложение размером max(RENDER_WORKERS, MERGE_WORKERS), а не свои на каждый запрос
+MERGE_WORKERS = int(os.environ.get("MERGE_WORKERS", "2"))
+docx_stream.configure_pool(max(RENDER_WORKERS, MERGE_WORKERS))
+MERGE_NAMES = {"certificate": "сертификат", "invitation": "приглашение"}
+
+@app.get("/conferences/mail-merge/{kind}")
+def get_mail_merge(kind: MergeKind, session: Optional[int] = Query(None, ge=1)) -> StreamingResponse:
+    tech_data, tech_revision = load_cached(TECH_RANGE)
+    student_data, student_revision = load_cached(STUD_RANGE)
+    if (not tech_data) or (not student_data):
+        raise HTTPException(status_code=404, detail="Conference data not found")
+    check_data(student_data, tech_data, "programme", revision=f"{student_revision}:{tech_revision}")
+    body = mail_merge.iter_merge_zip(student_data, tech_data, mail_merge.builtin_template(kind), MERGE_NAMES[kind],
+                                     session, MERGE_WORKERS, mail_merge.ALLOWED_DECISIONS.get(kind))
+    return admitted_stream(body, "application/zip", f"conference_{kind}s.zip")
+
+# Сборник материалов: тексты принятых докладов из SUBMISSIONS_DIR одним томом, по мере сборки
+SUBMISSIONS_DIR = os.environ.get("SUBMISSIONS_DIR", "submissions")
+
+@app.get("/conferences/proceedings")
+def get_proceedings() -> StreamingResponse:
+    if not os.path.isdir(SUBMISSIONS_DIR):
+        raise HTTPException(status_code=404, detail="Submissions directory not found")
+    tech_data, tech_revision = load_cached(TECH_RANGE)
+    student_data, student_revision = load_cached(STUD_RANGE)
+    if (not tech_data) or (not student_data):
+        raise HTTPException(status_code=404, detail="Conference data not found")
+    check_data(student_data, tech_data, "publications", revision=f"{student_revision}:{tech_revision}")
+    body = proceedings.iter_proceedings(student_data, tech_data, SUBMISSIONS_DIR, level=DOCX_LEVEL,
+                                        workers=RENDER_WORKERS)
+    return admitted_stream(body, DOCX_MEDIA_TYPE, "conference_proceedings.docx")
+
+# Любой документ из templates/ без отдельного кода на Python
+@app.get("/documents")
+def list_documents() -> List[str]:
+    return doc_templates.template_names()
+
+@app.get("/documents/{name}")
+def get_document(name: str) -> Response:
+    try:
+        plan = doc_templates.compile_template(name)
+    except doc_templates.TemplateError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    tech_data, tech_revision = load_cached(TECH_RANGE)
+    student_data, student_revision = load_cached(STUD_RANGE)
     if (not tech_data) or (not student_data):
         raise HTTPException(status_code=404, detail="Conference data not found")
+    if name in DOCUMENTS:
+        check_data(student_data, tech_data, name, revision=f"{student_revision}:{tech_revision}")
+
+    def render() -> bytes:
+        try:
+            return docx_stream.render_docx(plan.render(student_data, tech_data), DOCX_LEVEL)
+        except (IndexError, KeyError, ValueError) as e:
+            raise HTTPException(status_code=422, detail=f"Template {name} does not fit the conference data: {e!r}")
+
+    key = f"template:{name}:{os.path.getmtime(doc_templates.template_path(name))}:{student_revision}:{tech_revision}"
+    content = admitted_render(f"docx:{key}", render)
+    return Response(content, media_type=DOCX_MEDIA_TYPE, headers=attachment(f"{name}.docx"))
+
+# Распределение участников без номера заседания: план, предпросмотр программы и запись в таблицу
+# (для записи - fresh: листы из Sheets в обход общего кэша, запись идёт по позициям строк)
+def plan_assignment(capacity: Optional[int], fresh: bool = False) -> Tuple[List[List[str]], List[List[str]], Assignment]:
+    if fresh:
+        tech_data, student_data = load_synced(TECH_RANGE), load_synced(STUD_RANGE)
+    else:
+        tech_data, _ = load_cached(TECH_RANGE)
+        student_data, _ = load_cached(STUD_RANGE)
+    if (not tech_data) or (not student_data):
+        raise HTTPException(status_code=404, detail="Conference data not found")
+    return student_data, tech_data, assign_sessions(student_data, tech_data, capacity)
+
+def assignment_summary(assignment: Assignment) -> dict:
+    return {
+        "sessions": {num: {"participants": assignment.loads[num], "capacity": assignment.capacities[num]}
+                     for num in sorted(assignment.capacities)},
+        "assigned": [{"row": position + 2, "session": num} for position, num in sorted(assignment.sessions.items())],
+        "unplaced": [position + 2 for position in assignment.unplaced],
+    }
+
+@app.get("/conferences/assignment")
+def get_assignment(capacity: Optional[int] = Query(None, ge=1)) -> dict:
+    return assignment_summary(plan_assignment(capacity)[2])
+
+@app.get("/conferences/assignment/programme")
+def get_assignment_programme(capacity: Optional[int] = Query(None, ge=1)) -> StreamingResponse:
+    student_data, tech_data, assignment = plan_assignment(capacity)
+    student_data = apply_assignment(student_data, assignment)
+    check_data(student_data, tech_data, "programme")
+    return stream_docx_response(doc_templates.iter_document("programme", student_data, tech_data),
+                                "conference_programme_preview.docx")
+
+@app.post("/conferences/assignment")
+def post_assignment(capacity: Optional[int] = Query(None, ge=1)) -> dict:
+    student_data, _, assignment = plan_assignment(capacity, fresh=True)
+    try:
+        updated = write_assignment(GOOGLE_SHEET_ID, assignment, student_data)
+    except StaleAssignment as e:
+        shared_cache.delete(f"sheet:{GOOGLE_SHEET_ID}:{STUD_RANGE}")
+        raise HTTPException(status_code=409, detail=f"Sheet changed while writing session numbers, nothing written: "
+                                                    f"rows {[position + 2 for position in e.positions]}")
+    except Exception as e:
+        logging.exception(f"Error writing session numbers to Google Sheets: {e}")
+        raise HTTPException(status_code=500, detail=f"Error writing session numbers to Google Sheets: {e}")
+    # Следующий запрос перечитает лист с новыми номерами заседаний
+    shared_cache.delete(f"sheet:{GOOGLE_SHEET_ID}:{STUD_RANGE}")
+    return {"updated_cells": updated, **assignment_summary(assignment)}
+
+def warmup_step(name: str, func) -> None:
+    step = {"name": name, "status": "running", "seconds": None}
+    warmup_state["steps"].append(step)
+    start = time.perf_counter()
+    try:
+        detail = func()
+        step["status"] = "ok"
+        if detail is not None:
+            step["detail"] = detail
+    except Exception as e:
+        # Прогрев не обязателен: ошибка шага не мешает обслуживать запросы
+        logging.exception(f"Warmup step {name} failed: {e}")
+        step["status"] = "error"
+        step["detail"] = str(getattr(e, "detail", e))
+    step["seconds"] = round(time.perf_counter() - start, 3)
+    logging.info(f"Warmup {name}: {step['status']} in {step['seconds']:.3f} s")
+
+def warm_documents() -> List[str]:
+    tech_data, tech_revision = load_cached(TECH_RANGE)
+    student_data, student_revision = load_cached(STUD_RANGE)
+    rendered = []
+    for kind in DOCUMENTS:
+        if validate_cached(student_data, tech_data, kind, f"{student_revision}:{tech_revision}"):
+            continue
+        rows, tech_rows, revision = ordered_data(student_data, tech_data, PARTICIPANT_ORDER, SESSION_ORDER,
+                                                 student_revision, tech_revision)
+        shared_cache.get_or_create(
+            f"docx:{document_key(kind, 'stream', student_revision, tech_revision, PARTICIPANT_ORDER, SESSION_ORDER)}",
+            lambda: render_document(kind, "stream", rows, tech_rows, revision), DOCUMENT_TTL)
+        rendered.append(kind)
+    return rendered
+
+def warm_sheets_client() -> None:
+    sheets_service()
+
+def warm_templates() -> List[str]:
+    docx_stream._template()
+    names = doc_templates.template_names()
+    for name in names:
+        doc_templates.compile_template(name)
+    for kind in mail_merge.BUILTIN_TEMPLATES:
+        mail_merge.builtin_template(kind)
+    return names
+
+def warm_sheet_data() -> dict:
+    return {s_range: len(load_cached(s_range)[0]) for s_range in (TECH_RANGE, STUD_RANGE)}
+
+def warmup() -> None:
+    warmup_step("sheets_client", warm_sheets_client)
+    warmup_step("templates", warm_templates)
+    warmup_step("sheet_data", warm_sheet_data)
+    warmup_step("documents", warm_documents)
+    warmup_state["finished"] = time.time()
+    logging.info(f"Warmup finished in {warmup_state['finished'] - warmup_state['started']:.3f} s")
+
+def warmup_report() -> dict:
+    started, finished = warmup_state["started"], warmup_state["finished"]
+    return {
+        "seconds": round((finished or time.time()) - started, 3) if started else None,
+        "steps": warmup_state["steps"],
+    }
+
+# Проверки для балансировщика: процесс жив / готов принимать запросы
+@app.get("/health/live")
+def health_live() -> dict:
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+def health_ready() -> Response:
+    ready = warmup_state["finished"] is not None
+    content = {"status": "ready" if ready else "warming up", "warmup": warmup_report()}
+    return Response(json.dumps(content, ensure_ascii=False), status_code=200 if ready else 503,
+                    media_type="application/json")
+
+# Метрики процесса: очередь рендеринга, время ожидания в ней, отменённые запросы и экспорт трасс
+@app.get("/metrics")
+def get_metrics() -> dict:
+    return {"admission": render_admission.metrics(), "cancellation": cancellation.stats.metrics(),
+            "tracing": tracer.metrics(), "outputs": output_store.metrics()}
+
+# Диагностика памяти процесса - только с заголовком X-Admin-Token, равным ADMIN_TOKEN
+# (без ADMIN_TOKEN эндпоинтов /admin нет: 404)
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+
+def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if x_admin_token is None or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+MemoryGroup = Literal[GROUPS]
+
+def tracing_required(func, *args):
+    try:
+        return func(*args)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=f"{e}: POST /admin/memory/tracemalloc/start first")
+
+@app.get("/admin/memory", dependencies=[Depends(require_admin)])
+def get_memory() -> dict:
+    return diagnostics.status()
+
+@app.post("/admin/memory/tracemalloc/start", dependencies=[Depends(require_admin)])
+def start_tracemalloc(frames: int = Query(1, ge=1, le=50)) -> dict:
+    return diagnostics.start(frames)
+
+@app.post("/admin/memory/tracemalloc/stop", dependencies=[Depends(require_admin)])
+def stop_tracemalloc() -> dict:
+    return diagnostics.stop()
+
+@app.get("/admin/memory/top", dependencies=[Depends(require_admin)])
+def get_memory_top(limit: int = Query(20, ge=1, le=500), group: MemoryGroup = "lineno") -> List[dict]:
+    return tracing_required(diagnostics.top, limit, group)
+
+@app.post("/admin/memory/snapshots", dependencies=[Depends(require_admin)])
+def post_memory_snapshot(name: Optional[str] = None) -> dict:
+    return tracing_required(diagnostics.snapshot, name)
+
+@app.get("/admin/memory/diff", dependencies=[Depends(require_admin)])
+def get_memory_diff(before: str, after: Optional[str] = None, limit: int = Query(20, ge=1, le=500),
+                    group: MemoryGroup = "lineno") -> dict:
+    try:
+        return tracing_required(diagnostics.diff, before, after, limit, group)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"Snapshot not found: {e}")
+
+@app.post("/admin/memory/release", dependencies=[Depends(require_admin)])
+def post_memory_release() -> dict:
+    return release()
 
-    file_path = generate_conference_list(student_data, tech_data)
-    return FileResponse(file_path, media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document", filename="conference_publications.docx")
+@app.get("/admin/memory/objects", dependencies=[Depends(require_admin)])
+def get_memory_objects(collect: bool = True, limit: int = Query(30, ge=1, le=500)) -> dict:
+    return object_counts(collect, limit)
 
 if __name__ == "__main__":
     import uvicorn
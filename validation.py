@@ -0,0 +1,130 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, NamedTuple, Optional
+
+from sheet_data import column_letter, data_revision
+
+# Проверка данных до рендеринга: за один проход по строкам собираются все
+# проблемы, из-за которых генераторы упали бы посреди документа.
+# Результат кэшируется по ревизии данных.
+
+DOCUMENTS = ('programme', 'report', 'publications')
+DECISIONS = ('0', '1', '2')
+
+# Какие столбцы первой строки техлиста (Sheet2) читает каждый документ
+HEAD_COLUMNS = {
+    'programme': (0, 1, 2, 3, 6, 7),
+    'report': (0, 1, 2, 3),
+    'publications': (1, 2, 4, 5),
+}
+
+# Сколько столбцов строки участника нужно каждому документу (row[7..9], row[11..13], row[15])
+STUDENT_WIDTH = {
+    'programme': 16,
+    'report': 16,
+    'publications': 14,
+}
+
+STUDENT_SHEET = 'Sheet1'
+TECH_SHEET = 'Sheet2'
+FIRST_ROW = 2  # данные начинаются со второй строки (A2)
+
+
+class Problem(NamedTuple):
+    sheet: str
+    row: Optional[int]
+    column: Optional[str]
+    message: str
+
+
+def validate_data(student_data: List[List[str]], tech_data: List[List[str]], document: str) -> List[Problem]:
+    """Все проблемы данных для документа document ('programme', 'report', 'publications')."""
+    problems = []
+    width = STUDENT_WIDTH[document]
+    check_sessions = document != 'publications'
+    check_decision_code = document == 'report'
+    sessions = set()
+
+    for index, row in enumerate(student_data):
+        line = index + FIRST_ROW
+        size = len(row)
+        if size < width:
+            problems.append(Problem(STUDENT_SHEET, line, column_letter(size),
+                                    f"в строке {size} столбцов, нужно не меньше {width}"))
+            continue
+        if check_sessions:
+            session = row[15]
+            if not session.isdigit():
+                problems.append(Problem(STUDENT_SHEET, line, 'P', f"номер заседания не число: {session!r}"))
+            elif int(session) < 1:
+                # заседания нумеруются с 1; участник с 0 выпал бы из документа молча
+                problems.append(Problem(STUDENT_SHEET, line, 'P', f"номер заседания меньше 1: {session!r}"))
+            else:
+                sessions.add(int(session))
+        # пустой код - решения ещё нет (строка длиннее 16 столбцов из-за заметки в S)
+        if check_decision_code and size > 16 and row[16] and row[16] not in DECISIONS:
+            problems.append(Problem(STUDENT_SHEET, line, 'Q', f"неизвестный код решения: {row[16]!r}"))
+
+    if not tech_data:
+        problems.append(Problem(TECH_SHEET, None, None, "лист с данными секции пуст"))
+        return problems
+
+    head = tech_data[0]
+    missing = [column_letter(col) for col in HEAD_COLUMNS[document] if col >= len(head)]
+    if missing:
+        problems.append(Problem(TECH_SHEET, FIRST_ROW, missing[0],
+                                f"нет данных секции в столбцах {', '.join(missing)}"))
+
+    if check_sessions:
+        if not sessions and not problems:
+            problems.append(Problem(STUDENT_SHEET, None, 'P', "ни у одного участника нет номера заседания"))
+        for cur_num in range(1, max(sessions, default=0) + 1):
+            line = cur_num - 1 + FIRST_ROW
+            if cur_num > len(tech_data):
+                problems.append(Problem(TECH_SHEET, line, None,
+                                        f"заседаний {max(sessions)}, а строк с их данными {len(tech_data)}"))
+                break
+            tech_row = tech_data[cur_num - 1]
+            if len(tech_row) < 14:
+                problems.append(Problem(TECH_SHEET, line, column_letter(len(tech_row)),
+                                        f"нет даты, времени или аудитории заседания {cur_num}"))
+                continue
+            try:
+                datetime.strptime(tech_row[11], "%Y-%m-%d")
+            except ValueError:
+                problems.append(Problem(TECH_SHEET, line, 'L',
+                                        f"дата заседания {cur_num} не в формате ГГГГ-ММ-ДД: {tech_row[11]!r}"))
+    return problems
+
+
+_cache = OrderedDict()
+_lock = threading.Lock()  # кэш общий для потоков запросов FastAPI
+CACHE_SIZE = 32
+
+
+def validate_cached(student_data: List[List[str]], tech_data: List[List[str]], document: str,
+                    revision: Optional[str] = None) -> List[Problem]:
+    """validate_data с кэшем по ревизии данных (ревизия считается, если не передана)."""
+    key = (revision or data_revision(student_data, tech_data), document)
+    with _lock:
+        problems = _cache.get(key)
+        if problems is not None:
+            _cache.move_to_end(key)
+            return problems
+    problems = validate_data(student_data, tech_data, document)
+    with _lock:
+        _cache[key] = problems
+        if len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return problems
+
+
+def format_problems(problems: List[Problem]) -> str:
+    lines = []
+    for problem in problems:
+        place = problem.sheet
+        if problem.column or problem.row:
+            place += f"!{problem.column or ''}{problem.row or ''}"
+        lines.append(f"{place}: {problem.message}")
+    return '\n'.join(lines)
@@ -0,0 +1,191 @@
+import argparse
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from main import generate_conference_list, generate_conference_program, generate_conference_report
+from memdiag import collect_documents
+from output_store import OutputStore, default_path
+from sheet_data import data_revision
+from validation import format_problems, validate_data
+
+# Режим наблюдения для недели конференции: вместо повторных запусков main.py после каждой правки
+# таблица опрашивается по дешёвым метаданным (версия файла на Drive, у подделки - mtime файла),
+# серия правок пережидается (debounce), и перерисовываются только документы, у которых изменились
+# входные данные - те столбцы листов, которые документ действительно выводит.
+
+SCOPES = ['https://www.googleapis.com/auth/spreadsheets.readonly',
+          'https://www.googleapis.com/auth/drive.metadata.readonly']
+
+# Документ: генератор из main.py; столбцы листа участников, строки 0 тех. листа (секция)
+# и всех строк тех. листа (даты, время и аудитории заседаний), от которых он зависит
+DOCUMENTS = {
+    'programme': (generate_conference_program, (7, 8, 9, 13, 15), (0, 1, 2, 3, 6, 7), (11, 12, 13)),
+    'report': (generate_conference_report, (7, 8, 9, 11, 12, 13, 15, 16), (0, 1, 2, 3), (11, 12, 13)),
+    'publications': (generate_conference_list, (7, 8, 9, 13, 16), (1, 2, 4, 5), ()),
+}
+
+
+class GoogleSheets:
+    """Таблица в Google: версия - из метаданных Drive (без чтения значений), значения - из Sheets."""
+
+    def __init__(self, key_file: str = 'service.json'):
+        from googleapiclient.discovery import build
+        from google.oauth2.service_account import Credentials
+
+        creds = Credentials.from_service_account_file(key_file, scopes=SCOPES)
+        self.sheets = build('sheets', 'v4', credentials=creds).spreadsheets()
+        self.drive = build('drive', 'v3', credentials=creds).files()
+
+    def revision(self, s_id: str) -> str:
+        return self.drive.get(fileId=s_id, fields='version').execute()['version']
+
+    def values(self, s_id: str, s_range: str) -> List[List[str]]:
+        return self.sheets.values().get(spreadsheetId=s_id, range=s_range).execute().get('values', [])
+
+
+class FakeSheets:
+    """Локальная подделка таблицы: JSON-файл {"Sheet1!A2:S": [[...], ...], "Sheet2!A2:N": [...]};
+    версия - время изменения и размер файла, как у метаданных Drive - без чтения содержимого."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def revision(self, s_id: str) -> str:
+        stat = os.stat(self.path)
+        return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+    def values(self, s_id: str, s_range: str) -> List[List[str]]:
+        with open(self.path, encoding='utf-8') as f:
+            return json.load(f)[s_range]
+
+
+def write_fake_sheet(path: str, ranges: Dict[str, List[List[str]]]) -> None:
+    """Запись подделки целиком через временный файл - наблюдатель не увидит половину файла."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(ranges, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def _columns(rows: List[List[str]], columns: Sequence[int]) -> List[List[str]]:
+    return [[row[i] if i < len(row) else '' for i in columns] for row in rows]
+
+
+def inputs_revision(kind: str, student_data: List[List[str]], tech_data: List[List[str]]) -> str:
+    _, student_columns, head_columns, tech_columns = DOCUMENTS[kind]
+    return data_revision(_columns(student_data, student_columns), _columns(tech_data[:1], head_columns),
+                         _columns(tech_data, tech_columns))
+
+
+class Watcher:
+    def __init__(self, backend, s_id: str, ranges: Tuple[str, str], interval: float = 5.0, debounce: float = 3.0,
+                 export: Optional[Callable[[str], None]] = None, outputs: Optional[OutputStore] = None,
+                 max_backoff: float = 300.0):
+        self.backend = backend
+        self.s_id = s_id
+        self.student_range, self.tech_range = ranges
+        self.interval = interval
+        self.debounce = debounce  # столько секунд версия не должна меняться перед перерисовкой
+        self.export = export
+        self.max_backoff = max_backoff  # предел паузы между повторами после ошибок подряд
+        self.failures = 0  # ошибок опроса или цикла подряд
+        self.outputs = outputs or OutputStore('report/outputs')
+        self.revision = None  # версия таблицы, по которой документы уже составлены
+        self.inputs: Dict[str, str] = {}  # документ -> ревизия его входных данных
+        self.cycles = 0  # завершённые циклы
+        self.rendered: Dict[str, int] = {kind: 0 for kind in DOCUMENTS}
+
+    def cycle(self, revision: str) -> Dict[str, Optional[float]]:
+        """Загрузка и перерисовка изменившихся документов; документ -> секунды (None - не менялся)."""
+        start = time.perf_counter()
+        student_data = self.backend.values(self.s_id, self.student_range)
+        tech_data = self.backend.values(self.s_id, self.tech_range)
+        fetched = time.perf_counter()
+        timings = {}
+        for kind, (generate, _, _, _) in DOCUMENTS.items():
+            inputs = inputs_revision(kind, student_data, tech_data)
+            if self.inputs.get(kind) == inputs:
+                timings[kind] = None
+                continue
+            problems = validate_data(student_data, tech_data, kind)
+            if problems:
+                print(f"{kind}: документ не обновлён, исправьте данные в таблице:")
+                print(format_problems(problems))
+                timings[kind] = None
+                continue
+            rendered = time.perf_counter()
+            # версия - по ревизии входных данных документа, файл пункта меню заменяется атомарно
+            file_path = self.outputs.render(generate, student_data, tech_data, inputs, latest=default_path(generate))
+            collect_documents()
+            if self.export is not None:
+                self.export(file_path)
+            timings[kind] = time.perf_counter() - rendered
+            self.inputs[kind] = inputs
+            self.rendered[kind] += 1
+        self.revision = revision
+        self.cycles += 1
+        changed = [f"{kind} {seconds:.2f} с" for kind, seconds in timings.items() if seconds is not None]
+        print(f"[{time.strftime('%H:%M:%S')}] цикл {self.cycles}: загрузка {fetched - start:.2f} с, "
+              f"{', '.join(changed) if changed else 'документы не изменились'}; "
+              f"всего {time.perf_counter() - start:.2f} с")
+        return timings
+
+    def run(self, stop: Optional[threading.Event] = None) -> None:
+        """Опрос версии каждые interval секунд; первый цикл - сразу, следующие - когда версия
+        не менялась debounce секунд. stop - для остановки из другого потока.
+        Ошибка опроса или цикла (сеть, квота API, недописанный файл) не останавливает наблюдение:
+        self.revision не меняется, и та же правка повторяется после паузы, растущей вдвое до max_backoff."""
+        stop = stop or threading.Event()
+        pending, changed_at = None, None
+        while not stop.is_set():
+            try:
+                revision = self.backend.revision(self.s_id)
+                now = time.monotonic()
+                if self.revision is None:
+                    self.cycle(revision)  # первый цикл (или повтор неудавшегося первого)
+                elif revision == self.revision:
+                    pending = None  # правку откатили, пока пережидали серию
+                elif revision != pending:
+                    pending, changed_at = revision, now  # новая правка - отсчёт заново
+                elif now - changed_at >= self.debounce:
+                    self.cycle(revision)
+                    pending = None
+                self.failures = 0
+            except Exception as e:
+                self.failures += 1
+                delay = min(self.interval * 2 ** self.failures, self.max_backoff)
+                print(f"[{time.strftime('%H:%M:%S')}] ошибка ({self.failures} подряд): {e!r}; "
+                      f"повтор через {delay:g} с")
+                stop.wait(delay)
+                continue
+            stop.wait(min(self.interval, self.debounce) if pending else self.interval)
+
+
+def main(argv: Sequence[str], s_id: str, ranges: Tuple[str, str]) -> None:
+    parser = argparse.ArgumentParser(prog='main.py watch', description="Перерисовка документов при изменении таблицы")
+    parser.add_argument('--interval', type=float, default=5.0, help='период опроса версии таблицы, с')
+    parser.add_argument('--debounce', type=float, default=3.0, help='сколько секунд таблица должна не меняться')
+    parser.add_argument('--fake', help='JSON-файл с листами вместо Google Sheets')
+    parser.add_argument('--pdf', action='store_true', help='дополнительно сохранять документы в PDF')
+    args = parser.parse_args(argv)
+    backend = FakeSheets(args.fake) if args.fake else GoogleSheets()
+    pdf_pool = None
+    if args.pdf:
+        from pdf_export import PdfConverterPool
+        pdf_pool = PdfConverterPool(size=1)
+    export = (lambda file_path: print(f"PDF: {pdf_pool.convert(file_path)}")) if pdf_pool else None
+    print(f"Наблюдение за таблицей: опрос каждые {args.interval:g} с, пауза после правок {args.debounce:g} с "
+          f"(Ctrl+C - выход)")
+    outputs = OutputStore('report/outputs')
+    outputs.start()  # версии документов по ревизиям копятся при каждой правке - сборка в фоне
+    try:
+        Watcher(backend, s_id, ranges, args.interval, args.debounce, export, outputs).run()
+    except KeyboardInterrupt:
+        print("Завершение наблюдения")
+    finally:
+        outputs.stop()
+        if pdf_pool is not None:
+            pdf_pool.close()